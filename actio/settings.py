@@ -39,11 +39,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'api',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,9 +82,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a connection waits for another process's write lock
+            # before raising "database is locked".
+            'timeout': 20,
+        },
     }
 }
 
+# Pragmas run on every new SQLite connection (see api/sqlite.py). WAL lets
+# readers run alongside the writer; with it, synchronous=normal only risks
+# the last transactions on power loss, never corruption. Empty to disable.
+ACTIO_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,  # KiB
+    'temp_store': 'memory',
+    'mmap_size': 134217728,
+}
+
+# Funnel the class room write methods of a process through a single lock,
+# so its writers queue instead of failing with "database is locked".
+ACTIO_WRITE_LANE = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -105,10 +127,67 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+# Cache of the users behind API tokens, sparing the Token and User queries
+# of every authenticated request. Entries are dropped when the token is
+# deleted or the user saved; the TTL bounds how long other processes (with
+# the in-process LRUCache) may still accept them. BACKEND None disables it.
+ACTIO_TOKEN_CACHE = {
+    'BACKEND': 'api.cache.LRUCache',
+    'OPTIONS': {
+        'max_entries': 10000,
+        'ttl': 60,
+    },
+}
+
+# Response bodies smaller than this (in bytes) are sent uncompressed.
+ACTIO_COMPRESSION_MIN_SIZE = 1024
+
+# Broker fanning out class room events to the streaming endpoints
+# (see api/pubsub.py for the interface a replacement must provide).
+ACTIO_EVENT_BROKER = 'api.pubsub.InProcessBroker'
+
+# Cache holding rendered course and class room payloads, keyed by their
+# version counters. Use 'api.cache.DjangoCache' to go through CACHES
+# instead, or set BACKEND to None to disable it.
+ACTIO_READ_CACHE = {
+    'BACKEND': 'api.cache.LRUCache',
+    'OPTIONS': {
+        'max_entries': 1024,
+        'ttl': 300,
+    },
+}
+
+# Build course and class room payloads from .values() rows instead of the
+# nested DRF serializers (same output, see api/compact.py).
+ACTIO_COMPACT_SERIALIZERS = False
+
+# Time SQL, serialization and rendering of every request, reported in a
+# Server-Timing header and aggregated on api/metrics.
+ACTIO_INSTRUMENTATION = False
+
+# Replays of a class room's event log leave a checkpoint every this many
+# events (see api/replay.py). 0 disables checkpoints.
+ACTIO_CHECKPOINT_INTERVAL = 500
+
+# Queue join and leave events in memory and insert them in batches from a
+# background thread (see api/buffer.py). Class room snapshots are still
+# written synchronously; the event lists lag behind by up to max_delay.
+ACTIO_WRITE_BEHIND = {
+    'ENABLED': False,
+    'OPTIONS': {
+        'max_batch_size': 500,
+        'max_delay': 0.5,
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
@@ -0,0 +1,162 @@
+"""
+Per course activity (CourseActivity rows), hourly and daily.
+
+Every event write adds its events to the rows of their hour and day with a
+single UPDATE per course and hour. A class room counts as active in a
+period from its first event there: that is checked within the same UPDATE,
+against the events already in api_event. rebuild_course_activity recounts
+everything from the event log, archives included.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone
+
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, Q, Value, When
+from django.db.models.functions import Trunc
+
+from .archive import archived_rows
+from .constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from .models import ClassRoom, CourseActivity, Event
+
+PERIODS = {
+    CourseActivity.PERIOD_HOUR: timedelta(hours=1),
+    CourseActivity.PERIOD_DAY: timedelta(days=1),
+}
+
+COUNTERS = ('events', 'joins', 'leaves', 'phase_changes')
+
+
+def period_start(moment, period):
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if period == CourseActivity.PERIOD_DAY else moment
+
+
+def _counts(actions):
+    return {
+        'events': len(actions),
+        'joins': actions.count(EVENT_ACTION_JOIN),
+        'leaves': actions.count(EVENT_ACTION_LEAVE),
+        'phase_changes': actions.count(EVENT_ACTION_CHANGE_PHASE),
+    }
+
+
+def record_activity(events, course_ids=None):
+    """
+    Counts `events`, just written to api_event (with their ids), into their
+    courses' activity. `course_ids` maps their class rooms to their courses
+    and is read from the database when not given.
+    """
+    if not events:
+        return
+    if course_ids is None:
+        course_ids = dict(ClassRoom.objects.filter(pk__in={event.class_room_id for event in events})
+                          .values_list('id', 'course_id'))
+    by_hour = defaultdict(lambda: defaultdict(list))  # (course, hour) -> class room -> events
+    by_class_room = defaultdict(list)
+    for event in events:
+        hour = period_start(event.created_at, CourseActivity.PERIOD_HOUR)
+        by_hour[course_ids[event.class_room_id], hour][event.class_room_id].append(event)
+        by_class_room[event.class_room_id].append(event)
+
+    # A room is new to a period when none of its other events is there. Of
+    # this batch, only the events of the same and later hours are left out,
+    # so a room spanning two hours of a day is counted into the day once.
+    for (course_id, hour), class_rooms in sorted(by_hour.items(), key=lambda item: item[0][1]):
+        excluded = {class_room_id: [event.id for event in by_class_room[class_room_id]
+                                    if event.created_at >= hour]
+                    for class_room_id in class_rooms}
+        counts = _counts([event.action for room_events in class_rooms.values() for event in room_events])
+        _add_activity(course_id, hour, counts, excluded)
+
+
+def _new_rooms(excluded, start, period):
+    new_rooms = Value(0)
+    for class_room_id, event_ids in excluded.items():
+        seen = Event.objects.filter(class_room_id=class_room_id, created_at__gte=start,
+                                    created_at__lt=start + PERIODS[period]).exclude(id__in=event_ids)
+        new_rooms = new_rooms + Case(When(Exists(seen), then=Value(0)), default=Value(1),
+                                     output_field=IntegerField())
+    return new_rooms
+
+
+def _add_activity(course_id, hour, counts, excluded):
+    starts = {period: period_start(hour, period) for period in PERIODS}
+    rows = CourseActivity.objects.filter(
+        Q(period=CourseActivity.PERIOD_HOUR, start=starts[CourseActivity.PERIOD_HOUR])
+        | Q(period=CourseActivity.PERIOD_DAY, start=starts[CourseActivity.PERIOD_DAY]),
+        course_id=course_id)
+    updates = {field: F(field) + counts[field] for field in COUNTERS}
+    updates['active_rooms'] = F('active_rooms') + Case(
+        When(period=CourseActivity.PERIOD_HOUR,
+             then=_new_rooms(excluded, starts[CourseActivity.PERIOD_HOUR], CourseActivity.PERIOD_HOUR)),
+        default=_new_rooms(excluded, starts[CourseActivity.PERIOD_DAY], CourseActivity.PERIOD_DAY),
+        output_field=IntegerField())
+    updated = rows.update(**updates)
+    if updated == len(PERIODS):
+        return
+    # First events of the course in the hour, maybe in the day: create the
+    # rows (concurrent writes may just have) and count into them.
+    missing = [CourseActivity.PERIOD_HOUR] if updated else list(PERIODS)
+    CourseActivity.objects.bulk_create(
+        [CourseActivity(course_id=course_id, period=period, start=starts[period]) for period in missing],
+        ignore_conflicts=True)
+    rows.filter(period__in=missing).update(**updates)
+
+
+def course_activity(course_id, period=CourseActivity.PERIOD_HOUR, since=None, until=None):
+    """
+    The activity rows of a course for `period`, oldest first, optionally
+    starting within [since, until).
+    """
+    rows = CourseActivity.objects.filter(course_id=course_id, period=period)
+    if since is not None:
+        rows = rows.filter(start__gte=since)
+    if until is not None:
+        rows = rows.filter(start__lt=until)
+    return rows.order_by('start')
+
+
+def rebuild_course_activity(course_ids=None, batch_size=1000):
+    """
+    Recounts the activity of the courses (all of them by default) from
+    their events, replacing what was recorded. Returns the number of rows.
+    """
+    activity = CourseActivity.objects.all()
+    events = Event.objects.all()
+    class_rooms = ClassRoom.objects.filter(archived=True)
+    if course_ids is not None:
+        activity = activity.filter(course_id__in=course_ids)
+        events = events.filter(class_room__course_id__in=course_ids)
+        class_rooms = class_rooms.filter(course_id__in=course_ids)
+
+    rows = {}
+    for period in PERIODS:
+        counted = (events.annotate(start=Trunc('created_at', period, tzinfo=timezone.utc))
+                   .values('class_room__course_id', 'start').order_by()
+                   .annotate(events=Count('id'),
+                             joins=Count('id', filter=Q(action=EVENT_ACTION_JOIN)),
+                             leaves=Count('id', filter=Q(action=EVENT_ACTION_LEAVE)),
+                             phase_changes=Count('id', filter=Q(action=EVENT_ACTION_CHANGE_PHASE)),
+                             active_rooms=Count('class_room', distinct=True)))
+        for row in counted.iterator():
+            course_id, start = row.pop('class_room__course_id'), row.pop('start')
+            rows[course_id, period, start] = CourseActivity(course_id=course_id, period=period,
+                                                            start=start, **row)
+
+    # Archived rooms are whole and apart from api_event: each adds itself once per period.
+    for class_room_id, course_id in class_rooms.values_list('id', 'course_id').iterator():
+        actions = defaultdict(list)
+        for _, action, _, _, _, created_at in archived_rows(class_room_id):
+            for period in PERIODS:
+                actions[period, period_start(created_at, period)].append(action)
+        for (period, start), period_actions in actions.items():
+            row = rows.setdefault((course_id, period, start),
+                                  CourseActivity(course_id=course_id, period=period, start=start))
+            for field, count in _counts(period_actions).items():
+                setattr(row, field, getattr(row, field) + count)
+            row.active_rooms += 1
+
+    with transaction.atomic():
+        activity.delete()
+        CourseActivity.objects.bulk_create(rows.values(), batch_size=batch_size)
+    return len(rows)
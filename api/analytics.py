@@ -0,0 +1,254 @@
+"""
+Time spent per phase, attendance curves and timer totals over many class
+rooms at once.
+
+Events are read in bulk into typed columns, never into model instances.
+With NumPy installed every statistic is then computed with array
+operations; without it the same numbers come from a plain walk over the
+columns, one class room at a time.
+"""
+from array import array
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from .archive import EPOCH, archived_rows
+from .constants import EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from .models import ClassRoom, Event, Phase
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - depends on the environment
+    numpy = None
+
+ANALYTICS_FIELDS = ('class_room_id', 'created_at', 'action', 'user_id', 'to_phase_id', 'timer')
+
+NAIVE_EPOCH = EPOCH.replace(tzinfo=None)
+
+
+def epoch_seconds(value):
+    """
+    Seconds since EPOCH of a datetime, or of the text SQLite stores (UTC).
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value - (EPOCH if value.tzinfo is not None else NAIVE_EPOCH)).total_seconds()
+
+
+class EventColumns:
+    """
+    Events as one array per field, grouped by class room and in creation
+    order within each room. Missing users and phases are 0.
+    """
+
+    def __init__(self):
+        self.class_room = array('q')
+        self.seconds = array('d')  # since EPOCH
+        self.action = array('q')
+        self.user = array('q')
+        self.to_phase = array('q')
+        self.timer = array('q')
+
+    def __len__(self):
+        return len(self.class_room)
+
+    def extend(self, rows):
+        class_room, seconds, action = self.class_room.append, self.seconds.append, self.action.append
+        user, to_phase, timer = self.user.append, self.to_phase.append, self.timer.append
+        for class_room_id, created_at, action_id, user_id, to_phase_id, timer_value in rows:
+            class_room(class_room_id)
+            seconds(epoch_seconds(created_at))
+            action(action_id)
+            user(user_id or 0)
+            to_phase(to_phase_id or 0)
+            timer(timer_value)
+
+
+def event_columns(course_id=None, since=None, until=None, chunk_size=5000):
+    """
+    The columns of every event, archived ones included, optionally of one
+    course and within a [since, until) range of creation times.
+    """
+    columns = EventColumns()
+    events = Event.objects.order_by('class_room_id', 'created_at', 'id')
+    class_rooms = ClassRoom.objects.filter(archived=True).order_by('id')
+    if course_id is not None:
+        events = events.filter(class_room__course_id=course_id)
+        class_rooms = class_rooms.filter(course_id=course_id)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+        class_rooms = class_rooms.filter(archive__last_created_at__gte=since)
+    if until is not None:
+        events = events.filter(created_at__lt=until)
+        class_rooms = class_rooms.filter(archive__first_created_at__lt=until)
+    fields = ANALYTICS_FIELDS
+    if connections[events.db].vendor == 'sqlite':
+        # Read the stored text: parsing it back through Django's sqlite3
+        # converter costs more than all the statistics.
+        events = events.annotate(created_at_text=Cast('created_at', CharField()))
+        fields = tuple('created_at_text' if field == 'created_at' else field for field in fields)
+    columns.extend(events.values_list(*fields).iterator(chunk_size=chunk_size))
+    for class_room_id in class_rooms.values_list('id', flat=True).iterator():
+        rows = sorted(archived_rows(class_room_id), key=lambda row: (row[5], row[0]))
+        columns.extend((class_room_id, created_at, action, user_id, to_phase_id, timer)
+                       for _, action, user_id, to_phase_id, timer, created_at in rows
+                       if (since is None or created_at >= since) and (until is None or created_at < until))
+    return columns
+
+
+def summarize(columns, bucket, points):
+    """
+    The statistics of `columns`, walking them in Python:
+    - phases: {phase id: [visits, seconds, timer seconds]}, a visit lasting
+      from the phase change to the next one in the room, or to the room's
+      last event;
+    - attendance: [rooms, total attendance] `bucket` seconds apart from the
+      first event of each room, over the rooms still running at that point.
+    """
+    phases = defaultdict(lambda: [0, 0.0, 0])
+    attendance = [[0, 0] for _ in range(points)]
+    seconds, action, user = columns.seconds, columns.action, columns.user
+    to_phase = columns.to_phase
+    class_rooms = 0
+    for start, end in _room_ranges(columns.class_room):
+        class_rooms += 1
+        visit = None
+        for i in range(start, end):
+            if to_phase[i]:
+                if visit is not None:
+                    _add_visit(phases, columns, visit, i)
+                visit = i
+        if visit is not None:
+            _add_visit(phases, columns, visit, end - 1)
+
+        attending = set()
+        origin = seconds[start]
+        point = 0
+        for i in range(start, end):
+            while point < points and point * bucket < seconds[i] - origin:
+                attendance[point][0] += 1
+                attendance[point][1] += len(attending)
+                point += 1
+            if user[i] and action[i] == EVENT_ACTION_JOIN:
+                attending.add(user[i])
+            elif user[i] and action[i] == EVENT_ACTION_LEAVE:
+                attending.discard(user[i])
+        while point < points and point * bucket <= seconds[end - 1] - origin:
+            attendance[point][0] += 1
+            attendance[point][1] += len(attending)
+            point += 1
+    return {'class_rooms': class_rooms, 'events': len(columns), 'phases': dict(phases),
+            'attendance': attendance}
+
+
+def _room_ranges(class_room):
+    start = 0
+    for i in range(1, len(class_room) + 1):
+        if i == len(class_room) or class_room[i] != class_room[start]:
+            yield start, i
+            start = i
+
+
+def _add_visit(phases, columns, start, stop):
+    totals = phases[columns.to_phase[start]]
+    totals[0] += 1
+    totals[1] += columns.seconds[stop] - columns.seconds[start]
+    totals[2] += columns.timer[stop] - columns.timer[start]
+
+
+def summarize_vectorized(columns, bucket, points):
+    """
+    Same as summarize, with NumPy array operations over all rooms at once.
+    """
+    if not len(columns):
+        return summarize(columns, bucket, points)
+    class_room = numpy.frombuffer(columns.class_room, dtype=numpy.int64)
+    seconds = numpy.frombuffer(columns.seconds, dtype=numpy.float64)
+    action = numpy.frombuffer(columns.action, dtype=numpy.int64)
+    user = numpy.frombuffer(columns.user, dtype=numpy.int64)
+    to_phase = numpy.frombuffer(columns.to_phase, dtype=numpy.int64)
+    timer = numpy.frombuffer(columns.timer, dtype=numpy.int64)
+    count = len(class_room)
+
+    starts = numpy.flatnonzero(numpy.r_[True, class_room[1:] != class_room[:-1]])
+    lasts = numpy.r_[starts[1:], count] - 1
+    room = numpy.repeat(numpy.arange(len(starts)), numpy.diff(numpy.r_[starts, count]))
+
+    # A visit ends at the next phase change of its room, or at the room's last event.
+    changes = numpy.flatnonzero(to_phase)
+    following = numpy.r_[changes[1:], count]
+    last = lasts[room[changes]]
+    stops = numpy.where(following <= last, following, last)
+    phase_ids, visit_phases = numpy.unique(to_phase[changes], return_inverse=True)
+    visits = numpy.bincount(visit_phases, minlength=len(phase_ids))
+    spent = numpy.bincount(visit_phases, seconds[stops] - seconds[changes], len(phase_ids))
+    timed = numpy.bincount(visit_phases, timer[stops] - timer[changes], len(phase_ids))
+
+    # Attendance only moves on the first join and the first leave after it,
+    # so changes are found per (room, user), then summed up in event order.
+    moves = numpy.flatnonzero(((action == EVENT_ACTION_JOIN) | (action == EVENT_ACTION_LEAVE)) & (user != 0))
+    moves = moves[numpy.lexsort((moves, user[moves], room[moves]))]
+    joined = action[moves] == EVENT_ACTION_JOIN
+    was_joined = numpy.zeros(len(moves), dtype=bool)
+    was_joined[1:] = joined[:-1] & (room[moves][1:] == room[moves][:-1]) & (user[moves][1:] == user[moves][:-1])
+    delta = numpy.zeros(count, dtype=numpy.int64)
+    delta[moves] = joined.astype(numpy.int64) - was_joined
+    level = numpy.cumsum(delta)
+    level -= (level[starts] - delta[starts])[room]
+
+    # Each point reads the level after the last event at or before it:
+    # one search over (room, seconds since the room's first event) keys.
+    relative = seconds - seconds[starts][room]
+    durations = relative[lasts]
+    offsets = numpy.arange(points, dtype=numpy.float64) * bucket
+    running = offsets[numpy.newaxis, :] <= durations[:, numpy.newaxis]
+    span = numpy.floor(durations.max()) + bucket + 1
+    keys = room * span + relative
+    queries = (numpy.arange(len(starts))[:, numpy.newaxis] * span + offsets[numpy.newaxis, :])[running]
+    sampled = level[numpy.searchsorted(keys, queries, side='right') - 1]
+    point_rooms = running.sum(axis=0)
+    point_totals = numpy.bincount(numpy.nonzero(running)[1], sampled, points)
+
+    return {
+        'class_rooms': len(starts),
+        'events': count,
+        'phases': {int(phase_id): [int(visit_count), float(seconds_spent), int(timer_spent)]
+                   for phase_id, visit_count, seconds_spent, timer_spent
+                   in zip(phase_ids, visits, spent, timed)},
+        'attendance': [[int(rooms), int(total)] for rooms, total in zip(point_rooms, point_totals)],
+    }
+
+
+def course_analytics(course, since=None, until=None, bucket=60, points=60):
+    """
+    Phase durations, attendance curve and timer totals of the class rooms of
+    `course`, from the events created within [since, until).
+    """
+    columns = event_columns(course.pk, since, until)
+    stats = (summarize_vectorized if numpy is not None else summarize)(columns, bucket, points)
+    titles = dict(Phase.objects.filter(id__in=stats['phases']).values_list('id', 'title'))
+    attendance = stats['attendance']
+    while attendance and not attendance[-1][0]:
+        attendance.pop()
+    return {
+        'course': course.pk,
+        'class_rooms': stats['class_rooms'],
+        'events': stats['events'],
+        'timer_seconds': sum(timer_spent for _, _, timer_spent in stats['phases'].values()),
+        'phases': [{
+            'id': phase_id,
+            'title': titles.get(phase_id),
+            'visits': visits,
+            'seconds': round(seconds_spent, 3),
+            'mean_seconds': round(seconds_spent / visits, 3),
+            'timer_seconds': timer_spent,
+        } for phase_id, (visits, seconds_spent, timer_spent) in sorted(stats['phases'].items())],
+        'attendance': {
+            'bucket': bucket,
+            'class_rooms': [rooms for rooms, _ in attendance],
+            'mean': [round(total / rooms, 3) for rooms, total in attendance],
+        },
+    }
@@ -0,0 +1,236 @@
+"""
+Moves the events of idle class rooms out of api_event into compressed
+ClassRoomArchive rows, and back when the room sees activity again.
+
+Archived events are still served by every endpoint that lists events, in
+the same shape: they are decoded into unsaved Event instances with their
+phase and user attached. Rows whose phase or user has been deleted since
+are dropped, as the cascade would have done in api_event.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils.timezone import now
+
+from .models import ClassRoom, ClassRoomArchive, ClassRoomCheckpoint, Event, Phase
+from .sqlite import serialized_write
+
+# Same order as api.replay.EVENT_FIELDS, so archived rows replay as they are.
+ARCHIVE_FIELDS = ('id', 'action', 'user_id', 'to_phase_id', 'timer', 'created_at')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _deltas(values):
+    previous = 0
+    for value in values:
+        yield value - previous
+        previous = value
+
+
+def _cumulate(deltas):
+    total = 0
+    for delta in deltas:
+        total += delta
+        yield total
+
+
+def encode_rows(rows):
+    """
+    Packs ARCHIVE_FIELDS rows (in id order) column by column, ids and
+    timestamps as deltas, which zlib then squeezes well.
+    """
+    ids, actions, user_ids, to_phase_ids, timers, created_ats = zip(*rows)
+    microseconds = [(created_at - EPOCH) // timedelta(microseconds=1) for created_at in created_ats]
+    columns = [list(_deltas(ids)), actions, user_ids, to_phase_ids, timers, list(_deltas(microseconds))]
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode())
+
+
+def decode_rows(data):
+    ids, actions, user_ids, to_phase_ids, timers, microseconds = json.loads(zlib.decompress(data))
+    created_ats = (EPOCH + timedelta(microseconds=value) for value in _cumulate(microseconds))
+    return list(zip(_cumulate(ids), actions, user_ids, to_phase_ids, timers, created_ats))
+
+
+def archived_rows(class_room_id):
+    """
+    The archived ARCHIVE_FIELDS rows of the class room that still exist, by id.
+    """
+    archive = ClassRoomArchive.objects.filter(class_room_id=class_room_id).only('data').first()
+    if archive is None:
+        return []
+    rows = decode_rows(archive.data)
+    user_ids = set(User.objects.filter(id__in={row[2] for row in rows}).values_list('id', flat=True))
+    phase_ids = set(Phase.objects.filter(id__in={row[3] for row in rows}).values_list('id', flat=True))
+    return [row for row in rows
+            if (row[2] is None or row[2] in user_ids) and (row[3] is None or row[3] in phase_ids)]
+
+
+def archived_events(class_room_id):
+    """
+    The archived events of the class room as Event instances, by id, with
+    to_phase and user loaded like select_related would.
+    """
+    rows = archived_rows(class_room_id)
+    users = User.objects.in_bulk({row[2] for row in rows} - {None})
+    phases = Phase.objects.in_bulk({row[3] for row in rows} - {None})
+    events = []
+    for event_id, action, user_id, to_phase_id, timer, created_at in rows:
+        event = Event(id=event_id, action=action, class_room_id=class_room_id, user=users.get(user_id),
+                      to_phase=phases.get(to_phase_id), timer=timer, created_at=created_at)
+        event._state.adding = False
+        events.append(event)
+    return events
+
+
+def attach_archived_events(class_room):
+    """
+    Makes class_room.events.all() return the archived events, the way a
+    prefetch_related('events') would have.
+    """
+    events = Event.objects.filter(class_room=class_room)
+    events._result_cache = archived_events(class_room.pk)
+    events._prefetch_done = True
+    if not hasattr(class_room, '_prefetched_objects_cache'):
+        class_room._prefetched_objects_cache = {}
+    class_room._prefetched_objects_cache['events'] = events
+    return class_room
+
+
+class ArchivedEventList:
+    """
+    Just enough of the QuerySet API for CursorPagination to page through
+    archived events exactly like it pages through api_event: cursors stay
+    valid whether the room is archived or not.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def order_by(self, *fields):
+        events = list(self.events)
+        for field in reversed(fields):
+            events.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+        return ArchivedEventList(events)
+
+    def filter(self, *queries, **lookups):
+        query = Q(*queries, **lookups)
+        return ArchivedEventList([event for event in self.events if self._matches(event, query)])
+
+    def _matches(self, event, query):
+        results = []
+        for child in query.children:
+            if isinstance(child, Q):
+                results.append(self._matches(event, child))
+                continue
+            lookup, value = child
+            name, _, operator = lookup.partition('__')
+            actual = getattr(event, name)
+            if operator == 'isnull':
+                results.append((actual is None) == value)
+                continue
+            if actual is None:
+                results.append(False)
+                continue
+            value = Event._meta.get_field(name).to_python(value)
+            results.append({
+                '': actual == value, 'lt': actual < value, 'lte': actual <= value,
+                'gt': actual > value, 'gte': actual >= value,
+            }[operator])
+        matched = any(results) if query.connector == Q.OR else all(results)
+        return not matched if query.negated else matched
+
+    def __getitem__(self, index):
+        return self.events[index]
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+
+@serialized_write
+def archive_class_room(class_room, idle_for=None):
+    """
+    Moves the class room's events into an archive, leaving a checkpoint
+    of its final state so replays do not need to decode it. With
+    `idle_for`, rooms that saw an event since then are left alone. Returns
+    None when nothing was archived.
+    """
+    # Imported here because api.replay reads archives through this module.
+    from .replay import replay
+
+    with transaction.atomic():
+        # Holds the row lock writers take, so no event is recorded from here
+        # on, and re-reads what a caller loaded before queuing.
+        class_room._refresh_snapshot()
+        if class_room.archived:
+            return None
+        rows = list(class_room.events.order_by('id').values_list(*ARCHIVE_FIELDS))
+        if not rows:
+            return None
+        created_ats = [row[5] for row in rows]
+        if idle_for is not None and max(created_ats) >= now() - idle_for:
+            return None
+        state = replay(class_room.pk, archived=False)
+        ClassRoomCheckpoint.objects.bulk_create([state.checkpoint()], ignore_conflicts=True)
+        archive = ClassRoomArchive.objects.create(
+            class_room=class_room, event_count=len(rows), first_event_id=rows[0][0],
+            last_event_id=rows[-1][0], first_created_at=min(created_ats),
+            last_created_at=max(created_ats), data=encode_rows(rows))
+        reference_archived_rows(archive, rows)
+        deleted, _ = class_room.events.filter(id__lte=archive.last_event_id).delete()
+        if deleted != len(rows) or class_room.events.exists():
+            # An event written without the lock committed since the read:
+            # keep everything in api_event.
+            transaction.set_rollback(True)
+            return None
+        class_room.archived = True
+        class_room.save_versioned(('archived', 'version'))
+    return archive
+
+
+def reference_archived_rows(archive, rows):
+    """
+    Records the users and phases the archived rows point at.
+    """
+    users, phases = ClassRoomArchive.users.through, ClassRoomArchive.phases.through
+    users.objects.bulk_create([users(classroomarchive_id=archive.pk, user_id=user_id)
+                               for user_id in {row[2] for row in rows} - {None}])
+    phases.objects.bulk_create([phases(classroomarchive_id=archive.pk, phase_id=phase_id)
+                                for phase_id in {row[3] for row in rows} - {None}])
+
+
+@serialized_write
+def restore_class_room(class_room):
+    """
+    Moves archived events back into api_event, with their original ids.
+    """
+    with transaction.atomic():
+        class_room._refresh_snapshot()
+        if not class_room.archived:
+            return class_room
+        rows = archived_rows(class_room.pk)
+        Event.objects.bulk_create(
+            Event(id=event_id, action=action, class_room_id=class_room.pk, user_id=user_id,
+                  to_phase_id=to_phase_id, timer=timer, created_at=created_at)
+            for event_id, action, user_id, to_phase_id, timer, created_at in rows)
+        ClassRoomArchive.objects.filter(class_room=class_room).delete()
+        class_room.archived = False
+        class_room.save_versioned(('archived', 'version'))
+    return class_room
+
+
+def idle_class_rooms(idle_for):
+    """
+    Class rooms still in api_event whose last event is older than `idle_for`.
+    """
+    return (ClassRoom.objects.filter(archived=False)
+            .annotate(last_event_at=Max('events__created_at'))
+            .filter(last_event_at__lt=now() - idle_for))
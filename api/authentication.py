@@ -0,0 +1,50 @@
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import get_token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers the user and token of the keys it
+    has checked, so authenticated requests stop costing a Token and User
+    query each. Entries go when their token is deleted or their user saved
+    (see api/signals.py), or after the cache's TTL; updates that bypass
+    signals (queryset.update) and other processes' in-process caches only
+    catch up at the TTL.
+
+    Only field values are cached: every request gets its own User and Token
+    instances, so attributes set on request.user never leak into others.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+        values = cache.get(key)
+        if values is None:
+            # Raises for unknown keys and inactive users, which are never cached.
+            user, token = super().authenticate_credentials(key)
+            cache.set(key, (_field_values(user), _field_values(token)))
+            return user, token
+        model = self.get_model()
+        user = _from_field_values(model._meta.get_field('user').related_model, values[0])
+        token = _from_field_values(model, values[1])
+        token.user = user
+        return user, token
+
+
+def _field_values(instance):
+    return tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+def _from_field_values(model, values):
+    return model.from_db(router.db_for_read(model), [field.attname for field in model._meta.concrete_fields],
+                         values)
+
+
+def forget_tokens(keys):
+    cache = get_token_cache()
+    if cache is not None:
+        for key in keys:
+            cache.delete(key)
@@ -0,0 +1,176 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+
+from .sqlite import serialized_write
+
+logger = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    """
+    Write-behind queue for events: callers append unsaved events and a
+    background worker inserts them in batches, as soon as `max_batch_size`
+    are pending or `max_delay` seconds after the previous flush.
+    """
+
+    def __init__(self, max_batch_size=500, max_delay=0.5):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.flushes = 0
+        self.flushed_events = 0
+        self.last_flush_seconds = 0
+        self.max_flush_seconds = 0
+        self.total_flush_seconds = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stopping = False
+
+    def append(self, event):
+        with self._condition:
+            self._pending.append(event)
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            started_at = time.perf_counter()
+            written = len(batch)
+            try:
+                self._write(batch)
+            except IntegrityError:
+                written = self._write_each(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+            elapsed = time.perf_counter() - started_at
+            self.flushes += 1
+            self.flushed_events += written
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            return written
+
+    def _requeue(self, events):
+        # Ahead of what was appended meanwhile, so events keep their order.
+        with self._condition:
+            self._pending[:0] = events
+        self.failed_flushes += 1
+
+    def _write_each(self, batch):
+        # Events that break a constraint (their user or phase was deleted
+        # meanwhile) would fail every retry of the batch: drop those alone.
+        written = 0
+        for index, event in enumerate(batch):
+            try:
+                self._write([event])
+                written += 1
+            except IntegrityError:
+                self.dropped_events += 1
+                logger.warning('Dropped buffered event of class room %s', event.class_room_id, exc_info=True)
+            except Exception:
+                self._requeue(batch[index:])
+                raise
+        return written
+
+    @serialized_write
+    def _write(self, batch):
+        from .aggregates import record_activity
+        from .models import ClassRoom, Event, bulk_insert
+        from .pubsub import broadcast_events
+
+        with transaction.atomic():
+            events = bulk_insert(batch, Event.objects.select_related('to_phase', 'user'))
+            record_activity(events)
+            by_class_room = defaultdict(list)
+            for event in events:
+                by_class_room[event.class_room_id].append(event)
+            # The snapshots were saved with the original write, the event
+            # lists only change now: invalidate what was cached meanwhile.
+            ClassRoom.objects.filter(pk__in=by_class_room).update(version=models.F('version') + 1)
+            for class_room_id, class_room_events in by_class_room.items():
+                transaction.on_commit(partial(broadcast_events, class_room_id, class_room_events))
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='actio-event-buffer', daemon=True)
+            self._worker.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        if self._worker is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            self._worker.join()
+            self._worker = None
+        self.flush()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    if not self._stopping and len(self._pending) < self.max_batch_size:
+                        self._condition.wait(self.max_delay)
+                    stopping = self._stopping
+                try:
+                    self.flush()
+                except Exception:
+                    # The batch is back in the queue, retried after a pause.
+                    logger.exception('Could not write %d buffered events', self.depth)
+                    if not stopping:
+                        time.sleep(self.max_delay)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'flushes': self.flushes,
+            'flushed_events': self.flushed_events,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'mean_flush_seconds': self.total_flush_seconds / self.flushes if self.flushes else 0,
+            'failed_flushes': self.failed_flushes,
+            'dropped_events': self.dropped_events,
+        }
+
+
+_event_buffer = None
+_event_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    """
+    The running write-behind buffer, or None when ACTIO_WRITE_BEHIND is off.
+    """
+    global _event_buffer
+    config = getattr(settings, 'ACTIO_WRITE_BEHIND', None)
+    if not config or not config.get('ENABLED'):
+        return None
+    if _event_buffer is None:
+        with _event_buffer_lock:
+            if _event_buffer is None:
+                _event_buffer = EventBuffer(**config.get('OPTIONS', {}))
+                _event_buffer.start()
+    return _event_buffer
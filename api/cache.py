@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class CacheStats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache bounded both in entries and in age.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return self.stats.record(entry[1] if entry is not None else None)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Phase ids of courses by (course id, revision). Every change to a course's
+# phases bumps its revision, so entries are never invalidated, only outdated.
+phase_ids_cache = LRUCache(max_entries=4096, ttl=3600)
+
+
+class DjangoCache:
+    """
+    Stores entries in one of the CACHES configured for Django, so they can
+    be shared between processes.
+    """
+
+    def __init__(self, alias='default', ttl=300, key_prefix='actio'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.stats = CacheStats()
+
+    def _key(self, key):
+        return '{}:{}'.format(self.key_prefix, key)
+
+    def get(self, key):
+        return self.stats.record(self.cache.get(self._key(key)))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        self.cache.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _configured_cache(setting, default):
+    if setting not in _caches:
+        config = getattr(settings, setting, default)
+        if not config or not config.get('BACKEND'):
+            return None
+        with _caches_lock:
+            if setting not in _caches:
+                _caches[setting] = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _caches[setting]
+
+
+def get_read_cache():
+    """
+    Cache for rendered read responses, configured by ACTIO_READ_CACHE.
+    Returns None when the cache is disabled.
+    """
+    return _configured_cache('ACTIO_READ_CACHE', {'BACKEND': 'api.cache.LRUCache'})
+
+
+def get_token_cache():
+    """
+    Cache for authenticated tokens, configured by ACTIO_TOKEN_CACHE.
+    Returns None when the cache is disabled.
+    """
+    return _configured_cache('ACTIO_TOKEN_CACHE', {'BACKEND': 'api.cache.LRUCache'})
@@ -7,3 +7,8 @@ EVENT_ACTION_CHOICES = (
     (EVENT_ACTION_JOIN, 'Join'),
     (EVENT_ACTION_LEAVE, 'Leave')
 )
+EVENT_ACTION_NAMES = {
+    'change_phase': EVENT_ACTION_CHANGE_PHASE,
+    'join': EVENT_ACTION_JOIN,
+    'leave': EVENT_ACTION_LEAVE,
+}
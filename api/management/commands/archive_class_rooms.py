@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_class_room, idle_class_rooms, restore_class_room
+from api.models import ClassRoom
+
+
+class Command(BaseCommand):
+    help = 'Move the events of idle class rooms into compressed archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-days', type=float, default=30,
+                            help='Archive class rooms without events for this many days')
+        parser.add_argument('--restore', nargs='+', type=int, metavar='CLASS_ROOM_ID',
+                            help='Move these class rooms\' events back instead')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            count = 0
+            for class_room in ClassRoom.objects.filter(id__in=options['restore'], archived=True):
+                restore_class_room(class_room)
+                count += 1
+            self.stdout.write('Restored {} class room(s)'.format(count))
+            return
+
+        count = events = size = 0
+        idle_for = timedelta(days=options['idle_days'])
+        for class_room in idle_class_rooms(idle_for).iterator():
+            archive = archive_class_room(class_room, idle_for)
+            if archive is not None:
+                count += 1
+                events += archive.event_count
+                size += len(archive.data)
+        self.stdout.write('Archived {} class room(s), {} events in {} bytes'.format(count, events, size))
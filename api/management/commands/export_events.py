@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.export import EXPORT_FORMATS, export_lines, export_rows
+
+
+def datetime_argument(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = 'Stream events as NDJSON or CSV, optionally for one class room, course or time range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-room', type=int, help='Only events of this class room')
+        parser.add_argument('--course', type=int, help='Only events of class rooms of this course')
+        parser.add_argument('--since', type=datetime_argument, help='ISO datetime, inclusive')
+        parser.add_argument('--until', type=datetime_argument, help='ISO datetime, exclusive')
+        parser.add_argument('--as', dest='export_format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write to (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(options['chunk_size'], class_room_id=options['class_room'],
+                           course_id=options['course'], since=options['since'], until=options['until'])
+        lines = export_lines(rows, options['export_format'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line.decode(), ending='')
+            return
+        try:
+            with open(options['output'], 'wb') as output:
+                output.writelines(lines)
+        except OSError as error:
+            raise CommandError(error)
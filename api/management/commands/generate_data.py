@@ -0,0 +1,206 @@
+import random
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.aggregates import rebuild_course_activity
+from api.constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from api.models import ClassRoom, Course, Event, Phase, bulk_insert
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ClassRoomSimulation:
+    """
+    Plays the life of one class room the way the API would write it: a
+    kick-off into the default phase, a wave of joins, then phase changes,
+    joins and leaves at exponentially distributed intervals, until `until`
+    (no event is dated in the future). Event timers follow
+    ClassRoom._get_event_timer, so the final state is exactly what
+    rebuild_snapshot derives from the events.
+    """
+
+    def __init__(self, rng, phases, user_ids, started_at, until, attendees, mean_gap):
+        self.rng = rng
+        self.phases = phases  # (id, timer) pairs, the default phase first
+        self.user_ids = user_ids
+        self.moment = started_at
+        self.until = until
+        self.attendees = attendees
+        self.mean_gap = mean_gap
+        self.attending = {}  # ordered, so runs with the same seed match
+        self.current_phase = None
+        self.timer = 0
+        self.phase_started_at = None
+        self.version = 0
+
+    def event_timer(self):
+        if self.current_phase is None:
+            return 0
+        elif self.current_phase[1]:
+            return self.timer + (self.moment - self.phase_started_at).total_seconds()
+        return self.timer
+
+    def record(self, action, user_id, phase=None):
+        timer = self.event_timer()
+        if phase is not None:
+            self.current_phase = phase
+            self.timer = int(timer)
+            self.phase_started_at = self.moment
+        elif action == EVENT_ACTION_JOIN:
+            self.attending[user_id] = None
+        else:
+            self.attending.pop(user_id, None)
+        self.version += 1
+        return (action, user_id, phase[0] if phase else None, self.moment, int(timer))
+
+    def wait(self, mean_gap):
+        """
+        Moves to the next event, returning False once it falls after `until`.
+        """
+        self.moment += timedelta(seconds=self.rng.expovariate(1 / mean_gap))
+        return self.moment <= self.until
+
+    def events(self, count):
+        rng = self.rng
+        teacher = rng.choice(self.user_ids)
+        yield self.record(EVENT_ACTION_CHANGE_PHASE, teacher, self.phases[0])
+        yield self.record(EVENT_ACTION_JOIN, teacher)
+        count -= 2
+        # Students trickle in during the first minutes.
+        for user_id in rng.sample(self.user_ids, min(self.attendees, len(self.user_ids), max(count, 0))):
+            if not self.wait(self.mean_gap / 4):
+                return
+            yield self.record(EVENT_ACTION_JOIN, user_id)
+            count -= 1
+        for _ in range(count):
+            if not self.wait(self.mean_gap):
+                return
+            roll = rng.random()
+            if roll < 0.2 and len(self.phases) > 1:
+                yield self.record(EVENT_ACTION_CHANGE_PHASE, teacher, rng.choice(self.phases))
+            elif roll < 0.6 and self.attending:
+                yield self.record(EVENT_ACTION_LEAVE, rng.choice(list(self.attending)))
+            else:
+                yield self.record(EVENT_ACTION_JOIN, rng.choice(self.user_ids))
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic users, courses, class rooms and events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--phases-per-course', type=int, default=8)
+        parser.add_argument('--rooms-per-course', type=float, default=10,
+                            help='Mean, exponentially distributed')
+        parser.add_argument('--events-per-room', type=float, default=200,
+                            help='Mean, exponentially distributed')
+        parser.add_argument('--attendees-per-room', type=int, default=30,
+                            help='Maximum of the triangular distribution of attendees')
+        parser.add_argument('--mean-gap', type=float, default=20,
+                            help='Mean number of seconds between two events of a room')
+        parser.add_argument('--days', type=float, default=30,
+                            help='Class rooms start over this many days before --until')
+        parser.add_argument('--until', type=datetime.fromisoformat, default=None,
+                            help='ISO date the data ends at (default: now); fix it for identical runs')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        until = options['until'] or datetime.now(timezone.utc)
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        self.since = until - timedelta(days=options['days'])
+        self.until = until
+        self.options = options
+
+        user_ids = self.create_users(options['users'])
+        if not user_ids:
+            self.stderr.write('Need at least one user')
+            return
+        counts = {'courses': 0, 'class rooms': 0, 'events': 0}
+        for courses in chunked(range(options['courses']), max(1, self.chunk_size // 10)):
+            with transaction.atomic():
+                for key, value in self.create_courses(courses, user_ids).items():
+                    counts[key] += value
+        self.stdout.write('Created {} users, {courses} courses, {class rooms} class rooms, '
+                          '{events} events'.format(len(user_ids), **counts))
+
+    def create_users(self, count):
+        password = make_password(None)
+        first = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        last_id = first - 1
+        for numbers in chunked(range(first, first + count), self.chunk_size):
+            User.objects.bulk_create(
+                User(username='user{}'.format(number), email='user{}@example.com'.format(number),
+                     password=password, date_joined=self.since)
+                for number in numbers)
+        return array('q', User.objects.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', flat=True).iterator(chunk_size=self.chunk_size))
+
+    def create_courses(self, numbers, user_ids):
+        rng, options = self.rng, self.options
+        count, per_course = len(numbers), options['phases_per_course']
+        phases = bulk_insert([Phase(title='Phase {}'.format(i + 1), timer=rng.random() < 0.5)
+                              for _ in range(count) for i in range(per_course)])
+        phases_by_course = [phases[i * per_course:(i + 1) * per_course] for i in range(count)]
+        courses = bulk_insert([Course(title='Course {}'.format(number + 1),
+                                      default_phase=course_phases[0] if course_phases else None)
+                               for number, course_phases in zip(numbers, phases_by_course)])
+        Course.phases.through.objects.bulk_create(
+            [Course.phases.through(course_id=course.id, phase_id=phase.id)
+             for course, course_phases in zip(courses, phases_by_course) for phase in course_phases],
+            batch_size=self.chunk_size)
+
+        class_rooms, simulations = [], []
+        for course, course_phases in zip(courses, phases_by_course):
+            if not course_phases:
+                continue
+            for _ in range(round(rng.expovariate(1 / options['rooms_per_course']))):
+                started_at = self.since + timedelta(seconds=rng.uniform(0, options['days'] * 86400))
+                simulations.append(ClassRoomSimulation(
+                    rng, [(phase.id, phase.timer) for phase in course_phases], user_ids, started_at,
+                    self.until, round(rng.triangular(1, options['attendees_per_room'])), options['mean_gap']))
+                class_rooms.append(ClassRoom(course=course))
+        class_rooms = bulk_insert(class_rooms)
+
+        events = 0
+        attending = []
+        for batch in chunked(self.events(class_rooms, simulations), self.chunk_size):
+            Event.objects.bulk_create(batch)
+            events += len(batch)
+        for class_room, simulation in zip(class_rooms, simulations):
+            class_room.current_phase_id = simulation.current_phase[0]
+            class_room.timer = simulation.timer
+            class_room.phase_started_at = simulation.phase_started_at
+            class_room.attendance_count = len(simulation.attending)
+            class_room.version = simulation.version
+            attending.extend(ClassRoom.attending.through(classroom_id=class_room.id, user_id=user_id)
+                             for user_id in simulation.attending)
+        ClassRoom.objects.bulk_update(class_rooms, ClassRoom.SNAPSHOT_FIELDS, batch_size=self.chunk_size)
+        ClassRoom.attending.through.objects.bulk_create(attending, batch_size=self.chunk_size)
+        # Events were inserted behind the write path's back: count them here.
+        rebuild_course_activity([course.id for course in courses], batch_size=self.chunk_size)
+        return {'courses': len(courses), 'class rooms': len(class_rooms), 'events': events}
+
+    def events(self, class_rooms, simulations):
+        for class_room, simulation in zip(class_rooms, simulations):
+            count = max(2, round(self.rng.expovariate(1 / self.options['events_per_room'])))
+            for action, user_id, to_phase_id, created_at, timer in simulation.events(count):
+                yield Event(action=action, class_room_id=class_room.id, user_id=user_id,
+                            to_phase_id=to_phase_id, created_at=created_at, timer=timer)
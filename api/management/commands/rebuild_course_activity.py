@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.aggregates import rebuild_course_activity
+
+
+class Command(BaseCommand):
+    help = 'Recount the hourly and daily activity of courses from their event log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int,
+                            help='Only rebuild these courses (default: all)')
+
+    def handle(self, *args, **options):
+        count = rebuild_course_activity(options['course_ids'] or None)
+        self.stdout.write('Rebuilt {} course activity row(s)'.format(count))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ClassRoom
+from api.replay import replay
+
+
+def snapshot_drifted(class_room):
+    state = replay(class_room.pk, archived=class_room.archived)
+    attending = set(class_room.attending.values_list('id', flat=True))
+    return ((class_room.current_phase_id, class_room.timer, class_room.phase_started_at)
+            != (state.current_phase_id, state.timer, state.phase_started_at)
+            or class_room.attendance_count != len(attending) or set(state.attending) != attending)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the live-state snapshot of class rooms from their event log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_room_ids', nargs='*', type=int,
+                            help='Only rebuild these class rooms (default: all)')
+        parser.add_argument('--check', action='store_true',
+                            help='Only list the class rooms whose snapshot or attendees '
+                                 'disagree with a replay of their events')
+
+    def handle(self, *args, **options):
+        class_rooms = ClassRoom.objects.order_by('id')
+        if options['class_room_ids']:
+            class_rooms = class_rooms.filter(id__in=options['class_room_ids'])
+
+        count = 0
+        for class_room in class_rooms.iterator():
+            if options['check']:
+                if snapshot_drifted(class_room):
+                    self.stdout.write('Class room {} drifted from its events'.format(class_room.pk))
+                    count += 1
+                continue
+            class_room.rebuild_snapshot()
+            count += 1
+        if options['check']:
+            self.stdout.write('{} class room(s) drifted'.format(count))
+        else:
+            self.stdout.write('Rebuilt {} class room snapshot(s)'.format(count))
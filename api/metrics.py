@@ -0,0 +1,104 @@
+import bisect
+import threading
+import time
+
+# Upper bounds of the histogram buckets: milliseconds for timings, plain
+# counts for queries.
+TIMING_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+TIMINGS = ('total', 'db', 'serialize', 'render')
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        # Cumulative, like Prometheus' `le` buckets.
+        buckets, total = {}, 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {'count': self.count, 'sum': round(self.sum, 3), 'buckets': buckets}
+
+
+class RequestTimings:
+    """
+    What one request spent, in seconds. Filled in by InstrumentationMiddleware.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db = 0
+        self.serialize = 0
+        self.render = 0
+        self.total = 0
+
+    def time_query(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started_at
+            self.queries += 1
+
+    def server_timing(self):
+        return ', '.join([
+            'db;dur={:.2f};desc="{} queries"'.format(self.db * 1000, self.queries),
+            'serialize;dur={:.2f}'.format(self.serialize * 1000),
+            'render;dur={:.2f}'.format(self.render * 1000),
+            'total;dur={:.2f}'.format(self.total * 1000),
+        ])
+
+
+class MetricsRegistry:
+    """
+    Request metrics aggregated per URL name, safe to share between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, timings):
+        with self._lock:
+            view = self._views.get(view_name)
+            if view is None:
+                view = self._views[view_name] = {'requests': 0, 'queries': Histogram(QUERY_BUCKETS)}
+                view.update((name, Histogram(TIMING_BUCKETS)) for name in TIMINGS)
+            view['requests'] += 1
+            view['queries'].observe(timings.queries)
+            for name in TIMINGS:
+                view[name].observe(getattr(timings, name) * 1000)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                view_name: {
+                    name: value.as_dict() if isinstance(value, Histogram) else value
+                    for name, value in view.items()
+                }
+                for view_name, view in self._views.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    return _metrics
@@ -0,0 +1,167 @@
+import re
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from .metrics import RequestTimings, get_metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+# Timings of the request being handled. Context variables follow the
+# request into the threads sync_to_async runs its queries on.
+request_timings = ContextVar('request_timings', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timings = request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.time_query(execute, sql, params, many, context)
+
+
+def instrument_connection(sender=None, connection=connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least ACTIO_COMPRESSION_MIN_SIZE bytes,
+    with brotli when the client accepts it and the module is installed,
+    with gzip otherwise. Smaller bodies are not worth the CPU.
+
+    Async-capable, so under ASGI long polls do not hold the thread that
+    runs synchronous code while they wait.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'ACTIO_COMPRESSION_MIN_SIZE', 1024)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < self.min_size):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding, content = 'br', brotli.compress(response.content)
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding, content = 'gzip', compress_string(response.content)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The bytes changed, so a strong ETag would now be a lie.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class InstrumentationMiddleware:
+    """
+    Times every request when ACTIO_INSTRUMENTATION is on: SQL (count and
+    duration), the view's own work outside SQL (mostly serialization), and
+    rendering. Reported in a Server-Timing header and aggregated per URL
+    name for the metrics endpoint. Removed from the stack when off.
+    Async-capable, like CompressionMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'ACTIO_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.metrics = get_metrics()
+        connection_created.connect(instrument_connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self.finish(request, response)
+
+    def start(self, request):
+        request.timings = RequestTimings()
+        return request_timings.set(request.timings)
+
+    def finish(self, request, response):
+        timings = request.timings
+        finished_at = time.perf_counter()
+        if not hasattr(request, 'view_finished_at'):
+            # Not a template response: the view returned its bytes directly.
+            self.finish_view(request, finished_at)
+        timings.total = finished_at - timings.started_at
+
+        response['Server-Timing'] = timings.server_timing()
+        match = request.resolver_match
+        self.metrics.record(match.view_name if match else '<unresolved>', timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Runs on the thread of synchronous views (under ASGI too), whose
+        # connection may predate the connection_created receiver.
+        instrument_connection()
+        request.view_started_at = time.perf_counter()
+        request.view_started_db = request.timings.db
+
+    def process_template_response(self, request, response):
+        self.finish_view(request, time.perf_counter())
+
+        def record_render(response):
+            request.timings.render = time.perf_counter() - request.view_finished_at
+
+        response.add_post_render_callback(record_render)
+        return response
+
+    def finish_view(self, request, finished_at):
+        request.view_finished_at = finished_at
+        if hasattr(request, 'view_started_at'):
+            view_db = request.timings.db - request.view_started_db
+            request.timings.serialize = finished_at - request.view_started_at - view_db
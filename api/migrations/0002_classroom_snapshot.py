@@ -0,0 +1,57 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def rebuild_snapshots(apps, schema_editor):
+    """
+    Derives the snapshot of existing class rooms from their events, like
+    ClassRoom.rebuild_snapshot: the last phase change gives the phase, its
+    timer and start, the attending users the attendance count.
+    """
+    ClassRoom = apps.get_model('api', 'ClassRoom')
+    Event = apps.get_model('api', 'Event')
+    last_phase_change = (Event.objects.filter(class_room=OuterRef('pk'), to_phase__isnull=False)
+                         .order_by('-created_at', '-id'))
+    attendance = (ClassRoom.attending.through.objects.filter(classroom=OuterRef('pk'))
+                  .values('classroom').annotate(count=Count('*')).values('count'))
+    ClassRoom.objects.update(
+        current_phase=Subquery(last_phase_change.values('to_phase')[:1]),
+        timer=Coalesce(Subquery(last_phase_change.values('timer')[:1]), 0),
+        phase_started_at=Subquery(last_phase_change.values('created_at')[:1]),
+        attendance_count=Coalesce(Subquery(attendance), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='attendance_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='classroom',
+            name='current_phase',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.phase'),
+        ),
+        migrations.AddField(
+            model_name='classroom',
+            name='phase_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='classroom',
+            name='timer',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_classroom_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_read_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_event_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['class_room', 'created_at', 'id'], name='api_event_room_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(to_phase__isnull=False), fields=['class_room', 'created_at', 'id'], name='api_event_room_phase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['class_room', 'id'], name='api_event_room_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='class_room',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='api.classroom'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_event_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassRoomCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('timer', models.IntegerField(default=0)),
+                ('phase_started_at', models.DateTimeField(null=True)),
+                ('attending', models.JSONField(default=list)),
+                ('class_room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='api.classroom')),
+                ('current_phase', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.phase')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='classroomcheckpoint',
+            index=models.Index(fields=['class_room', 'created_at', 'event_id'], name='api_checkpoint_room_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='classroomcheckpoint',
+            constraint=models.UniqueConstraint(fields=('class_room', 'event_id'), name='api_checkpoint_unique_event'),
+        ),
+    ]
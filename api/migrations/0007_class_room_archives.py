@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_class_room_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ClassRoomArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_count', models.PositiveIntegerField()),
+                ('first_event_id', models.PositiveIntegerField()),
+                ('last_event_id', models.PositiveIntegerField()),
+                ('first_created_at', models.DateTimeField()),
+                ('last_created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data', models.BinaryField()),
+                ('class_room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='api.classroom')),
+            ],
+        ),
+    ]
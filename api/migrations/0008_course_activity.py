@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_class_room_archives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('joins', models.PositiveIntegerField(default=0)),
+                ('leaves', models.PositiveIntegerField(default=0)),
+                ('phase_changes', models.PositiveIntegerField(default=0)),
+                ('active_rooms', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='api.course')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='courseactivity',
+            constraint=models.UniqueConstraint(fields=('course', 'period', 'start'), name='api_activity_unique_start'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.archive import decode_rows
+
+
+def reference_archived_events(apps, schema_editor):
+    """
+    Records the users and phases the events of existing archives point at.
+    """
+    ClassRoomArchive = apps.get_model('api', 'ClassRoomArchive')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Phase = apps.get_model('api', 'Phase')
+    users, phases = ClassRoomArchive.users.through, ClassRoomArchive.phases.through
+    for archive in ClassRoomArchive.objects.only('data').iterator():
+        rows = decode_rows(archive.data)
+        user_ids = User.objects.filter(id__in={row[2] for row in rows}).values_list('id', flat=True)
+        phase_ids = Phase.objects.filter(id__in={row[3] for row in rows}).values_list('id', flat=True)
+        users.objects.bulk_create([users(classroomarchive_id=archive.pk, user_id=user_id)
+                                   for user_id in user_ids])
+        phases.objects.bulk_create([phases(classroomarchive_id=archive.pk, phase_id=phase_id)
+                                    for phase_id in phase_ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0008_course_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroomarchive',
+            name='phases',
+            field=models.ManyToManyField(blank=True, related_name='_classroomarchive_phases_+', to='api.Phase'),
+        ),
+        migrations.AddField(
+            model_name='classroomarchive',
+            name='users',
+            field=models.ManyToManyField(blank=True, related_name='_classroomarchive_users_+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(reference_archived_events, migrations.RunPython.noop),
+    ]
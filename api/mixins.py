@@ -0,0 +1,114 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+
+from .cache import get_read_cache
+
+
+class VersionedViewMixin:
+    """
+    get_version() must return a cheap value that changes whenever the
+    payload does, or None when it cannot tell (e.g. the object is missing).
+    """
+
+    def get_version(self):
+        raise NotImplementedError
+
+    def current_version(self):
+        if not hasattr(self, '_version'):
+            self._version = self.get_version()
+        return self._version
+
+
+class ConditionalGetMixin(VersionedViewMixin):
+    """
+    Answers GET requests with a strong ETag derived from the version, and
+    with 304 Not Modified before doing any work when If-None-Match matches.
+    """
+
+    def get_etag(self, request):
+        version = self.current_version()
+        if version is None:
+            return None
+        digest = hashlib.sha1('{}:{}:{}'.format(
+            type(self).__name__, version, request.accepted_media_type).encode()).hexdigest()
+        return quote_etag(digest)
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+        response = super().get(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+
+class VersionedCacheMixin(VersionedViewMixin):
+    """
+    Serves GET requests from the read cache as already rendered bytes.
+    Only JSON is cached: Browsable API pages embed the client's CSRF token.
+    """
+    cache_key = None
+    cached_media_types = ('application/json',)
+
+    def get(self, request, *args, **kwargs):
+        cache = get_read_cache()
+        cacheable = cache is not None and request.accepted_renderer.media_type in self.cached_media_types
+        version = self.current_version() if cacheable else None
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        key = '{}:{}:{}:{}'.format(type(self).__name__, version, request.accepted_media_type,
+                                   request.build_absolute_uri())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        self.cache_key = key
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.cache_key is not None and response.status_code == 200:
+            response.render()
+            get_read_cache().set(self.cache_key, (response.content, response['Content-Type']))
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    Reads the comma separated `fields` and `expand` query parameters and
+    hands them to a serializer using DynamicFieldsMixin. Views use
+    is_requested/is_expanded to skip the joins and prefetches nobody asked for.
+    """
+
+    def _query_set(self, name):
+        value = self.request.query_params.get(name)
+        return None if value is None else {item for item in value.split(',') if item}
+
+    def requested_fields(self):
+        return self._query_set('fields')
+
+    def expanded_fields(self):
+        return self._query_set('expand')
+
+    def is_sparse(self):
+        return self.requested_fields() is not None or self.expanded_fields() is not None
+
+    def is_requested(self, name):
+        fields = self.requested_fields()
+        return fields is None or name in fields
+
+    def is_expanded(self, name):
+        expand = self.expanded_fields()
+        return self.is_requested(name) and (expand is None or name in expand)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        kwargs.setdefault('expand', self.expanded_fields())
+        return super().get_serializer(*args, **kwargs)
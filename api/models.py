@@ -1,7 +1,9 @@
 from datetime import datetime, timezone
+from functools import partial
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connection, models, transaction
+from django.utils.timezone import now
 
 from .constants import (
     EVENT_ACTION_CHANGE_PHASE,
@@ -9,12 +11,37 @@ from .constants import (
     EVENT_ACTION_JOIN,
     EVENT_ACTION_LEAVE
 )
+from .buffer import get_event_buffer
+from .cache import phase_ids_cache
+from .pubsub import broadcast_events
+from .sqlite import serialized_write
+
+
+def bulk_insert(objects, rows=None):
+    """
+    bulk_create that always hands back objects with primary keys. Databases
+    that cannot return them get the new rows re-read from `rows` (a queryset
+    of the same model, all of them by default).
+    """
+    if not objects:
+        return []
+    model = type(objects[0])
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    last_id = model.objects.aggregate(last_id=models.Max('id'))['last_id'] or 0
+    model.objects.bulk_create(objects)
+    rows = model.objects.all() if rows is None else rows
+    return list(rows.filter(id__gt=last_id).order_by('id'))
 
 
 class Phase(models.Model):
     title = models.CharField(max_length=60)
     timer = models.BooleanField(default=False)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Course.objects.filter(phases=self).update(revision=models.F('revision') + 1)
+
     def __str__(self):
         return self.title
 
@@ -23,47 +50,256 @@ class Course(models.Model):
     phases = models.ManyToManyField(Phase, blank=True)
     default_phase = models.ForeignKey(Phase, null= True, on_delete=models.SET_NULL,
                                       related_name='start_of_course')
+    # Bumped whenever the serialized course changes, keys the read cache.
+    revision = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            super().save(*args, **kwargs)
+        else:
+            # Bumped in the database, so concurrent saves never share a revision.
+            self.revision = models.F('revision') + 1
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=['revision'])
+
+    def bump_revision(self):
+        Course.objects.filter(pk=self.pk).update(revision=models.F('revision') + 1)
+
+    def phase_ids(self):
+        """
+        Ids of the phases of the course, cached for its current revision.
+        """
+        key = (self.pk, self.revision)
+        phase_ids = phase_ids_cache.get(key)
+        if phase_ids is None:
+            phase_ids = frozenset(self.phases.values_list('id', flat=True))
+            phase_ids_cache.set(key, phase_ids)
+        return phase_ids
 
     def __str__(self):
         return self.title
 
 class ClassRoom(models.Model):
+    SNAPSHOT_FIELDS = ('current_phase', 'timer', 'phase_started_at', 'attendance_count', 'version')
+
     course = models.ForeignKey(Course, on_delete=models.RESTRICT, related_name='class_rooms')
     attending = models.ManyToManyField(User, blank=True, related_name='class_rooms')
+    # Live-state snapshot, maintained alongside every Event write so the
+    # timer and current phase never need a scan of the events table.
+    current_phase = models.ForeignKey(Phase, null=True, blank=True, on_delete=models.SET_NULL,
+                                      related_name='+')
+    timer = models.IntegerField(default=0)
+    phase_started_at = models.DateTimeField(null=True, blank=True)
+    attendance_count = models.IntegerField(default=0)
+    # Bumped with every snapshot write, keys the read cache.
+    version = models.PositiveIntegerField(default=0)
+    # Events moved to a ClassRoomArchive, see api/archive.py.
+    archived = models.BooleanField(default=False)
 
     @classmethod
+    @serialized_write
     def kick_off(cls, course, user):
         class_room = cls(course=course)
         class_room.save()
+        course.bump_revision()
         class_room.change_phase(user, course.default_phase.id)
         class_room.join(user)
         return class_room
 
+    @serialized_write
     def join(self, user):
-        self.attending.add(user)
-        self.save()
-        Event(action=EVENT_ACTION_JOIN, class_room=self, user=user, timer=self._get_event_timer()).save()
+        with transaction.atomic():
+            self._refresh_snapshot()
+            self.attending.add(user)
+            self.attendance_count = self.attending.count()
+            self._record_event(EVENT_ACTION_JOIN, user)
         return self
 
+    @serialized_write
     def leave(self, user):
-        self.attending.remove(user)
-        self.save()
-        Event(action=EVENT_ACTION_LEAVE, class_room=self, user=user, timer=self._get_event_timer()).save()
+        with transaction.atomic():
+            self._refresh_snapshot()
+            self.attending.remove(user)
+            self.attendance_count = self.attending.count()
+            self._record_event(EVENT_ACTION_LEAVE, user)
         return self
 
+    @serialized_write
     def change_phase(self, user, phase_id):
-        Event(action=EVENT_ACTION_CHANGE_PHASE, class_room=self, user=user,
-              to_phase_id=phase_id, timer=self._get_event_timer()).save()
+        with transaction.atomic():
+            self._refresh_snapshot()
+            self._record_event(EVENT_ACTION_CHANGE_PHASE, user, to_phase_id=phase_id)
+        return self
+
+    @classmethod
+    @serialized_write
+    def kick_off_many(cls, course, user, rosters):
+        """
+        Starts one class room of `course` per roster (a list of users): `user`
+        moves it to the default phase and the roster joins. Rooms, attendance
+        and events are each written with bulk inserts, whatever their number.
+        """
+        with transaction.atomic():
+            moment = now()
+            class_rooms = bulk_insert([cls(course=course) for _ in rosters])
+            memberships = []
+            events = []
+            for class_room, roster in zip(class_rooms, rosters):
+                actions = [(EVENT_ACTION_JOIN, member, None) for member in roster]
+                if course.default_phase is not None:
+                    actions.insert(0, (EVENT_ACTION_CHANGE_PHASE, user, course.default_phase))
+                events += class_room._plan_actions(actions, moment)[0]
+                members = {member.pk for member in roster}
+                class_room.attendance_count = len(members)
+                class_room.version += 1
+                memberships += [cls.attending.through(classroom_id=class_room.pk, user_id=member)
+                                for member in members]
+
+            cls.attending.through.objects.bulk_create(memberships, ignore_conflicts=True)
+            events = bulk_insert(events, Event.objects.filter(class_room__in=class_rooms)
+                                 .select_related('to_phase', 'user'))
+            from .aggregates import record_activity
+            record_activity(events, {class_room.pk: course.pk for class_room in class_rooms})
+            cls.objects.bulk_update(class_rooms, cls.SNAPSHOT_FIELDS)
+            course.bump_revision()
+            for class_room in class_rooms:
+                transaction.on_commit(partial(broadcast_events, class_room.pk,
+                    [event for event in events if event.class_room_id == class_room.pk]))
+        return class_rooms
+
+    def enroll(self, users):
+        return self.apply_actions([(EVENT_ACTION_JOIN, user, None) for user in users])
+
+    @serialized_write
+    def apply_actions(self, actions):
+        """
+        Applies (action, user, to_phase) triples in order, in one transaction.
+        Timers are computed in memory and every event is written by a single
+        bulk insert, instead of one save and one snapshot update per action.
+        """
+        with transaction.atomic():
+            self._refresh_snapshot()
+            events, attendance = self._plan_actions(actions, now())
+            joined = [user for action, user in attendance.values() if action == EVENT_ACTION_JOIN]
+            left = [user for action, user in attendance.values() if action == EVENT_ACTION_LEAVE]
+            if joined:
+                self.attending.add(*joined)
+            if left:
+                self.attending.remove(*left)
+            if attendance:
+                self.attendance_count = self.attending.count()
+            self._bulk_record_events(events)
+        return self
+
+    def _plan_actions(self, actions, moment):
+        """
+        Builds the events of `actions` and moves the in-memory snapshot along.
+        Returns the events and the last attendance action of every user.
+        """
+        events = []
+        attendance = {}
+        for action, user, to_phase in actions:
+            event = Event(action=action, class_room=self, user=user, to_phase=to_phase,
+                          timer=self._get_event_timer(moment), created_at=moment)
+            if to_phase is not None:
+                self._apply_event(event)
+                self.current_phase = to_phase
+            elif action in (EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE):
+                attendance[user.pk] = (action, user)
+            events.append(event)
+        return events, attendance
+
+    @serialized_write
+    def rebuild_snapshot(self):
+        self.refresh_from_db(fields=['archived'])
+        self.current_phase = None
+        self.timer = 0
+        self.phase_started_at = None
+        if self.archived:
+            # Imported here because api.archive builds on these models.
+            from .archive import archived_events
+            phase_changes = [event for event in archived_events(self.pk) if event.to_phase_id is not None]
+            last_event = max(phase_changes, key=lambda event: (event.created_at, event.id), default=None)
+        else:
+            last_event = self.events.filter(to_phase__isnull=False).order_by('created_at', 'id').last()
+        if last_event is not None:
+            self._apply_event(last_event)
+        self.attendance_count = self.attending.count()
+        self.save_versioned(self.SNAPSHOT_FIELDS)
         return self
 
-    def _get_event_timer(self):
-        last_event = self.events.filter(to_phase__isnull=False).order_by('created_at').last()
-        if last_event is None:
+    def save_versioned(self, update_fields):
+        """
+        Saves `update_fields` (version among them) with the version bumped in
+        the database, where concurrent writers cannot both read the same value.
+        """
+        self.version = models.F('version') + 1
+        self.save(update_fields=update_fields)
+        self.refresh_from_db(fields=['version'])
+
+    def _refresh_snapshot(self):
+        # Other instances of the room may have written since this one was
+        # loaded: timers must build on the stored snapshot, not on ours.
+        rows = ClassRoom.objects.filter(pk=self.pk)
+        if connection.features.has_select_for_update:
+            rows = rows.select_for_update()
+        # So does `archived`: events written while the room is archived are lost.
+        (self.current_phase_id, self.timer, self.phase_started_at, self.attendance_count,
+         self.version, self.archived) = rows.values_list(
+            'current_phase_id', 'timer', 'phase_started_at', 'attendance_count', 'version',
+            'archived').get()
+
+    def _record_event(self, action, user, to_phase_id=None):
+        self._restore_events()
+        event = Event(action=action, class_room=self, user=user,
+                      to_phase_id=to_phase_id, timer=self._get_event_timer())
+        # Phase changes anchor snapshot rebuilds and are always written
+        # straight away, joins and leaves may go through the buffer.
+        buffer = get_event_buffer() if to_phase_id is None else None
+        if buffer is None:
+            event.save()
+            self._record_activity([event])
+        self._apply_event(event)
+        self._save_snapshot([] if buffer else [event])
+        if buffer is not None:
+            transaction.on_commit(partial(buffer.append, event))
+        return event
+
+    def _bulk_record_events(self, events):
+        self._restore_events()
+        events = bulk_insert(events, self.events.select_related('to_phase', 'user'))
+        self._record_activity(events)
+        self._save_snapshot(events)
+        return events
+
+    def _record_activity(self, events):
+        # Imported here because api.aggregates builds on these models.
+        from .aggregates import record_activity
+        record_activity(events, {self.pk: self.course_id})
+
+    def _restore_events(self):
+        if self.archived:
+            from .archive import restore_class_room
+            restore_class_room(self)
+
+    def _save_snapshot(self, events):
+        self.save_versioned(self.SNAPSHOT_FIELDS)
+        transaction.on_commit(partial(broadcast_events, self.pk, events))
+
+    def _apply_event(self, event):
+        if event.to_phase_id is not None:
+            self.current_phase_id = event.to_phase_id
+            self.timer = int(event.timer)
+            self.phase_started_at = event.created_at
+
+    def _get_event_timer(self, moment=None):
+        if self.current_phase_id is None:
             return 0
-        elif last_event.to_phase.timer == True:
-            return last_event.timer + (datetime.now(timezone.utc) - last_event.created_at).total_seconds()
+        elif self.current_phase.timer == True:
+            moment = moment or datetime.now(timezone.utc)
+            return self.timer + (moment - self.phase_started_at).total_seconds()
         else:
-            return last_event.timer
+            return self.timer
 
     def __str__(self):
         return 'class room of : {}'.format(self.course.title)
@@ -74,9 +310,88 @@ class Event(models.Model):
                                  default=EVENT_ACTION_CHANGE_PHASE)
     to_phase = models.ForeignKey(Phase, on_delete=models.CASCADE, null=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
-    class_room = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, related_name='events')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed by api_event_room_id_idx instead.
+    class_room = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, related_name='events', db_index=False)
+    created_at = models.DateTimeField(default=now)
     timer = models.IntegerField(blank=False, null=False, default=0)
 
+    class Meta:
+        indexes = [
+            # Event lists and cursor pages of a class room, newest first.
+            models.Index(fields=['class_room', 'created_at', 'id'], name='api_event_room_created_idx'),
+            # Events of a class room after a given id, in id order (sync, publishing).
+            models.Index(fields=['class_room', 'id'], name='api_event_room_id_idx'),
+            # Latest phase change of a class room (snapshot rebuilds).
+            models.Index(fields=['class_room', 'created_at', 'id'], name='api_event_room_phase_idx',
+                         condition=models.Q(to_phase__isnull=False)),
+        ]
+
     def __str__(self):
         return 'action {} at {} for {}'.format(self.action, self.created_at, self.class_room.id)
+
+
+class ClassRoomCheckpoint(models.Model):
+    """
+    State of a class room after replaying its events up to `event` (in
+    created_at, id order), so replays can start here instead of at the
+    first event. Written by api.replay, disposable at any time.
+    """
+    class_room = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, related_name='checkpoints')
+    event_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    current_phase = models.ForeignKey(Phase, null=True, on_delete=models.CASCADE, related_name='+')
+    timer = models.IntegerField(default=0)
+    phase_started_at = models.DateTimeField(null=True)
+    attending = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['class_room', 'event_id'], name='api_checkpoint_unique_event'),
+        ]
+        indexes = [
+            models.Index(fields=['class_room', 'created_at', 'event_id'], name='api_checkpoint_room_idx'),
+        ]
+
+
+class ClassRoomArchive(models.Model):
+    """
+    The events of an idle class room, moved out of api_event into one
+    compressed blob, with a summary of what it holds.
+    """
+    class_room = models.OneToOneField(ClassRoom, on_delete=models.CASCADE, related_name='archive')
+    event_count = models.PositiveIntegerField()
+    first_event_id = models.PositiveIntegerField()
+    last_event_id = models.PositiveIntegerField()
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=now)
+    data = models.BinaryField()
+    # What the archived events point at, so saving a user or phase only
+    # invalidates the archived rooms it appears in (see api/signals.py).
+    users = models.ManyToManyField(User, related_name='+', blank=True)
+    phases = models.ManyToManyField(Phase, related_name='+', blank=True)
+
+
+class CourseActivity(models.Model):
+    """
+    Events, joins, leaves, phase changes and active class rooms of a course
+    over one hour or one day (UTC), kept up to date by every event write
+    (see api/aggregates.py) so dashboards never count api_event rows.
+    """
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    PERIOD_CHOICES = ((PERIOD_HOUR, 'Hour'), (PERIOD_DAY, 'Day'))
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='activity')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    events = models.PositiveIntegerField(default=0)
+    joins = models.PositiveIntegerField(default=0)
+    leaves = models.PositiveIntegerField(default=0)
+    phase_changes = models.PositiveIntegerField(default=0)
+    active_rooms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'period', 'start'], name='api_activity_unique_start'),
+        ]
@@ -0,0 +1,62 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class EventCursorPagination(CursorPagination):
+    """
+    Newest first, on a (created_at, id) keyset: the cursor holds both, so
+    events sharing a created_at (bulk writes) are never skipped with OFFSET
+    and pages stay stable while new events are appended.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if position is not None:
+            created_at, event_id = self._parse_position(position)
+            # Forward pages go to older events, reverse ones to newer events.
+            operator = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(Q(**{'created_at__' + operator: created_at})
+                                       | Q(created_at=created_at, **{'id__' + operator: event_id}))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (self._get_position_from_instance(results[-1], self.ordering)
+                              if len(results) > len(self.page) else None)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = True, position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = position is not None, position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _parse_position(self, position):
+        created_at, _, event_id = position.rpartition(',')
+        try:
+            created_at, event_id = parse_datetime(created_at), int(event_id)
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, event_id
+
+    def _get_position_from_instance(self, instance, ordering):
+        return '{},{}'.format(instance.created_at.isoformat(), instance.pk)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """
+    A subscriber's mailbox. It must be created from the event loop that
+    consumes it; publishers on any thread hand messages over to that loop.
+    """
+
+    def __init__(self, broker, class_room_id, max_queue_size):
+        self.broker = broker
+        self.class_room_id = class_room_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queue_size)
+
+    def deliver(self, message):
+        # Slow consumers lose their oldest messages rather than growing without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Per-classroom fan-out inside a single process. Any object exposing the
+    same subscribe/unsubscribe/publish/subscriber_count methods can replace
+    it through the ACTIO_EVENT_BROKER setting.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, class_room_id):
+        subscription = Subscription(self, class_room_id, self.max_queue_size)
+        with self._lock:
+            self._subscriptions[class_room_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.class_room_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.class_room_id]
+
+    def subscriber_count(self, class_room_id):
+        with self._lock:
+            return len(self._subscriptions.get(class_room_id, ()))
+
+    def publish(self, class_room_id, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(class_room_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's event loop is gone.
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'ACTIO_EVENT_BROKER',
+                                                     'api.pubsub.InProcessBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def broadcast_events(class_room_id, events):
+    # Imported here because the models call into this module on every write.
+    from rest_framework.renderers import JSONRenderer
+    from .serializers import EventSerializer
+
+    broker = get_broker()
+    if not broker.subscriber_count(class_room_id):
+        return
+    for data in EventSerializer(events, many=True).data:
+        broker.publish(class_room_id, JSONRenderer().render(data).decode())
@@ -0,0 +1,25 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed. It falls back to
+    the standard library encoder when orjson is missing and for the output
+    orjson cannot reproduce: indented, ASCII-only or spaced JSON.
+    """
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Anything orjson does not know natively goes through DRF's encoder.
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        # Same strict javascript subset as JSONRenderer.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,114 @@
+"""
+Rebuilds the state of a class room at any moment from its event log.
+
+A replay starts from the latest checkpoint at or before the requested
+moment and leaves a new checkpoint every ACTIO_CHECKPOINT_INTERVAL events
+it applies, so its cost is bounded by the interval rather than by the
+length of the log.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .archive import archived_rows
+from .constants import EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from .models import ClassRoom, ClassRoomArchive, ClassRoomCheckpoint, Event
+
+# Events younger than this may still be joined by events with an earlier
+# created_at (concurrent requests, the write-behind buffer), so they are
+# replayed but never checkpointed.
+CHECKPOINT_SETTLE = timedelta(minutes=1)
+
+EVENT_FIELDS = ('id', 'action', 'user_id', 'to_phase_id', 'timer', 'created_at')
+
+
+def checkpoint_interval():
+    return getattr(settings, 'ACTIO_CHECKPOINT_INTERVAL', 500)
+
+
+class ReplayState:
+    """
+    A class room as its events left it. Phase changes are applied like
+    ClassRoom._apply_event does, joins and leaves like the attending set.
+    """
+
+    def __init__(self, class_room_id, checkpoint=None):
+        self.class_room_id = class_room_id
+        self.event_id = None
+        self.created_at = None
+        self.current_phase_id = None
+        self.timer = 0
+        self.phase_started_at = None
+        self.attending = {}  # user ids, ordered by join
+        if checkpoint is not None:
+            self.event_id = checkpoint.event_id
+            self.created_at = checkpoint.created_at
+            self.current_phase_id = checkpoint.current_phase_id
+            self.timer = checkpoint.timer
+            self.phase_started_at = checkpoint.phase_started_at
+            self.attending = dict.fromkeys(checkpoint.attending)
+
+    def apply(self, event_id, action, user_id, to_phase_id, timer, created_at):
+        if to_phase_id is not None:
+            self.current_phase_id = to_phase_id
+            self.timer = int(timer)
+            self.phase_started_at = created_at
+        elif user_id is not None and action == EVENT_ACTION_JOIN:
+            self.attending[user_id] = None
+        elif action == EVENT_ACTION_LEAVE:
+            self.attending.pop(user_id, None)
+        self.event_id = event_id
+        self.created_at = created_at
+
+    def checkpoint(self):
+        return ClassRoomCheckpoint(
+            class_room_id=self.class_room_id, event_id=self.event_id, created_at=self.created_at,
+            current_phase_id=self.current_phase_id, timer=self.timer,
+            phase_started_at=self.phase_started_at, attending=list(self.attending))
+
+
+def replay(class_room_id, at=None, archived=None, chunk_size=2000):
+    """
+    State of the class room after all its events created at or before `at`
+    (all of them by default). `archived` saves a query when the caller
+    already knows whether the events are in an archive.
+    """
+    if archived is None:
+        archived = ClassRoom.objects.filter(pk=class_room_id, archived=True).exists()
+    checkpoints = ClassRoomCheckpoint.objects.filter(class_room_id=class_room_id)
+    if at is not None:
+        checkpoints = checkpoints.filter(created_at__lte=at)
+    checkpoint = checkpoints.order_by('-created_at', '-event_id').first()
+
+    if archived:
+        end = ClassRoomArchive.objects.filter(class_room_id=class_room_id).values_list(
+            'last_created_at', 'last_event_id').first()
+        if checkpoint is not None and end is not None and (checkpoint.created_at, checkpoint.event_id) >= end:
+            # Archiving leaves a checkpoint at the end: nothing to decode.
+            return ReplayState(class_room_id, checkpoint)
+        rows = sorted(archived_rows(class_room_id), key=lambda row: (row[5], row[0]))
+        if checkpoint is not None:
+            rows = [row for row in rows if (row[5], row[0]) > (checkpoint.created_at, checkpoint.event_id)]
+        if at is not None:
+            rows = [row for row in rows if row[5] <= at]
+    else:
+        events = Event.objects.filter(class_room_id=class_room_id)
+        if at is not None:
+            events = events.filter(created_at__lte=at)
+        if checkpoint is not None:
+            events = events.filter(Q(created_at__gt=checkpoint.created_at)
+                                   | Q(created_at=checkpoint.created_at, id__gt=checkpoint.event_id))
+        rows = events.order_by('created_at', 'id').values_list(*EVENT_FIELDS).iterator(chunk_size=chunk_size)
+
+    state = ReplayState(class_room_id, checkpoint)
+    interval = checkpoint_interval()
+    settled_before = now() - CHECKPOINT_SETTLE
+    new_checkpoints = []
+    for count, row in enumerate(rows, 1):
+        state.apply(*row)
+        if interval and count % interval == 0 and state.created_at < settled_before:
+            new_checkpoints.append(state.checkpoint())
+    ClassRoomCheckpoint.objects.bulk_create(new_checkpoints, ignore_conflicts=True)
+    return state
@@ -1,16 +1,35 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from .constants import EVENT_ACTION_CHOICES
-from .models import ClassRoom, Course, Event, Phase
+from .constants import EVENT_ACTION_CHOICES, EVENT_ACTION_NAMES
+from .models import ClassRoom, Course, CourseActivity, Event, Phase
 
 
+class DynamicFieldsMixin:
+    """
+    Lets the caller narrow the output: only the `fields` given are rendered,
+    and nested relations left out of `expand` are rendered as primary keys.
+    None, the default for both, keeps every field fully expanded.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name, field in list(self.fields.items()):
+                nested = field.child if isinstance(field, serializers.ListSerializer) else field
+                if isinstance(nested, serializers.BaseSerializer) and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        many=nested is not field, read_only=True)
+
 class PhaseSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Phase
         fields = ('id', 'title', 'timer')
 
-class CourseSerializer(serializers.HyperlinkedModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     phases = PhaseSerializer(many=True, read_only=True)
     class_rooms = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
@@ -31,11 +50,69 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
         model = Event
         fields = ('id', 'to_phase', 'action', 'created_at', 'user', 'timer')
 
-class ClassRoomSerializer(serializers.HyperlinkedModelSerializer):
+class ClassRoomSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     course = CourseSerializer(many=False, read_only=True)
     events = EventSerializer(many=True, read_only=True)
     attending = CurrentUserSerializer(many=True, read_only=True)
+    current_phase = PhaseSerializer(many=False, read_only=True)
+
+    class Meta:
+        model = ClassRoom
+        fields = ('id', 'course', 'events', 'attending', 'current_phase', 'timer',
+                  'phase_started_at', 'attendance_count')
+
+class ClassRoomStateSerializer(serializers.HyperlinkedModelSerializer):
+    current_phase = PhaseSerializer(many=False, read_only=True)
 
     class Meta:
         model = ClassRoom
-        fields = ('id', 'course', 'events', 'attending')
+        fields = ('id', 'current_phase', 'timer', 'phase_started_at', 'attendance_count')
+
+class ClassRoomActionSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=tuple(EVENT_ACTION_NAMES))
+    user_id = serializers.IntegerField(required=False)
+    to_phase_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['action'] == 'change_phase' and 'to_phase_id' not in data:
+            raise serializers.ValidationError('Need a to_phase_id to change phase')
+        return data
+
+class KickOffSerializer(serializers.Serializer):
+    rosters = serializers.ListField(
+        child=serializers.ListField(child=serializers.IntegerField(), max_length=500),
+        min_length=1, max_length=100)
+
+class EnrollSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=500)
+
+
+class EventExportSerializer(serializers.Serializer):
+    class_room = serializers.IntegerField(source='class_room_id', required=False)
+    course = serializers.IntegerField(source='course_id', required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+class ReplaySerializer(serializers.Serializer):
+    at = serializers.DateTimeField(required=False)
+
+
+class ActivitySerializer(serializers.Serializer):
+    period = serializers.ChoiceField(CourseActivity.PERIOD_CHOICES, default=CourseActivity.PERIOD_HOUR)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+class CourseActivitySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = CourseActivity
+        fields = ('start', 'events', 'joins', 'leaves', 'phase_changes', 'active_rooms')
+
+
+class AnalyticsSerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    bucket = serializers.IntegerField(min_value=1, default=60)
+    points = serializers.IntegerField(min_value=1, max_value=1440, default=60)
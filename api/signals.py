@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.db.models import F, Q
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_tokens
+from .models import ClassRoom, ClassRoomCheckpoint, Course, Event, Phase
+from .sqlite import apply_pragmas
+
+
+def bump_course_revisions(course_ids):
+    Course.objects.filter(pk__in=course_ids).update(revision=F('revision') + 1)
+
+
+def bump_class_room_versions(query):
+    class_rooms = ClassRoom.objects.filter(query).values('pk')
+    ClassRoom.objects.filter(pk__in=class_rooms).update(version=F('version') + 1)
+
+
+@receiver(m2m_changed, sender=Course.phases.through)
+def course_phases_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_course_revisions([instance.pk])
+    elif action == 'pre_clear':
+        bump_course_revisions(instance.course_set.values_list('pk', flat=True))
+    else:
+        bump_course_revisions(pk_set)
+
+
+@receiver(post_delete, sender=ClassRoom)
+def class_room_deleted(sender, instance, **kwargs):
+    bump_course_revisions([instance.course_id])
+
+
+@receiver(pre_delete, sender=Phase)
+def phase_deleted(sender, instance, **kwargs):
+    # The course links go without m2m_changed.
+    bump_course_revisions(instance.course_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Phase)
+def event_references_deleted(sender, instance, **kwargs):
+    # Their events go with them (archived ones are dropped when read), so
+    # replay checkpoints of those rooms are stale.
+    events = Event.objects.filter(**{'user' if sender is User else 'to_phase': instance})
+    ClassRoomCheckpoint.objects.filter(
+        Q(class_room__in=events.values('class_room_id')) | Q(class_room__archived=True)).delete()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    # Deactivated users must stop authenticating, and others not be served
+    # stale; logins only touch last_login, which nothing reads from there.
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        forget_tokens(Token.objects.filter(user=instance).values_list('key', flat=True))
+    # Attendees and event users are part of the class room payloads.
+    if update_fields is None or {'username', 'email'} & set(update_fields):
+        bump_class_room_versions(Q(attending=instance) | Q(events__user=instance)
+                                 | Q(archive__users=instance))
+
+
+@receiver(post_save, sender=Phase)
+def phase_saved(sender, instance, created, **kwargs):
+    # Courses follow through Phase.save; events may point at phases their
+    # course has dropped since.
+    if not created:
+        bump_class_room_versions(Q(current_phase=instance) | Q(events__to_phase=instance)
+                                 | Q(archive__phases=instance))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection)
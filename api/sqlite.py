@@ -0,0 +1,89 @@
+"""
+High-concurrency profile for SQLite.
+
+Every new connection gets the ACTIO_SQLITE_PRAGMAS, WAL above all: readers
+then run alongside the writer instead of waiting for it. SQLite still
+allows a single writer, and a deferred transaction that has read before
+writing cannot wait for another writer to finish: it fails at once with
+"database is locked", whatever the busy timeout. With ACTIO_WRITE_LANE the
+class room write methods of a process queue on one lock instead, so only
+writers from other processes ever meet at the database. Readers never
+take it.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+
+
+def apply_pragmas(connection):
+    pragmas = getattr(settings, 'ACTIO_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+class WriteLane:
+    """
+    Re-entrant lock taken around whole write methods (transaction included,
+    unless the caller holds one open), counting how long writers queued.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.waited_seconds = 0
+        self.max_wait_seconds = 0
+        self.waiting = 0
+        self._lock = threading.RLock()
+        self._waiting_lock = threading.Lock()
+
+    def __enter__(self):
+        with self._waiting_lock:
+            self.waiting += 1
+        started_at = time.perf_counter()
+        self._lock.acquire()
+        waited = time.perf_counter() - started_at
+        with self._waiting_lock:
+            self.waiting -= 1
+        self.writes += 1
+        self.waited_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'writes': self.writes,
+            'mean_wait_seconds': self.waited_seconds / self.writes if self.writes else 0,
+            'max_wait_seconds': self.max_wait_seconds,
+        }
+
+
+_write_lane = WriteLane()
+
+
+def get_write_lane():
+    """
+    The write lane of this process, or None when ACTIO_WRITE_LANE is off.
+    """
+    return _write_lane if getattr(settings, 'ACTIO_WRITE_LANE', False) else None
+
+
+def serialized_write(method):
+    """
+    Runs `method` in the write lane, when it is enabled. Whatever the
+    caller loaded before queuing may be stale by then: methods re-read the
+    state they build on first (ClassRoom._refresh_snapshot).
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        lane = get_write_lane()
+        if lane is None:
+            return method(*args, **kwargs)
+        with lane:
+            return method(*args, **kwargs)
+    return wrapper
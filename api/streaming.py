@@ -0,0 +1,104 @@
+import asyncio
+import re
+
+from asgiref.sync import sync_to_async
+
+from .models import ClassRoom
+from .pubsub import get_broker
+
+SSE_KEEPALIVE_SECONDS = 15
+
+SSE_PATH = re.compile(r'^/api/classrooms/(?P<class_room_id>\d+)/stream$')
+WEBSOCKET_PATH = re.compile(r'^/ws/classrooms/(?P<class_room_id>\d+)$')
+
+
+@sync_to_async
+def class_room_exists(class_room_id):
+    return ClassRoom.objects.filter(pk=class_room_id).exists()
+
+
+async def _forward(subscription, receive, send_event, keepalive=None):
+    """
+    Hands every published event to send_event until the client disconnects.
+    send_event receives None when nothing was published for `keepalive` seconds.
+    """
+    receive_task = asyncio.ensure_future(receive())
+    get_task = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receive_task, get_task}, timeout=keepalive,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if receive_task in done:
+                if receive_task.result()['type'] in ('websocket.disconnect', 'http.disconnect'):
+                    return
+                # Anything else the client sends is ignored.
+                receive_task = asyncio.ensure_future(receive())
+            if get_task in done:
+                await send_event(get_task.result())
+                get_task = asyncio.ensure_future(subscription.get())
+            elif not done:
+                await send_event(None)
+    finally:
+        receive_task.cancel()
+        get_task.cancel()
+        subscription.close()
+
+
+async def websocket_events(scope, receive, send, class_room_id):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if not await class_room_exists(class_room_id):
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    subscription = get_broker().subscribe(class_room_id)
+    await send({'type': 'websocket.accept'})
+
+    async def send_event(event):
+        await send({'type': 'websocket.send', 'text': event})
+
+    await _forward(subscription, receive, send_event)
+
+
+async def sse_events(scope, receive, send, class_room_id):
+    if not await class_room_exists(class_room_id):
+        await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    subscription = get_broker().subscribe(class_room_id)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+        ],
+    })
+
+    async def send_event(event):
+        body = 'data: {}\n\n'.format(event) if event is not None else ': keepalive\n\n'
+        await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+
+    await _forward(subscription, receive, send_event, keepalive=SSE_KEEPALIVE_SECONDS)
+
+
+def router(django_application):
+    """
+    Serves the long-lived event streams directly and hands every other
+    request to Django.
+    """
+    async def application(scope, receive, send):
+        if scope['type'] == 'websocket':
+            match = WEBSOCKET_PATH.match(scope['path'])
+            if match is None:
+                await receive()
+                await send({'type': 'websocket.close', 'code': 4404})
+                return
+            return await websocket_events(scope, receive, send, int(match['class_room_id']))
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = SSE_PATH.match(scope['path'])
+            if match is not None:
+                return await sse_events(scope, receive, send, int(match['class_room_id']))
+        return await django_application(scope, receive, send)
+
+    return application
@@ -0,0 +1,12 @@
+import pytest
+
+from api.cache import get_read_cache, get_token_cache, phase_ids_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Primary keys are reused once a test's transaction is rolled back.
+    yield
+    for cache in (get_read_cache(), get_token_cache(), phase_ids_cache):
+        if cache is not None:
+            cache.clear()
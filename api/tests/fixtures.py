@@ -6,6 +6,10 @@ from api.models import Course, ClassRoom, Phase
 def authorized_user(db):
     return User.objects.create_user(username='testuser', password='12345')
 
+@pytest.fixture
+def admin(db):
+    return User.objects.create_superuser('admin', password='12345')
+
 @pytest.fixture
 def course(db):
     phase = Phase(title='Lobby', timer=False)
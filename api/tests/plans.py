@@ -0,0 +1,36 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@contextmanager
+def assert_no_full_scans(table='api_event', allow_sort=False):
+    """
+    Fails if any SELECT run inside the block reads all of `table`, according
+    to SQLite's EXPLAIN QUERY PLAN, or sorts its rows in a temporary b-tree
+    instead of walking an index (unless `allow_sort`).
+    """
+    if connection.vendor != 'sqlite':
+        pytest.skip('query plans are only checked on SQLite')
+    full_scan = re.compile(r'SCAN {}\b'.format(re.escape(table)))
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    scans = []
+    for query in context.captured_queries:
+        if not query['sql'].lstrip().upper().startswith('SELECT'):
+            continue
+        details = explain(query['sql'])
+        reads_table = any(table in detail for detail in details)
+        sorts = reads_table and 'USE TEMP B-TREE FOR ORDER BY' in details
+        if any(full_scan.match(detail) for detail in details) or (sorts and not allow_sort):
+            scans.append('{}\n  {}'.format(query['sql'], '\n  '.join(details)))
+    assert not scans, 'full scan or sort of {}:\n{}'.format(table, '\n'.join(scans))
@@ -0,0 +1,118 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from api.aggregates import course_activity, rebuild_course_activity, record_activity
+from api.archive import archive_class_room
+from api.buffer import EventBuffer
+from api.constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from api.models import ClassRoom, CourseActivity, Event, bulk_insert
+from api.tests.factory import request_factory
+from api.tests.fixtures import admin, authorized_user, course, class_room
+from api.tests.plans import assert_no_full_scans
+from api.views import CourseActivityReport
+
+START = datetime(2020, 6, 1, 9, 50, tzinfo=timezone.utc)
+
+
+def activity(course, period=CourseActivity.PERIOD_HOUR):
+    return [(row.start, row.events, row.joins, row.leaves, row.phase_changes, row.active_rooms)
+            for row in course_activity(course.pk, period)]
+
+
+def write(class_room, *events):
+    """
+    Writes (minutes after START, action, user) events the way the write path
+    does, then counts them in.
+    """
+    events = bulk_insert([Event(class_room=class_room, created_at=START + timedelta(minutes=minutes),
+                                action=action, user=user) for minutes, action, user in events])
+    record_activity(events, {class_room.pk: class_room.course_id})
+    return events
+
+
+class TestCourseActivity:
+
+    @pytest.mark.django_db
+    def test_write_path_matches_rebuild(self, authorized_user, course):
+        students = [User.objects.create_user(username='student{}'.format(i)) for i in range(6)]
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        class_room.join(students[0])
+        class_room.leave(students[0])
+        class_room.change_phase(authorized_user, course.phases.order_by('id')[1].id)
+        class_room.enroll(students)
+        ClassRoom.kick_off_many(course, authorized_user, [students[:3], students[3:]])
+
+        hour = activity(course)
+        # 5 + 6 + 2 * 4 events: 1 + 1 + 6 + 6 joins, 1 leave, 4 phase changes.
+        assert [sum(row[i] for row in hour) for i in range(1, 5)] == [19, 14, 1, 4]
+        day = activity(course, CourseActivity.PERIOD_DAY)
+        assert max(row[5] for row in day) == 3
+
+        rebuild_course_activity()
+        assert activity(course) == hour
+        assert activity(course, CourseActivity.PERIOD_DAY) == day
+
+    @pytest.mark.django_db
+    def test_active_rooms_across_hours(self, authorized_user, course, class_room):
+        other = ClassRoom.objects.create(course=course)
+        write(class_room, (0, EVENT_ACTION_CHANGE_PHASE, authorized_user), (20, EVENT_ACTION_JOIN, authorized_user))
+        write(class_room, (25, EVENT_ACTION_LEAVE, authorized_user))
+        write(other, (30, EVENT_ACTION_JOIN, authorized_user))
+
+        nine, ten = START.replace(minute=0), START.replace(minute=0) + timedelta(hours=1)
+        assert activity(course) == [(nine, 1, 0, 0, 1, 1), (ten, 3, 2, 1, 0, 2)]
+        assert activity(course, CourseActivity.PERIOD_DAY) == [(nine.replace(hour=0), 4, 2, 1, 1, 2)]
+        expected = activity(course), activity(course, CourseActivity.PERIOD_DAY)
+        rebuild_course_activity([course.pk])
+        assert (activity(course), activity(course, CourseActivity.PERIOD_DAY)) == expected
+
+    @pytest.mark.django_db(transaction=True)
+    def test_buffered_events_are_counted_on_flush(self, monkeypatch, authorized_user, class_room):
+        buffer = EventBuffer()
+        monkeypatch.setattr('api.models.get_event_buffer', lambda: buffer)
+        class_room.join(authorized_user)
+        assert not CourseActivity.objects.exists()
+        buffer.flush()
+        assert [row[1:] for row in activity(class_room.course)] == [(1, 1, 0, 0, 1)]
+
+    @pytest.mark.django_db
+    def test_rebuild_counts_archives(self, authorized_user, course, class_room):
+        write(class_room, (0, EVENT_ACTION_CHANGE_PHASE, authorized_user), (70, EVENT_ACTION_JOIN, authorized_user))
+        expected = activity(course), activity(course, CourseActivity.PERIOD_DAY)
+        archive_class_room(class_room)
+        stdout = io.StringIO()
+        call_command('rebuild_course_activity', stdout=stdout)
+        assert 'Rebuilt 3 course activity row(s)' in stdout.getvalue()
+        assert (activity(course), activity(course, CourseActivity.PERIOD_DAY)) == expected
+
+    @pytest.mark.django_db
+    def test_reads_use_the_index(self, authorized_user, course, class_room):
+        write(class_room, (0, EVENT_ACTION_JOIN, authorized_user))
+        with assert_no_full_scans('api_courseactivity'):
+            list(course_activity(course.pk, since=START - timedelta(days=1)))
+
+    @pytest.mark.django_db
+    def test_endpoint(self, request_factory, admin, authorized_user, course, class_room):
+        write(class_room, (0, EVENT_ACTION_JOIN, authorized_user), (70, EVENT_ACTION_JOIN, authorized_user))
+        view = CourseActivityReport.as_view()
+
+        def get(user, pk, **params):
+            request = request_factory.get('activity', params)
+            force_authenticate(request, user=user)
+            return view(request, pk=pk)
+
+        response = get(admin, course.pk)
+        assert response.status_code == status.HTTP_200_OK
+        assert [row['start'] for row in response.data['activity']] == ['2020-06-01T09:00:00Z', '2020-06-01T11:00:00Z']
+        response = get(admin, course.pk, period='day', since='2020-06-01T00:00:00Z')
+        assert response.data['activity'] == [{'start': '2020-06-01T00:00:00Z', 'events': 2, 'joins': 2,
+                                              'leaves': 0, 'phase_changes': 0, 'active_rooms': 1}]
+        assert get(admin, course.pk, period='week').status_code == status.HTTP_400_BAD_REQUEST
+        assert get(admin, 1000).status_code == status.HTTP_404_NOT_FOUND
+        assert get(authorized_user, course.pk).status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,131 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from api import analytics
+from api.analytics import course_analytics, event_columns, summarize, summarize_vectorized
+from api.archive import archive_class_room
+from api.constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from api.models import ClassRoom, Course, Event
+from api.tests.factory import request_factory
+from api.tests.fixtures import admin, authorized_user, course
+from api.views import CourseAnalytics
+
+START = datetime(2020, 6, 1, 9, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def class_rooms(authorized_user, course):
+    """
+    Two class rooms: ten minutes of lobby, a timed phase and attendance
+    changes, and two minutes of one student in the lobby.
+    """
+    lobby, calculate = course.phases.order_by('id')
+    student, other = (User.objects.create_user(username=name) for name in ('student', 'other'))
+    first, second = ClassRoom.objects.create(course=course), ClassRoom.objects.create(course=course)
+    events = [
+        (first, 0, EVENT_ACTION_CHANGE_PHASE, authorized_user, lobby, 0),
+        (first, 1, EVENT_ACTION_JOIN, authorized_user, None, 0),
+        (first, 2, EVENT_ACTION_JOIN, student, None, 0),
+        (first, 3, EVENT_ACTION_CHANGE_PHASE, authorized_user, calculate, 0),
+        (first, 4, EVENT_ACTION_JOIN, student, None, 60),
+        (first, 5, EVENT_ACTION_LEAVE, student, None, 120),
+        (first, 6, EVENT_ACTION_JOIN, other, None, 180),
+        (first, 8, EVENT_ACTION_CHANGE_PHASE, authorized_user, lobby, 300),
+        (first, 10, EVENT_ACTION_LEAVE, authorized_user, None, 300),
+        (second, 0, EVENT_ACTION_CHANGE_PHASE, authorized_user, lobby, 0),
+        (second, 0, EVENT_ACTION_JOIN, student, None, 0),
+        (second, 2, EVENT_ACTION_LEAVE, student, None, 0),
+    ]
+    Event.objects.bulk_create(
+        Event(class_room=class_room, created_at=START + timedelta(minutes=minute), action=action,
+              user=user, to_phase=phase, timer=timer)
+        for class_room, minute, action, user, phase, timer in events)
+    return [first.rebuild_snapshot(), second.rebuild_snapshot()]
+
+
+def analytics_view(request_factory, user, pk, **params):
+    request = request_factory.get('analytics', params)
+    force_authenticate(request, user=user)
+    return CourseAnalytics.as_view()(request, pk=pk)
+
+
+class TestCourseAnalytics:
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('vectorized', [False, True])
+    def test_course_analytics(self, monkeypatch, course, class_rooms, vectorized):
+        if vectorized:
+            pytest.importorskip('numpy')
+        else:
+            monkeypatch.setattr(analytics, 'numpy', None)
+        lobby, calculate = course.phases.order_by('id')
+        data = course_analytics(course)
+        assert data['class_rooms'] == 2
+        assert data['events'] == 12
+        assert data['timer_seconds'] == 300
+        assert data['phases'] == [
+            {'id': lobby.id, 'title': 'Lobby', 'visits': 3, 'seconds': 420.0, 'mean_seconds': 140.0,
+             'timer_seconds': 0},
+            {'id': calculate.id, 'title': 'calculate', 'visits': 1, 'seconds': 300.0, 'mean_seconds': 300.0,
+             'timer_seconds': 300},
+        ]
+        assert data['attendance'] == {
+            'bucket': 60,
+            'class_rooms': [2, 2, 2] + [1] * 8,
+            'mean': [0.5, 1.0, 1.0, 2.0, 2.0, 1.0, 2.0, 2.0, 2.0, 2.0, 1.0],
+        }
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('vectorized', [False, True])
+    def test_phase_changes_only(self, monkeypatch, authorized_user, course, vectorized):
+        if vectorized:
+            pytest.importorskip('numpy')
+        else:
+            monkeypatch.setattr(analytics, 'numpy', None)
+        ClassRoom.objects.create(course=course).change_phase(authorized_user, course.default_phase_id)
+        data = course_analytics(course)
+        assert [(phase['visits'], phase['seconds']) for phase in data['phases']] == [(1, 0.0)]
+        assert data['attendance'] == {'bucket': 60, 'class_rooms': [1], 'mean': [0.0]}
+        assert course_analytics(course, until=START)['class_rooms'] == 0
+
+    @pytest.mark.django_db
+    def test_window_and_archives(self, course, class_rooms):
+        data = course_analytics(course, bucket=120, points=3)
+        assert data['attendance'] == {'bucket': 120, 'class_rooms': [2, 2, 1], 'mean': [0.5, 1.0, 2.0]}
+        archive_class_room(class_rooms[1])
+        assert course_analytics(course, bucket=120, points=3) == data
+
+        window = course_analytics(course, since=START + timedelta(minutes=3), until=START + timedelta(minutes=8))
+        assert window['class_rooms'] == 1
+        assert window['events'] == 4
+        assert [(phase['visits'], phase['seconds']) for phase in window['phases']] == [(1, 180.0)]
+
+    @pytest.mark.django_db
+    def test_engines_agree(self):
+        pytest.importorskip('numpy')
+        call_command('generate_data', '--users=50', '--courses=3', '--events-per-room=80',
+                     '--until=2020-06-01', '--mean-gap=45', stdout=io.StringIO())
+        for course in Course.objects.all():
+            columns = event_columns(course.pk)
+            python, vectorized = summarize(columns, 60, 30), summarize_vectorized(columns, 60, 30)
+            assert vectorized['attendance'] == python['attendance']
+            assert vectorized['phases'].keys() == python['phases'].keys()
+            for phase_id, (visits, seconds, timer) in python['phases'].items():
+                assert vectorized['phases'][phase_id] == [visits, pytest.approx(seconds), timer]
+
+    @pytest.mark.django_db
+    def test_endpoint(self, request_factory, admin, authorized_user, course, class_rooms):
+        response = analytics_view(request_factory, admin, course.pk, bucket=120)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['attendance']['bucket'] == 120
+        assert analytics_view(request_factory, admin, course.pk, bucket=0).status_code == \
+            status.HTTP_400_BAD_REQUEST
+        assert analytics_view(request_factory, admin, 1000).status_code == status.HTTP_404_NOT_FOUND
+        assert analytics_view(request_factory, authorized_user, course.pk).status_code == \
+            status.HTTP_403_FORBIDDEN
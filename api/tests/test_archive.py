@@ -0,0 +1,259 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from rest_framework import status
+
+from api import archive
+from api.archive import archive_class_room, archived_rows, decode_rows, encode_rows, restore_class_room
+from api.export import export_rows
+from api.models import ClassRoom, ClassRoomArchive, Event
+from api.replay import replay
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course
+from api.views import ClassRoomDetail, ClassRoomEvents, ClassRoomState, ClassRoomSync
+
+START = datetime(2020, 6, 1, 9, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def idle_class_room(authorized_user, course):
+    """
+    A class room with 12 events, one minute apart from START on.
+    """
+    students = [User.objects.create_user(username='student{}'.format(i)) for i in range(3)]
+    phases = list(course.phases.order_by('id'))
+    class_room = ClassRoom.kick_off(course, authorized_user)
+    for i in range(10):
+        if i % 3 == 2:
+            class_room.change_phase(authorized_user, phases[i % 2].id)
+        elif i % 3 == 1:
+            class_room.leave(students[i % 3])
+        else:
+            class_room.join(students[i % 3])
+    for minute, event in enumerate(class_room.events.order_by('id')):
+        Event.objects.filter(pk=event.pk).update(created_at=START + timedelta(minutes=minute))
+    return class_room.rebuild_snapshot()
+
+
+def get(request_factory, view, path, data=None, **kwargs):
+    response = view.as_view()(request_factory.get(path, data), **kwargs)
+    assert response.status_code == status.HTTP_200_OK
+    return response.data
+
+
+def without_version(data):
+    return {key: value for key, value in data.items() if key != 'version'}
+
+
+def event_pages(request_factory, class_room):
+    pages = []
+    request = request_factory.get('/events', {'page_size': 5})
+    while request is not None:
+        response = ClassRoomEvents.as_view()(request, pk=class_room.pk)
+        pages.append(response.data['results'])
+        request = request_factory.get(response.data['next']) if response.data['next'] else None
+    return pages
+
+
+class TestArchive:
+
+    @pytest.mark.django_db
+    def test_rows_round_trip(self, idle_class_room):
+        rows = list(idle_class_room.events.order_by('id').values_list(
+            'id', 'action', 'user_id', 'to_phase_id', 'timer', 'created_at'))
+        assert decode_rows(encode_rows(rows)) == rows
+
+    @pytest.mark.django_db
+    def test_archive_class_room(self, idle_class_room):
+        count = idle_class_room.events.count()
+        archive = archive_class_room(idle_class_room)
+        assert archive.event_count == count
+        assert archive.first_created_at == START
+        assert not Event.objects.filter(class_room=idle_class_room).exists()
+        assert ClassRoom.objects.get(pk=idle_class_room.pk).archived
+        assert len(archived_rows(idle_class_room.pk)) == count
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_api_output_is_unchanged(self, settings, request_factory, idle_class_room, compact):
+        settings.ACTIO_READ_CACHE = None
+        settings.ACTIO_COMPACT_SERIALIZERS = compact
+        pk = idle_class_room.pk
+        cursor = idle_class_room.events.order_by('id')[3].id
+
+        def outputs():
+            return (
+                without_version(get(request_factory, ClassRoomDetail, '/', pk=pk)),
+                without_version(get(request_factory, ClassRoomDetail, '/', {'expand': 'events'}, pk=pk)),
+                without_version(get(request_factory, ClassRoomDetail, '/', {'latest': 4}, pk=pk)),
+                event_pages(request_factory, idle_class_room),
+                get(request_factory, ClassRoomSync, '/sync', {'since': cursor}, pk=pk),
+                get(request_factory, ClassRoomSync, '/sync', {'since': cursor, 'limit': 3}, pk=pk),
+                get(request_factory, ClassRoomState, '/state', {'at': (START + timedelta(minutes=5)).isoformat()},
+                    pk=pk),
+            )
+
+        before = outputs()
+        archive_class_room(idle_class_room)
+        assert outputs() == before
+
+    @pytest.mark.django_db
+    def test_replay_uses_final_checkpoint(self, idle_class_room, django_assert_num_queries):
+        expected = replay(idle_class_room.pk)
+        archive_class_room(idle_class_room)
+        with django_assert_num_queries(2):
+            state = replay(idle_class_room.pk, archived=True)
+        assert (state.event_id, state.current_phase_id, state.timer, list(state.attending)) == (
+            expected.event_id, expected.current_phase_id, expected.timer, list(expected.attending))
+
+    @pytest.mark.django_db
+    def test_write_restores_events(self, authorized_user, idle_class_room):
+        ids = list(idle_class_room.events.order_by('id').values_list('id', flat=True))
+        archive_class_room(idle_class_room)
+        class_room = ClassRoom.objects.get(pk=idle_class_room.pk)
+        class_room.join(authorized_user)
+        assert not ClassRoomArchive.objects.exists()
+        assert not ClassRoom.objects.get(pk=class_room.pk).archived
+        assert list(class_room.events.order_by('id').values_list('id', flat=True))[:-1] == ids
+
+    @pytest.mark.django_db
+    def test_write_through_an_instance_loaded_before_archiving(self, authorized_user, idle_class_room):
+        ids = list(idle_class_room.events.order_by('id').values_list('id', flat=True))
+        loaded = ClassRoom.objects.get(pk=idle_class_room.pk)
+        archive_class_room(ClassRoom.objects.get(pk=idle_class_room.pk))
+        assert not loaded.archived
+
+        loaded.join(authorized_user)
+        assert not ClassRoomArchive.objects.exists()
+        assert not ClassRoom.objects.get(pk=loaded.pk).archived
+        assert list(loaded.events.order_by('id').values_list('id', flat=True))[:-1] == ids
+
+    @pytest.mark.django_db
+    def test_idleness_is_checked_when_archiving(self, authorized_user, idle_class_room):
+        # Listed as idle, then written to before its turn came.
+        listed = ClassRoom.objects.get(pk=idle_class_room.pk)
+        idle_class_room.join(authorized_user)
+        assert archive_class_room(listed, timedelta(days=1)) is None
+        assert not ClassRoomArchive.objects.exists()
+        assert idle_class_room.events.count() == 13
+
+    @pytest.mark.django_db
+    def test_archived_only_once(self, idle_class_room):
+        loaded = ClassRoom.objects.get(pk=idle_class_room.pk)
+        archive = archive_class_room(idle_class_room)
+        assert archive_class_room(loaded) is None
+        assert loaded.archived
+        assert list(ClassRoomArchive.objects.all()) == [archive]
+
+    @pytest.mark.django_db
+    def test_events_committed_meanwhile_are_kept(self, monkeypatch, authorized_user, idle_class_room):
+        encode = archive.encode_rows
+
+        def encode_rows(rows):
+            # Not locked out like writers are, e.g. the event buffer.
+            Event.objects.create(class_room=idle_class_room, user=authorized_user)
+            return encode(rows)
+
+        monkeypatch.setattr(archive, 'encode_rows', encode_rows)
+        ids = list(idle_class_room.events.values_list('id', flat=True))
+        assert archive_class_room(idle_class_room) is None
+        assert not ClassRoomArchive.objects.exists()
+        assert not ClassRoom.objects.get(pk=idle_class_room.pk).archived
+        assert list(idle_class_room.events.values_list('id', flat=True)) == ids
+
+    @pytest.mark.django_db
+    def test_versions_follow_referenced_users_and_phases(self, course, idle_class_room):
+        archive = archive_class_room(idle_class_room)
+        student = User.objects.get(username='student0')
+        assert set(archive.users.all()) == set(User.objects.exclude(username='student2'))
+        assert set(archive.phases.all()) == set(course.phases.all())
+
+        def version():
+            return ClassRoom.objects.values_list('version', flat=True).get(pk=idle_class_room.pk)
+
+        before = version()
+        User.objects.create_user(username='stranger').save()
+        assert version() == before
+        student.username = 'renamed'
+        student.save()
+        assert version() == before + 1
+        phase = course.phases.first()
+        phase.title = 'Renamed'
+        phase.save()
+        assert version() == before + 2
+
+        restore_class_room(idle_class_room)
+        assert not ClassRoomArchive.users.through.objects.exists()
+
+    @pytest.mark.django_db
+    def test_deleted_users_are_dropped(self, idle_class_room):
+        archive_class_room(idle_class_room)
+        student = User.objects.get(username='student0')
+        student_events = [row for row in archived_rows(idle_class_room.pk) if row[2] == student.id]
+        assert student_events
+        student.delete()
+        assert not [row for row in archived_rows(idle_class_room.pk) if row[2] == student.id]
+        assert not idle_class_room.checkpoints.exists()
+
+        restore_class_room(idle_class_room)
+        assert not Event.objects.filter(user_id=student.id).exists()
+
+    @pytest.mark.django_db
+    def test_export_includes_archives(self, idle_class_room):
+        before = list(export_rows())
+        archive_class_room(idle_class_room)
+        assert list(export_rows()) == before
+        assert list(export_rows(since=START + timedelta(minutes=3), until=START + timedelta(minutes=5))) == [
+            row for row in before if START + timedelta(minutes=3) <= datetime.fromisoformat(
+                row[-1].replace('Z', '+00:00')) < START + timedelta(minutes=5)]
+
+    @pytest.mark.django_db
+    def test_command(self, authorized_user, course, idle_class_room):
+        recent = ClassRoom.kick_off(course, authorized_user)
+        stdout = io.StringIO()
+        call_command('archive_class_rooms', stdout=stdout)
+        assert 'Archived 1 class room(s), 12 events' in stdout.getvalue()
+        assert set(ClassRoom.objects.filter(archived=True)) == {idle_class_room}
+        assert not ClassRoom.objects.get(pk=recent.pk).archived
+
+        call_command('archive_class_rooms', '--restore', str(idle_class_room.pk), stdout=stdout)
+        assert 'Restored 1 class room(s)' in stdout.getvalue()
+        assert idle_class_room.events.count() == 12
+
+
+class TestArchiveReferencesMigration:
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('api', target)])
+        return executor.loader.project_state([('api', target)]).apps
+
+    @pytest.mark.django_db(transaction=True)
+    def test_existing_archives_get_their_references(self):
+        apps = self.migrate('0008_course_activity')
+        try:
+            Phase, Course = apps.get_model('api', 'Phase'), apps.get_model('api', 'Course')
+            ClassRoom = apps.get_model('api', 'ClassRoom')
+            ClassRoomArchive = apps.get_model('api', 'ClassRoomArchive')
+            user = apps.get_model('auth', 'User').objects.create(username='teacher')
+            phase = Phase.objects.create(title='Lobby')
+            class_room = ClassRoom.objects.create(course=Course.objects.create(title='Course'), archived=True)
+            # The second user and phase have been deleted since.
+            rows = [(1, 1, user.pk, phase.pk, 0, START), (2, 2, user.pk + 1, None, 0, START),
+                    (3, 1, None, phase.pk + 1, 0, START)]
+            ClassRoomArchive.objects.create(
+                class_room=class_room, event_count=3, first_event_id=1, last_event_id=3,
+                first_created_at=START, last_created_at=START, data=encode_rows(rows))
+
+            apps = self.migrate('0009_archive_references')
+            archive = apps.get_model('api', 'ClassRoomArchive').objects.get()
+            assert list(archive.users.values_list('pk', flat=True)) == [user.pk]
+            assert list(archive.phases.values_list('pk', flat=True)) == [phase.pk]
+        finally:
+            call_command('migrate', 'api', verbosity=0)
@@ -0,0 +1,102 @@
+import pytest
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import CachedTokenAuthentication
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course, class_room
+from api.views import JoinClassRoom
+
+
+@pytest.fixture
+def token(authorized_user):
+    return Token.objects.create(user=authorized_user)
+
+
+class TestCachedTokenAuthentication:
+
+    @pytest.mark.django_db
+    def test_credentials_are_cached(self, authorized_user, token, django_assert_num_queries):
+        authentication = CachedTokenAuthentication()
+        with django_assert_num_queries(1):
+            assert authentication.authenticate_credentials(token.key) == (authorized_user, token)
+        with django_assert_num_queries(0):
+            user, _ = authentication.authenticate_credentials(token.key)
+        assert user == authorized_user
+
+    @pytest.mark.django_db
+    def test_each_request_gets_its_own_user(self, authorized_user, token, django_assert_num_queries):
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(token.key)
+        first.is_staff = True
+        with django_assert_num_queries(0):
+            second, second_token = authentication.authenticate_credentials(token.key)
+            third, _ = authentication.authenticate_credentials(token.key)
+        assert second is not first and third is not second
+        assert not second.is_staff
+        assert second_token.user is second
+        assert (second.pk, second.username, second.password) == (
+            authorized_user.pk, authorized_user.username, authorized_user.password)
+        assert not second._state.adding
+
+    @pytest.mark.django_db
+    def test_unknown_keys_are_not_cached(self, token, django_assert_num_queries):
+        authentication = CachedTokenAuthentication()
+        for _ in range(2):
+            with django_assert_num_queries(1), pytest.raises(AuthenticationFailed):
+                authentication.authenticate_credentials('unknown')
+
+    @pytest.mark.django_db
+    def test_deleted_token(self, token):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+        token.delete()
+        with pytest.raises(AuthenticationFailed):
+            authentication.authenticate_credentials(token.key)
+
+    @pytest.mark.django_db
+    def test_deactivated_user(self, authorized_user, token):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+        authorized_user.is_active = False
+        authorized_user.save()
+        with pytest.raises(AuthenticationFailed):
+            authentication.authenticate_credentials(token.key)
+
+    @pytest.mark.django_db
+    def test_logins_keep_the_cache(self, authorized_user, token, django_assert_num_queries):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+        update_last_login(None, authorized_user)
+        with django_assert_num_queries(0):
+            authentication.authenticate_credentials(token.key)
+
+    @pytest.mark.django_db
+    def test_deleted_user(self, authorized_user, token):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+        authorized_user.delete()
+        with pytest.raises(AuthenticationFailed):
+            authentication.authenticate_credentials(token.key)
+
+    @pytest.mark.django_db
+    def test_disabled(self, monkeypatch, token, django_assert_num_queries):
+        monkeypatch.setattr('api.authentication.get_token_cache', lambda: None)
+        authentication = CachedTokenAuthentication()
+        for _ in range(2):
+            with django_assert_num_queries(1):
+                authentication.authenticate_credentials(token.key)
+
+    @pytest.mark.django_db
+    def test_write_requests_skip_token_queries(self, request_factory, token, class_room):
+        view = JoinClassRoom.as_view()
+        for expected in (True, False):
+            request = request_factory.post('join', HTTP_AUTHORIZATION='Token {}'.format(token.key))
+            with CaptureQueriesContext(connection) as context:
+                response = view(request, class_room_id=class_room.id)
+            assert response.status_code == status.HTTP_200_OK
+            assert any('authtoken_token' in query['sql'] for query in context.captured_queries) == expected
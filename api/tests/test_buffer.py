@@ -0,0 +1,162 @@
+import threading
+import pytest
+from django.contrib.auth.models import User
+from django.db import OperationalError, transaction
+
+from api.buffer import EventBuffer, get_event_buffer
+from api.constants import EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+from api.models import ClassRoom, Event
+from api.pubsub import get_broker
+from api.tests.fixtures import authorized_user, course, class_room
+
+
+class RecordingBuffer(EventBuffer):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.written = threading.Event()
+
+    def _write(self, batch):
+        self.batches.append(batch)
+        self.written.set()
+
+
+class FailingBuffer(RecordingBuffer):
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def _write(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise OperationalError('database is locked')
+        super()._write(batch)
+
+
+@pytest.fixture
+def event_buffer(monkeypatch):
+    buffer = EventBuffer()
+    monkeypatch.setattr('api.models.get_event_buffer', lambda: buffer)
+    return buffer
+
+
+class TestEventBuffer:
+
+    def test_disabled_by_default(self):
+        assert get_event_buffer() is None
+
+    @pytest.mark.django_db(transaction=True)
+    def test_join_is_written_on_flush(self, event_buffer, authorized_user, class_room):
+        class_room.join(authorized_user)
+
+        class_room.refresh_from_db()
+        assert class_room.attendance_count == 1
+        assert class_room.version == 1
+        assert not Event.objects.exists()
+        assert event_buffer.depth == 1
+
+        assert event_buffer.flush() == 1
+        event = Event.objects.get()
+        assert event.action == EVENT_ACTION_JOIN
+        assert event.user == authorized_user
+        assert event_buffer.depth == 0
+        stats = event_buffer.stats()
+        assert stats['flushes'] == 1
+        assert stats['flushed_events'] == 1
+        # The flush invalidates anything read between the write and itself.
+        assert ClassRoom.objects.get(pk=class_room.pk).version == 2
+
+    @pytest.mark.django_db(transaction=True)
+    def test_phase_changes_are_not_buffered(self, event_buffer, authorized_user, class_room):
+        class_room.kick_off(class_room.course, authorized_user)
+        assert Event.objects.filter(to_phase__isnull=False).exists()
+        assert all(event.action in (EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE)
+                   for event in event_buffer._pending)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_rolled_back_events_are_dropped(self, event_buffer, authorized_user, class_room):
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                class_room.join(authorized_user)
+                raise RuntimeError
+        assert event_buffer.depth == 0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_flush_broadcasts_saved_events(self, monkeypatch, event_buffer, authorized_user, class_room):
+        broker = get_broker()
+        published = []
+        monkeypatch.setattr(broker, 'subscriber_count', lambda class_room_id: 1)
+        monkeypatch.setattr(broker, 'publish',
+                            lambda class_room_id, message: published.append((class_room_id, message)))
+        class_room.join(authorized_user)
+        class_room.leave(authorized_user)
+        assert published == []
+        event_buffer.flush()
+        assert [class_room_id for class_room_id, _ in published] == [class_room.pk] * 2
+        assert '"id":' in published[0][1]
+
+    def test_worker_flushes_full_batches(self):
+        buffer = RecordingBuffer(max_batch_size=3, max_delay=60)
+        buffer.start()
+        try:
+            for event in range(3):
+                buffer.append(event)
+            assert buffer.written.wait(5)
+            assert buffer.batches == [[0, 1, 2]]
+        finally:
+            buffer.stop()
+
+    def test_worker_flushes_after_delay(self):
+        buffer = RecordingBuffer(max_batch_size=100, max_delay=0.01)
+        buffer.start()
+        try:
+            buffer.append('event')
+            assert buffer.written.wait(5)
+            assert buffer.batches == [['event']]
+        finally:
+            buffer.stop()
+
+    def test_stop_flushes_pending_events(self):
+        buffer = RecordingBuffer(max_batch_size=100, max_delay=60)
+        buffer.start()
+        buffer.append('event')
+        buffer.stop()
+        assert buffer.batches == [['event']]
+        assert buffer.depth == 0
+
+    def test_failed_flush_keeps_the_batch(self):
+        buffer = FailingBuffer(failures=1)
+        buffer.append(0)
+        buffer.append(1)
+        with pytest.raises(OperationalError):
+            buffer.flush()
+        buffer.append(2)
+        assert buffer.depth == 3
+        assert buffer.flush() == 3
+        assert buffer.batches == [[0, 1, 2]]
+        assert buffer.stats()['failed_flushes'] == 1
+
+    def test_worker_survives_failed_flushes(self):
+        buffer = FailingBuffer(failures=2, max_batch_size=100, max_delay=0.01)
+        buffer.start()
+        try:
+            buffer.append('event')
+            assert buffer.written.wait(5)
+            assert buffer.batches == [['event']]
+        finally:
+            buffer.stop()
+        assert buffer.stats()['failed_flushes'] == 2
+
+    @pytest.mark.django_db(transaction=True)
+    def test_events_of_deleted_users_are_dropped(self, event_buffer, authorized_user, class_room):
+        other = User.objects.create_user(username='other', password='12345')
+        class_room.join(authorized_user)
+        class_room.join(other)
+        other.delete()
+
+        assert event_buffer.flush() == 1
+        assert Event.objects.get().user == authorized_user
+        assert event_buffer.depth == 0
+        assert event_buffer.stats()['dropped_events'] == 1
@@ -0,0 +1,51 @@
+import pytest
+import time
+
+from api.cache import LRUCache
+from api.tests.fixtures import course, phase
+
+
+class TestLRUCache:
+
+    def test_get_and_set(self):
+        cache = LRUCache()
+        assert cache.get('key') is None
+        cache.set('key', b'value')
+        assert cache.get('key') == b'value'
+        assert cache.stats.as_dict() == {'hits': 1, 'misses': 1}
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_expires_entries(self):
+        cache = LRUCache(ttl=0.05)
+        cache.set('a', 1)
+        time.sleep(0.1)
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+
+class TestCourseRevision:
+
+    @pytest.mark.django_db
+    def test_revision_follows_course_changes(self, course, phase):
+        def revision():
+            course.refresh_from_db()
+            return course.revision
+
+        start = revision()
+        course.phases.add(phase)
+        assert revision() == start + 1
+        phase.title = 'renamed'
+        phase.save()
+        assert revision() == start + 2
+        phase.course_set.clear()
+        assert revision() == start + 3
@@ -0,0 +1,76 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from api import compact
+from api.models import ClassRoom, Course, Event, Phase
+from api.serializers import ClassRoomSerializer, CourseSerializer
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course
+from api.views import ClassRoomDetail, CourseDetail
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def class_room_instance(pk):
+    # What ClassRoomDetail loads when every field is requested.
+    return ClassRoom.objects.select_related('course', 'current_phase').prefetch_related(
+        'course__phases', 'attending',
+        Prefetch('events', queryset=Event.objects.select_related('to_phase', 'user'))).get(pk=pk)
+
+
+@pytest.fixture
+def busy_class_room(db, authorized_user, course):
+    course.phases.add(Phase.objects.create(title='Vote', timer=True))
+    other = User.objects.create_user(username='other', email='other@example.com', password='12345')
+    class_room = ClassRoom.kick_off(course, authorized_user)
+    ClassRoom.kick_off(course, other)
+    class_room.join(other)
+    for phase in course.phases.all():
+        class_room.change_phase(other, phase.id)
+    class_room.leave(authorized_user)
+    Course.objects.create(title='Empty')
+    return class_room
+
+
+class TestCompactSerializers:
+
+    @pytest.mark.django_db
+    def test_class_room_equivalence(self, busy_class_room):
+        instance = class_room_instance(busy_class_room.pk)
+        assert render(compact.serialize_class_room(busy_class_room.pk)) == \
+            render(ClassRoomSerializer(instance).data)
+
+    @pytest.mark.django_db
+    def test_class_room_without_events_equivalence(self, course):
+        class_room = ClassRoom.objects.create(course=course)
+        instance = class_room_instance(class_room.pk)
+        assert render(compact.serialize_class_room(class_room.pk)) == \
+            render(ClassRoomSerializer(instance).data)
+
+    @pytest.mark.django_db
+    def test_course_list_equivalence(self, busy_class_room):
+        courses = Course.objects.prefetch_related('phases', 'class_rooms').order_by('title')
+        assert render(compact.serialize_courses(Course.objects.order_by('title'))) == \
+            render(CourseSerializer(courses, many=True).data)
+
+    @pytest.mark.django_db
+    def test_missing_objects(self):
+        assert compact.serialize_class_room(1000) is None
+        assert compact.serialize_course(1000) is None
+
+    @pytest.mark.django_db
+    def test_views_use_compact_engine(self, settings, request_factory, busy_class_room):
+        settings.ACTIO_COMPACT_SERIALIZERS = True
+        request = request_factory.get(f'/classroom/{busy_class_room.id}/')
+        response = ClassRoomDetail.as_view()(request, pk=busy_class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == compact.serialize_class_room(busy_class_room.pk)
+
+        request = request_factory.get(f'/courses/{1000}/')
+        response = CourseDetail.as_view()(request, pk=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from api.models import ClassRoom, Event
+from api.tests.factory import request_factory
+from api.tests.fixtures import admin, authorized_user, course, class_room
+from api.views import ExportEvents
+
+
+@pytest.fixture
+def started_class_rooms(authorized_user, course):
+    return [ClassRoom.kick_off(course, authorized_user) for _ in range(2)]
+
+
+def export(request_factory, user, **params):
+    request = request_factory.get('events/export', params)
+    force_authenticate(request, user=user)
+    return ExportEvents.as_view()(request)
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode()
+
+
+class TestExportEvents:
+
+    @pytest.mark.django_db
+    def test_ndjson(self, request_factory, admin, authorized_user, started_class_rooms,
+                    django_assert_num_queries):
+        response = export(request_factory, admin)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        # The live log, then the (empty) list of archived class rooms.
+        with django_assert_num_queries(2):
+            rows = [json.loads(line) for line in content(response).splitlines()]
+
+        events = list(Event.objects.order_by('id'))
+        assert [row['id'] for row in rows] == [event.id for event in events]
+        assert rows[0] == {
+            'id': events[0].id,
+            'class_room': started_class_rooms[0].id,
+            'course': started_class_rooms[0].course_id,
+            'action': 'change_phase',
+            'user': authorized_user.id,
+            'to_phase': events[0].to_phase_id,
+            'timer': 0,
+            'created_at': events[0].created_at.isoformat().replace('+00:00', 'Z'),
+        }
+        assert rows[1]['action'] == 'join'
+
+    @pytest.mark.django_db
+    def test_csv_for_one_class_room(self, request_factory, admin, started_class_rooms):
+        class_room = started_class_rooms[1]
+        response = export(request_factory, admin, **{'as': 'csv', 'class_room': class_room.pk})
+        assert response['Content-Type'] == 'text/csv'
+        rows = list(csv.DictReader(io.StringIO(content(response))))
+        assert [int(row['id']) for row in rows] == list(
+            class_room.events.order_by('id').values_list('id', flat=True))
+        assert {row['class_room'] for row in rows} == {str(class_room.pk)}
+
+    @pytest.mark.django_db
+    def test_time_range(self, request_factory, admin, started_class_rooms):
+        Event.objects.filter(pk=Event.objects.order_by('id')[0].pk).update(
+            created_at=Event.objects.order_by('id')[1].created_at - timedelta(days=1))
+        since = Event.objects.order_by('id')[1].created_at
+        response = export(request_factory, admin, since=since.isoformat())
+        rows = content(response).splitlines()
+        assert len(rows) == Event.objects.count() - 1
+
+    @pytest.mark.django_db
+    def test_invalid_parameters(self, request_factory, admin):
+        assert export(request_factory, admin, **{'as': 'xml'}).status_code == status.HTTP_400_BAD_REQUEST
+        assert export(request_factory, admin, since='yesterday').status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.django_db
+    def test_admins_only(self, request_factory, authorized_user):
+        assert export(request_factory, authorized_user).status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.mark.django_db
+    def test_command(self, started_class_rooms, tmp_path):
+        stdout = io.StringIO()
+        call_command('export_events', '--course', str(started_class_rooms[0].course_id), stdout=stdout)
+        assert len(stdout.getvalue().splitlines()) == Event.objects.count()
+
+        output = tmp_path / 'events.csv'
+        call_command('export_events', '--as', 'csv', '--output', str(output),
+                     '--class-room', str(started_class_rooms[0].pk))
+        assert len(output.read_text().splitlines()) == started_class_rooms[0].events.count() + 1
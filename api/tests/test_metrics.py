@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+import time
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient, Client
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from api.metrics import Histogram, MetricsRegistry, RequestTimings, get_metrics
+from api.pubsub import get_broker
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course, class_room
+from api.views import Metrics
+
+
+@pytest.fixture
+def instrumented_client(settings):
+    settings.ACTIO_INSTRUMENTATION = True
+    get_metrics().clear()
+    yield Client()
+    get_metrics().clear()
+
+
+class TestHistogram:
+
+    def test_cumulative_buckets(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        assert histogram.as_dict() == {
+            'count': 4,
+            'sum': 56.5,
+            'buckets': {'1': 2, '10': 3, '+Inf': 4},
+        }
+
+    def test_registry_groups_by_view(self):
+        registry = MetricsRegistry()
+        timings = RequestTimings()
+        timings.queries, timings.total = 3, 0.004
+        registry.record('class_room_detail', timings)
+        registry.record('class_room_detail', timings)
+        metrics = registry.as_dict()['class_room_detail']
+        assert metrics['requests'] == 2
+        assert metrics['queries']['sum'] == 6
+        assert metrics['total']['buckets']['5'] == 2
+
+
+class TestInstrumentationMiddleware:
+
+    @pytest.mark.django_db
+    def test_disabled_by_default(self, client, class_room):
+        response = client.get('/api/classrooms/{}'.format(class_room.pk))
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header('Server-Timing')
+
+    @pytest.mark.django_db
+    def test_server_timing_and_metrics(self, instrumented_client, class_room,
+                                       django_assert_num_queries):
+        with django_assert_num_queries(2):
+            response = instrumented_client.get('/api/classrooms/{}?fields=id,attendance_count'
+                                               .format(class_room.pk))
+        assert response.status_code == status.HTTP_200_OK
+        server_timing = response['Server-Timing']
+        assert 'db;dur=' in server_timing
+        assert 'desc="2 queries"' in server_timing
+        for metric in ('serialize;dur=', 'render;dur=', 'total;dur='):
+            assert metric in server_timing
+
+        metrics = get_metrics().as_dict()['class_room_detail']
+        assert metrics['requests'] == 1
+        assert metrics['queries']['sum'] == 2
+        assert metrics['total']['count'] == 1
+        assert metrics['db']['sum'] <= metrics['total']['sum']
+
+    @pytest.mark.django_db
+    def test_unresolved_urls(self, instrumented_client):
+        response = instrumented_client.get('/api/nowhere')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert '<unresolved>' in get_metrics().as_dict()
+
+    @pytest.mark.django_db
+    def test_async_requests(self, instrumented_client, course, class_room):
+        async def scenario():
+            client = AsyncClient()
+            # Django 3.1's AsyncClient drops GET data: the query goes in the path.
+            waiting = asyncio.ensure_future(client.get(
+                '/api/classrooms/{}/wait?after=0&timeout=2'.format(class_room.pk)))
+            for _ in range(100):
+                if get_broker().subscriber_count(class_room.pk):
+                    break
+                await asyncio.sleep(0.01)
+            assert not waiting.done()
+            started_at = time.perf_counter()
+            response = await client.get('/api/courses/')
+            elapsed = time.perf_counter() - started_at
+            return response, elapsed, await waiting
+
+        response, elapsed, waited = async_to_sync(scenario)()
+        assert response.status_code == status.HTTP_200_OK
+        assert elapsed < 1
+        assert 'desc="0 queries"' not in response['Server-Timing']
+        assert waited.has_header('Server-Timing')
+        metrics = get_metrics().as_dict()
+        assert metrics['classes_list']['requests'] == 1
+        assert metrics['class_room_wait']['total']['sum'] >= 2
+
+
+class TestMetricsView:
+
+    @pytest.mark.django_db
+    def test_metrics_for_admins_only(self, request_factory, authorized_user):
+        request = request_factory.get('metrics')
+        force_authenticate(request, user=authorized_user)
+        assert Metrics.as_view()(request).status_code == status.HTTP_403_FORBIDDEN
+
+        admin = User.objects.create_superuser('admin', password='12345')
+        request = request_factory.get('metrics')
+        force_authenticate(request, user=admin)
+        response = Metrics.as_view()(request)
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data['read_cache']) == {'hits', 'misses'}
+        assert set(response.data['token_cache']) == {'hits', 'misses'}
+        assert response.data['event_buffer'] is None
+        assert set(response.data['write_lane']) == {'waiting', 'writes', 'mean_wait_seconds', 'max_wait_seconds'}
+        assert 'views' in response.data
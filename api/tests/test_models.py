@@ -1,5 +1,12 @@
+import io
 import pytest
 import time
+from datetime import datetime, timezone
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Max
 from django.db.utils import IntegrityError
 
 from api.constants import (
@@ -26,6 +33,22 @@ class TestPhase:
         with pytest.raises(IntegrityError):
             phase.save()
 
+class TestCourse:
+
+    @pytest.mark.django_db
+    def test_phase_ids_follow_revisions(self, course, django_assert_num_queries):
+        phases = set(course.phases.values_list('id', flat=True))
+        assert Course.objects.get(pk=course.pk).phase_ids() == phases
+        with django_assert_num_queries(1):
+            assert Course.objects.get(pk=course.pk).phase_ids() == phases
+
+        extra = Phase.objects.create(title='Extra')
+        course.phases.add(extra)
+        assert Course.objects.get(pk=course.pk).phase_ids() == phases | {extra.id}
+        extra.delete()
+        assert Course.objects.get(pk=course.pk).phase_ids() == phases
+
+
 class TestClassRoom:
 
     @pytest.mark.django_db
@@ -97,3 +120,200 @@ class TestClassRoom:
         assert class_room.events.all()[4].timer == 0
         assert class_room.events.all()[5].timer == 1
         assert class_room.events.all()[6].timer == 2
+
+    @pytest.mark.django_db
+    def test_snapshot_follows_events(self, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        assert class_room.current_phase_id == course.default_phase.id
+        assert class_room.timer == 0
+        assert class_room.phase_started_at == class_room.events.all()[0].created_at
+        assert class_room.attendance_count == 1
+
+        timed_phase = class_room.course.phases.all()[1]
+        class_room.change_phase(authorized_user, timed_phase.id)
+        time.sleep(1)
+        class_room.leave(authorized_user)
+        stored = ClassRoom.objects.get(pk=class_room.pk)
+        assert stored.current_phase_id == timed_phase.id
+        assert stored.phase_started_at == class_room.events.all()[2].created_at
+        assert stored.attendance_count == 0
+        assert stored._get_event_timer() >= 1
+
+    @pytest.mark.django_db
+    def test_writes_build_on_the_stored_snapshot(self, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        timed_phase = class_room.course.phases.all()[1]
+        first = ClassRoom.objects.get(pk=class_room.pk)
+        second = ClassRoom.objects.get(pk=class_room.pk)
+
+        first.change_phase(authorized_user, timed_phase.id)
+        second.leave(authorized_user)
+        stored = ClassRoom.objects.get(pk=class_room.pk)
+        assert stored.current_phase_id == timed_phase.id
+        assert stored.phase_started_at == first.phase_started_at
+        assert stored.attendance_count == 0
+        assert class_room.events.order_by('id').last().timer == 0
+
+    @pytest.mark.django_db
+    def test_rebuild_snapshot(self, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        class_room.change_phase(authorized_user, class_room.course.phases.all()[1].id)
+        expected = [getattr(class_room, field) for field in ('current_phase_id', 'timer',
+                    'phase_started_at', 'attendance_count')]
+        ClassRoom.objects.filter(pk=class_room.pk).update(current_phase=None, timer=42,
+                                                          phase_started_at=None, attendance_count=0)
+
+        call_command('rebuild_snapshots', class_room.pk)
+        class_room = ClassRoom.objects.get(pk=class_room.pk)
+        assert [getattr(class_room, field) for field in ('current_phase_id', 'timer',
+                'phase_started_at', 'attendance_count')] == expected
+
+    @pytest.mark.django_db
+    def test_apply_actions(self, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        other = User.objects.create_user(username='other', password='12345')
+        lobby, timed_phase = class_room.course.phases.all()
+        class_room.apply_actions([
+            (EVENT_ACTION_JOIN, other, None),
+            (EVENT_ACTION_CHANGE_PHASE, authorized_user, timed_phase),
+            (EVENT_ACTION_LEAVE, authorized_user, None),
+            (EVENT_ACTION_JOIN, authorized_user, None),
+            (EVENT_ACTION_LEAVE, other, None),
+        ])
+
+        events = list(class_room.events.order_by('id'))[2:]
+        assert [event.action for event in events] == [EVENT_ACTION_JOIN, EVENT_ACTION_CHANGE_PHASE,
+            EVENT_ACTION_LEAVE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE]
+        assert events[1].to_phase_id == timed_phase.id
+        assert list(class_room.attending.all()) == [authorized_user]
+
+        stored = ClassRoom.objects.get(pk=class_room.pk)
+        assert stored.current_phase_id == timed_phase.id
+        assert stored.phase_started_at == events[1].created_at
+        assert stored.attendance_count == 1
+
+    @pytest.mark.django_db
+    def test_apply_actions_query_count(self, authorized_user, class_room, django_assert_max_num_queries):
+        users = [User.objects.create_user(username='user{}'.format(i)) for i in range(40)]
+        # Savepoint and release, snapshot re-read, m2m insert, count, max id, bulk insert,
+        # re-read, snapshot and its new version, and the course activity update (with an
+        # insert and a retry, first in the hour).
+        with django_assert_max_num_queries(13):
+            class_room.apply_actions([(EVENT_ACTION_JOIN, user, None) for user in users])
+        assert class_room.events.count() == 40
+        assert class_room.attendance_count == 40
+
+    @pytest.mark.django_db
+    def test_kick_off_many(self, authorized_user, course, django_assert_max_num_queries):
+        User.objects.bulk_create([User(username='student{}'.format(i)) for i in range(1200)])
+        students = list(User.objects.filter(username__startswith='student').order_by('id'))
+        rosters = [students[i:i + 40] for i in range(0, 1200, 40)]
+
+        # ~1200 sequential requests used to take several thousand queries. The
+        # budget only grows with SQLite's bound on parameters per insert.
+        with django_assert_max_num_queries(25):
+            class_rooms = ClassRoom.kick_off_many(course, authorized_user, rosters)
+
+        assert len(class_rooms) == 30
+        class_room = ClassRoom.objects.get(pk=class_rooms[-1].pk)
+        assert list(class_room.attending.order_by('id')) == rosters[-1]
+        assert class_room.attendance_count == 40
+        assert class_room.current_phase_id == course.default_phase.id
+        events = list(class_room.events.order_by('id'))
+        assert len(events) == 41
+        assert events[0].action == EVENT_ACTION_CHANGE_PHASE
+        assert events[0].user == authorized_user
+        assert class_room.phase_started_at == events[0].created_at
+        assert {event.action for event in events[1:]} == {EVENT_ACTION_JOIN}
+
+    @pytest.mark.django_db
+    def test_enroll(self, class_room, django_assert_max_num_queries):
+        users = [User.objects.create_user(username='user{}'.format(i)) for i in range(40)]
+        with django_assert_max_num_queries(13):
+            class_room.enroll(users)
+        assert class_room.attending.count() == 40
+        assert class_room.events.filter(action=EVENT_ACTION_JOIN).count() == 40
+
+
+class TestGenerateData:
+
+    options = dict(users=40, courses=3, phases_per_course=4, rooms_per_course=3,
+                   events_per_room=60, attendees_per_room=10, chunk_size=50)
+
+    def snapshot(self):
+        return [(event.class_room.course.title, event.action, event.timer, event.created_at)
+                for event in Event.objects.select_related('class_room__course').order_by('id')]
+
+    @pytest.mark.django_db
+    def test_generate_data(self):
+        call_command('generate_data', '--until=2020-06-01', seed=1, stdout=io.StringIO(), **self.options)
+
+        assert User.objects.count() == 40
+        assert Course.objects.count() == 3
+        assert Event.objects.exists()
+        for class_room in ClassRoom.objects.all():
+            assert class_room.attendance_count == class_room.attending.count()
+            assert class_room.version == class_room.events.count()
+            generated = (class_room.current_phase_id, class_room.timer, class_room.phase_started_at)
+            class_room.rebuild_snapshot()
+            assert (class_room.current_phase_id, class_room.timer, class_room.phase_started_at) == generated
+
+    @pytest.mark.django_db
+    def test_generate_data_ends_at_until(self):
+        # Rooms starting within the last few minutes would otherwise run on for an hour.
+        call_command('generate_data', '--until=2020-06-01', '--days=0.01', seed=1, stdout=io.StringIO(),
+                     **self.options)
+        until = datetime(2020, 6, 1, tzinfo=timezone.utc)
+        assert Event.objects.aggregate(last=Max('created_at'))['last'] <= until
+        for class_room in ClassRoom.objects.all():
+            assert class_room.version == class_room.events.count()
+            assert class_room._get_event_timer(until) >= 0
+
+    @pytest.mark.django_db
+    def test_generate_data_is_reproducible(self):
+        call_command('generate_data', '--until=2020-06-01', seed=7, stdout=io.StringIO(), **self.options)
+        first = self.snapshot()
+        Event.objects.all().delete()
+        ClassRoom.objects.all().delete()
+        Course.objects.all().delete()
+        User.objects.all().delete()
+        call_command('generate_data', '--until=2020-06-01', seed=7, stdout=io.StringIO(), **self.options)
+        assert self.snapshot() == first
+
+
+class TestSnapshotMigration:
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('api', target)])
+        return executor.loader.project_state([('api', target)]).apps
+
+    @pytest.mark.django_db(transaction=True)
+    def test_existing_class_rooms_get_their_snapshot(self):
+        apps = self.migrate('0001_initial')
+        try:
+            Phase, Course = apps.get_model('api', 'Phase'), apps.get_model('api', 'Course')
+            ClassRoom, Event = apps.get_model('api', 'ClassRoom'), apps.get_model('api', 'Event')
+            user = apps.get_model('auth', 'User').objects.create(username='teacher')
+            lobby, quiz = Phase.objects.create(title='Lobby'), Phase.objects.create(title='Quiz', timer=True)
+            course = Course.objects.create(title='Course', default_phase=lobby)
+            started, idle = ClassRoom.objects.create(course=course), ClassRoom.objects.create(course=course)
+            started.attending.add(user)
+            moment = datetime(2020, 6, 1, 9, tzinfo=timezone.utc)
+            for to_phase, timer in ((lobby, 0), (quiz, 0), (None, 0), (lobby, 42)):
+                Event.objects.filter(pk=Event.objects.create(
+                    class_room=started, user=user, to_phase=to_phase, timer=timer,
+                    action=EVENT_ACTION_JOIN if to_phase is None else EVENT_ACTION_CHANGE_PHASE).pk
+                ).update(created_at=moment)
+            # Ties on created_at go to the latest id, like rebuild_snapshot.
+            Event.objects.filter(to_phase=quiz).update(created_at=moment.replace(hour=8))
+
+            apps = self.migrate('0002_classroom_snapshot')
+            ClassRoom = apps.get_model('api', 'ClassRoom')
+            assert (ClassRoom.objects.values_list('current_phase_id', 'timer', 'phase_started_at', 'attendance_count')
+                    .get(pk=started.pk)) == (lobby.pk, 42, moment, 1)
+            assert (ClassRoom.objects.values_list('current_phase_id', 'timer', 'phase_started_at', 'attendance_count')
+                    .get(pk=idle.pk)) == (None, 0, None, 0)
+        finally:
+            call_command('migrate', 'api', verbosity=0)
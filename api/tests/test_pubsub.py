@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import pytest
+from asgiref.sync import async_to_sync
+
+from api.constants import EVENT_ACTION_JOIN
+from api.pubsub import InProcessBroker, broadcast_events, get_broker
+from api.streaming import sse_events, websocket_events
+from api.tests.fixtures import authorized_user, course, class_room
+
+
+class TestInProcessBroker:
+
+    def test_fan_out_from_another_thread(self):
+        broker = InProcessBroker()
+
+        async def scenario():
+            subscriptions = [broker.subscribe(1) for _ in range(3)]
+            other_room = broker.subscribe(2)
+            publisher = threading.Thread(target=broker.publish, args=(1, 'hello'))
+            publisher.start()
+            publisher.join()
+            received = [await asyncio.wait_for(s.get(), 1) for s in subscriptions]
+            assert received == ['hello'] * 3
+            assert other_room.queue.empty()
+
+        asyncio.run(scenario())
+
+    def test_unsubscribe(self):
+        broker = InProcessBroker()
+
+        async def scenario():
+            subscription = broker.subscribe(1)
+            assert broker.subscriber_count(1) == 1
+            subscription.close()
+            assert broker.subscriber_count(1) == 0
+            broker.publish(1, 'hello')
+            await asyncio.sleep(0)
+            assert subscription.queue.empty()
+
+        asyncio.run(scenario())
+
+    def test_slow_subscriber_drops_oldest(self):
+        broker = InProcessBroker(max_queue_size=2)
+
+        async def scenario():
+            subscription = broker.subscribe(1)
+            for message in ('a', 'b', 'c'):
+                broker.publish(1, message)
+            await asyncio.sleep(0)
+            assert [await subscription.get(), await subscription.get()] == ['b', 'c']
+
+        asyncio.run(scenario())
+
+
+class TestBroadcast:
+
+    @pytest.mark.django_db
+    def test_broadcast_serialized_events(self, authorized_user, class_room):
+        class_room.join(authorized_user)
+        event = class_room.events.select_related('user').get()
+
+        async def scenario():
+            subscription = get_broker().subscribe(class_room.id)
+            try:
+                broadcast_events(class_room.id, [event])
+                message = json.loads(await asyncio.wait_for(subscription.get(), 1))
+            finally:
+                subscription.close()
+            assert message['id'] == event.id
+            assert message['action'] == EVENT_ACTION_JOIN
+            assert message['user']['id'] == authorized_user.id
+
+        asyncio.run(scenario())
+
+
+class TestStreaming:
+
+    @pytest.mark.django_db
+    def test_websocket_forwards_events(self, class_room):
+        async def scenario():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            task = asyncio.ensure_future(websocket_events({}, inbox.get, outbox.put, class_room.id))
+            assert (await asyncio.wait_for(outbox.get(), 1))['type'] == 'websocket.accept'
+
+            get_broker().publish(class_room.id, 'hello')
+            assert await asyncio.wait_for(outbox.get(), 1) == {'type': 'websocket.send', 'text': 'hello'}
+
+            await inbox.put({'type': 'websocket.disconnect'})
+            await asyncio.wait_for(task, 1)
+            assert get_broker().subscriber_count(class_room.id) == 0
+
+        async_to_sync(scenario)()
+
+    @pytest.mark.django_db
+    def test_websocket_unknown_class_room(self):
+        async def scenario():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            await asyncio.wait_for(websocket_events({}, inbox.get, outbox.put, 1000), 1)
+            assert await outbox.get() == {'type': 'websocket.close', 'code': 4404}
+
+        async_to_sync(scenario)()
+
+    @pytest.mark.django_db
+    def test_sse_forwards_events(self, class_room):
+        async def scenario():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            task = asyncio.ensure_future(sse_events({}, inbox.get, outbox.put, class_room.id))
+            start = await asyncio.wait_for(outbox.get(), 1)
+            assert start['status'] == 200
+
+            get_broker().publish(class_room.id, '{"id": 1}')
+            body = await asyncio.wait_for(outbox.get(), 1)
+            assert body['body'] == b'data: {"id": 1}\n\n'
+            assert body['more_body']
+
+            await inbox.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, 1)
+
+        async_to_sync(scenario)()
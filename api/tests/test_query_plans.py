@@ -0,0 +1,78 @@
+import pytest
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from api.models import ClassRoom, Event
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course, class_room
+from api.tests.plans import assert_no_full_scans
+from api.views import (
+  ClassRoomActions,
+  ClassRoomDetail,
+  ClassRoomEvents,
+  ClassRoomSync,
+  CourseDetail,
+  CourseList,
+  JoinClassRoom
+)
+
+
+@pytest.fixture
+def started_class_room(authorized_user, course):
+    return ClassRoom.kick_off(course, authorized_user)
+
+
+class TestEventQueryPlans:
+
+    @pytest.mark.django_db
+    def test_course_endpoints(self, request_factory, started_class_room):
+        course_id = started_class_room.course_id
+        with assert_no_full_scans():
+            CourseList.as_view()(request_factory.get('courses'))
+            CourseDetail.as_view()(request_factory.get('courses'), pk=course_id)
+
+    @pytest.mark.django_db
+    def test_class_room_detail(self, request_factory, started_class_room):
+        view = ClassRoomDetail.as_view()
+        with assert_no_full_scans():
+            view(request_factory.get('classrooms'), pk=started_class_room.pk)
+            view(request_factory.get('classrooms', {'latest': 10}), pk=started_class_room.pk)
+
+    @pytest.mark.django_db
+    def test_class_room_events(self, request_factory, started_class_room):
+        view = ClassRoomEvents.as_view()
+        with assert_no_full_scans():
+            response = view(request_factory.get('events', {'page_size': 1}), pk=started_class_room.pk)
+            view(request_factory.get(response.data['next']), pk=started_class_room.pk)
+
+    @pytest.mark.django_db
+    def test_class_room_sync(self, request_factory, started_class_room):
+        with assert_no_full_scans():
+            ClassRoomSync.as_view()(request_factory.get('sync', {'since': 0}), pk=started_class_room.pk)
+
+    @pytest.mark.django_db
+    def test_class_room_writes(self, request_factory, authorized_user, started_class_room):
+        started_class_room.leave(authorized_user)
+        with assert_no_full_scans():
+            request = request_factory.post('join')
+            force_authenticate(request, user=authorized_user)
+            response = JoinClassRoom.as_view()(request, class_room_id=started_class_room.pk)
+            assert response.status_code == status.HTTP_200_OK
+            request = request_factory.post('actions', {'actions': [{'action': 'leave'}]}, format='json')
+            force_authenticate(request, user=authorized_user)
+            response = ClassRoomActions.as_view()(request, class_room_id=started_class_room.pk)
+            assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.django_db
+    def test_rebuild_snapshot(self, started_class_room):
+        with assert_no_full_scans():
+            started_class_room.rebuild_snapshot()
+
+    @pytest.mark.django_db
+    def test_unindexed_query_is_reported(self, started_class_room):
+        with pytest.raises(AssertionError, match='SCAN api_event'):
+            with assert_no_full_scans():
+                list(Event.objects.filter(timer=0))
+        with pytest.raises(AssertionError, match='TEMP B-TREE'):
+            with assert_no_full_scans():
+                list(started_class_room.events.order_by('timer'))
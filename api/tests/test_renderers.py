@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import gzip
+import pytest
+import time
+from asgiref.sync import async_to_sync
+from decimal import Decimal
+from django.http import HttpResponse
+from django.test import AsyncClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api import middleware, renderers
+from api.middleware import CompressionMiddleware
+from api.pubsub import get_broker
+from api.tests.fixtures import course, class_room
+from api.renderers import FastJSONRenderer
+
+PAYLOAD = {
+    'id': 1,
+    'title': 'Mathématiques\u2028line',
+    'phases': [{'id': 1, 'timer': True}, {'id': 2, 'timer': False}],
+    'created_at': datetime.datetime(2020, 9, 14, 3, 44, 1, 123456, tzinfo=datetime.timezone.utc),
+    'price': Decimal('1.50'),
+    'nothing': None,
+}
+
+
+class TestFastJSONRenderer:
+
+    def test_same_bytes_as_json_renderer(self):
+        assert FastJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+
+    def test_indent_falls_back(self):
+        rendered = FastJSONRenderer().render(PAYLOAD, 'application/json; indent=2')
+        assert rendered == JSONRenderer().render(PAYLOAD, 'application/json; indent=2')
+
+    def test_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(renderers, 'orjson', None)
+        assert FastJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+
+    def test_empty(self):
+        assert FastJSONRenderer().render(None) == b''
+
+
+def build_middleware(content, **headers):
+    def get_response(request):
+        response = HttpResponse(content, content_type='application/json')
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    return CompressionMiddleware(get_response)
+
+
+class TestCompressionMiddleware:
+
+    def test_gzip_above_threshold(self, settings):
+        settings.ACTIO_COMPRESSION_MIN_SIZE = 100
+        content = b'{"events": [' + b'{"id": 1},' * 100 + b'{}]}'
+        request = APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = build_middleware(content, ETag='"abc"')(request)
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['Vary'] == 'Accept-Encoding'
+        assert response['ETag'] == 'W/"abc"'
+        assert gzip.decompress(response.content) == content
+
+    def test_brotli_preferred(self, settings, monkeypatch):
+        class FakeBrotli:
+            @staticmethod
+            def compress(content):
+                return b'br' + content[:10]
+        monkeypatch.setattr(middleware, 'brotli', FakeBrotli)
+        settings.ACTIO_COMPRESSION_MIN_SIZE = 100
+        request = APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        response = build_middleware(b'x' * 200)(request)
+        assert response['Content-Encoding'] == 'br'
+
+    def test_small_body_untouched(self, settings):
+        settings.ACTIO_COMPRESSION_MIN_SIZE = 1024
+        request = APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = build_middleware(b'x' * 200)(request)
+        assert not response.has_header('Content-Encoding')
+        assert response.content == b'x' * 200
+
+    def test_client_without_compression(self, settings):
+        settings.ACTIO_COMPRESSION_MIN_SIZE = 100
+        request = APIRequestFactory().get('/')
+        response = build_middleware(b'x' * 200)(request)
+        assert not response.has_header('Content-Encoding')
+        assert response['Vary'] == 'Accept-Encoding'
+
+    @pytest.mark.django_db
+    def test_async_requests_do_not_wait_for_long_polls(self, class_room):
+        # A sync-only middleware would run every ASGI request, waits included,
+        # on the one thread that runs synchronous code.
+        async def scenario():
+            client = AsyncClient()
+            # Django 3.1's AsyncClient drops GET data: the query goes in the path.
+            waiting = asyncio.ensure_future(client.get(
+                '/api/classrooms/{}/wait?after=0&timeout=2'.format(class_room.pk)))
+            for _ in range(100):
+                if get_broker().subscriber_count(class_room.pk):
+                    break
+                await asyncio.sleep(0.01)
+            assert not waiting.done()
+            started_at = time.perf_counter()
+            response = await client.get('/api/courses/', HTTP_ACCEPT_ENCODING='gzip')
+            elapsed = time.perf_counter() - started_at
+            return response, elapsed, await waiting
+
+        response, elapsed, waited = async_to_sync(scenario)()
+        assert response.status_code == 200
+        assert elapsed < 1
+        assert waited.status_code == 200
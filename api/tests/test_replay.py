@@ -0,0 +1,142 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework import status
+
+from api.models import ClassRoom, ClassRoomCheckpoint, Event
+from api.replay import replay
+from api.tests.factory import request_factory
+from api.tests.fixtures import authorized_user, course, class_room
+from api.tests.plans import assert_no_full_scans
+from api.views import ClassRoomState
+
+START = datetime(2020, 6, 1, 9, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def busy_class_room(authorized_user, course):
+    """
+    A class room with 30 events, one minute apart from START on.
+    """
+    students = [User.objects.create_user(username='student{}'.format(i)) for i in range(5)]
+    phases = list(course.phases.order_by('id'))
+    class_room = ClassRoom.kick_off(course, authorized_user)
+    for i in range(28):
+        if i % 4 == 3:
+            class_room.change_phase(authorized_user, phases[i % 2].id)
+        elif i % 4 == 2:
+            class_room.leave(students[i % 5])
+        else:
+            class_room.join(students[i % 5])
+    for minute, event in enumerate(class_room.events.order_by('id')):
+        Event.objects.filter(pk=event.pk).update(created_at=START + timedelta(minutes=minute))
+    return class_room.rebuild_snapshot()
+
+
+def snapshot(class_room):
+    return (class_room.current_phase_id, class_room.timer, class_room.phase_started_at,
+            set(class_room.attending.values_list('id', flat=True)))
+
+
+def state_tuple(state):
+    return (state.current_phase_id, state.timer, state.phase_started_at, set(state.attending))
+
+
+class TestReplay:
+
+    @pytest.mark.django_db
+    def test_replay_matches_snapshot(self, busy_class_room):
+        assert state_tuple(replay(busy_class_room.pk)) == snapshot(busy_class_room)
+
+    @pytest.mark.django_db
+    def test_replay_at_a_moment(self, authorized_user, busy_class_room):
+        state = replay(busy_class_room.pk, START + timedelta(minutes=1, seconds=30))
+        events = list(busy_class_room.events.order_by('id'))
+        assert state.event_id == events[1].id
+        assert state.current_phase_id == busy_class_room.course.default_phase_id
+        assert state.phase_started_at == START
+        assert list(state.attending) == [authorized_user.id]
+
+        before = replay(busy_class_room.pk, START - timedelta(seconds=1))
+        assert before.event_id is None
+        assert before.current_phase_id is None
+
+    @pytest.mark.django_db
+    def test_checkpoints(self, settings, busy_class_room, django_assert_num_queries):
+        settings.ACTIO_CHECKPOINT_INTERVAL = 7
+        expected = state_tuple(replay(busy_class_room.pk))
+        checkpoints = list(busy_class_room.checkpoints.order_by('event_id'))
+        assert len(checkpoints) == 4
+
+        # Each replay starts from the closest checkpoint and gets the same state.
+        moment = START + timedelta(minutes=20)
+        with django_assert_num_queries(2):
+            from_checkpoint = state_tuple(replay(busy_class_room.pk, moment, archived=False))
+        ClassRoomCheckpoint.objects.all().delete()
+        settings.ACTIO_CHECKPOINT_INTERVAL = 0
+        assert state_tuple(replay(busy_class_room.pk, moment)) == from_checkpoint
+        assert state_tuple(replay(busy_class_room.pk)) == expected
+
+    @pytest.mark.django_db
+    def test_recent_events_are_not_checkpointed(self, settings, authorized_user, class_room):
+        settings.ACTIO_CHECKPOINT_INTERVAL = 1
+        class_room.join(authorized_user)
+        replay(class_room.pk)
+        assert not class_room.checkpoints.exists()
+
+    @pytest.mark.django_db
+    def test_replay_uses_indexes(self, settings, busy_class_room):
+        settings.ACTIO_CHECKPOINT_INTERVAL = 7
+        replay(busy_class_room.pk)
+        with assert_no_full_scans():
+            replay(busy_class_room.pk, START + timedelta(minutes=20))
+
+    @pytest.mark.django_db
+    def test_deleting_a_user_drops_checkpoints(self, settings, busy_class_room):
+        settings.ACTIO_CHECKPOINT_INTERVAL = 7
+        replay(busy_class_room.pk)
+        User.objects.get(username='student0').delete()
+        assert not busy_class_room.checkpoints.exists()
+        assert 'student0' not in {user.username for user in busy_class_room.attending.all()}
+        assert state_tuple(replay(busy_class_room.pk)) == snapshot(busy_class_room)
+
+    @pytest.mark.django_db
+    def test_check_drift_command(self, busy_class_room):
+        stdout = io.StringIO()
+        call_command('rebuild_snapshots', '--check', stdout=stdout)
+        assert '0 class room(s) drifted' in stdout.getvalue()
+
+        ClassRoom.objects.filter(pk=busy_class_room.pk).update(timer=12345)
+        call_command('rebuild_snapshots', '--check', stdout=stdout)
+        assert 'Class room {} drifted'.format(busy_class_room.pk) in stdout.getvalue()
+
+
+class TestClassRoomState:
+
+    @pytest.mark.django_db
+    def test_state_at(self, request_factory, authorized_user, busy_class_room):
+        at = START + timedelta(minutes=1, seconds=30)
+        request = request_factory.get('state', {'at': at.isoformat()})
+        response = ClassRoomState.as_view()(request, pk=busy_class_room.pk)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['current_phase']['id'] == busy_class_room.course.default_phase_id
+        assert response.data['attendance_count'] == 1
+        assert response.data['attending'] == [authorized_user.id]
+        assert response.data['at'] == '2020-06-01T09:01:30Z'
+
+    @pytest.mark.django_db
+    def test_state_now(self, request_factory, busy_class_room):
+        response = ClassRoomState.as_view()(request_factory.get('state'), pk=busy_class_room.pk)
+        assert response.data['timer'] == busy_class_room.timer
+        assert response.data['attendance_count'] == busy_class_room.attendance_count
+        assert response.data['cursor'] == busy_class_room.events.order_by('-created_at', '-id')[0].id
+
+    @pytest.mark.django_db
+    def test_state_errors(self, request_factory, class_room):
+        view = ClassRoomState.as_view()
+        response = view(request_factory.get('state', {'at': 'yesterday'}), pk=class_room.pk)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert view(request_factory.get('state'), pk=1000).status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,115 @@
+import threading
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+from api.models import ClassRoom
+from api.sqlite import WriteLane, get_write_lane, serialized_write
+from api.tests.fixtures import authorized_user, course, class_room
+
+
+def pragma(wrapper, name):
+    with wrapper.cursor() as cursor:
+        cursor.execute('PRAGMA {}'.format(name))
+        return cursor.fetchone()[0]
+
+
+class TestPragmas:
+
+    @pytest.mark.django_db
+    def test_applied_on_connection(self):
+        assert pragma(connection, 'synchronous') == 1  # normal
+        assert pragma(connection, 'temp_store') == 2  # memory
+        assert pragma(connection, 'cache_size') == -20000
+
+    @pytest.mark.django_db
+    def test_file_database_uses_wal(self, tmp_path):
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': str(tmp_path / 'db.sqlite3')})
+        try:
+            assert pragma(wrapper, 'journal_mode') == 'wal'
+            assert pragma(wrapper, 'busy_timeout') == 20000
+        finally:
+            wrapper.close()
+
+    @pytest.mark.django_db
+    def test_disabled(self, settings, tmp_path):
+        settings.ACTIO_SQLITE_PRAGMAS = {}
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': str(tmp_path / 'db.sqlite3')})
+        try:
+            assert pragma(wrapper, 'journal_mode') == 'delete'
+        finally:
+            wrapper.close()
+
+
+class TestWriteLane:
+
+    def test_writers_queue(self):
+        lane = WriteLane()
+        entered = threading.Event()
+
+        def write():
+            with lane:
+                entered.set()
+
+        with lane:
+            writer = threading.Thread(target=write)
+            writer.start()
+            assert not entered.wait(0.1)
+            assert lane.stats()['waiting'] == 1
+        writer.join()
+        assert entered.is_set()
+        stats = lane.stats()
+        assert stats['writes'] == 2
+        assert stats['waiting'] == 0
+        assert stats['max_wait_seconds'] >= 0.1
+
+    def test_reentrant(self):
+        lane = WriteLane()
+        with lane:
+            with lane:
+                pass
+        assert lane.stats()['writes'] == 2
+
+    def test_disabled(self, settings):
+        settings.ACTIO_WRITE_LANE = False
+        assert get_write_lane() is None
+        assert serialized_write(lambda value: value * 2)(21) == 42
+
+    @pytest.mark.django_db
+    def test_class_room_writes_go_through_it(self, authorized_user, class_room):
+        writes = get_write_lane().writes
+        class_room.join(authorized_user)
+        class_room.leave(authorized_user)
+        assert get_write_lane().writes == writes + 2
+
+    @pytest.mark.django_db(transaction=True)
+    def test_burst_of_writers_on_stale_instances(self, class_room):
+        users = [User.objects.create_user(username='student{}'.format(i)) for i in range(8)]
+        # Loaded before any of them writes, like requests queued on the lane.
+        instances = [ClassRoom.objects.get(pk=class_room.pk) for _ in users]
+        timed_phase = class_room.course.phases.get(timer=True)
+        class_room.change_phase(users[0], timed_phase.id)
+        errors = []
+
+        def join(instance, user):
+            try:
+                instance.join(user)
+            except Exception as error:  # pragma: no cover - reported below
+                errors.append(error)
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=join, args=pair) for pair in zip(instances, users)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        assert errors == []
+        stored = ClassRoom.objects.get(pk=class_room.pk)
+        assert stored.current_phase_id == timed_phase.id
+        assert stored.phase_started_at == class_room.phase_started_at
+        assert stored.attendance_count == len(users)
+        assert stored.version == len(users) + 1
+        assert sorted(instance.version for instance in instances) == list(range(2, len(users) + 2))
@@ -1,5 +1,8 @@
+import asyncio
 import pytest
 import json
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
 from api.tests.factory import request_factory
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -10,15 +13,24 @@ from api.constants import (
     EVENT_ACTION_JOIN,
     EVENT_ACTION_LEAVE
 )
+from api.cache import get_read_cache
+from api.models import ClassRoom
+from api.pubsub import get_broker
 from api.tests.fixtures import authorized_user, course, class_room, phase
 from api.views import (
   ChangePhase,
+  ClassRoomActions,
   ClassRoomDetail,
+  ClassRoomEvents,
+  ClassRoomSync,
   CourseDetail,
   CourseList,
   CreateClassRoom,
+  EnrollClassRoom,
   JoinClassRoom,
-  LeaveClassRoom
+  KickOffClassRooms,
+  LeaveClassRoom,
+  WaitForEvent
 )
 
 class TestCourseList:
@@ -31,6 +43,29 @@ class TestCourseList:
         assert response.status_code == status.HTTP_200_OK
         assert response.data[0]['id'] == course.id
 
+    @pytest.mark.django_db
+    def test_course_list_not_modified(self, request_factory, course):
+        view = CourseList.as_view()
+        etag = view(request_factory.get('courses'))['ETag']
+        response = view(request_factory.get('courses', HTTP_IF_NONE_MATCH=etag))
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        course.title = 'Algebra'
+        course.save()
+        response = view(request_factory.get('courses', HTTP_IF_NONE_MATCH=etag))
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    @pytest.mark.django_db
+    def test_course_list_sparse_fields(self, request_factory, course, django_assert_num_queries):
+        request = request_factory.get('courses', {'fields': 'id,title'})
+        view = CourseList.as_view()
+        # ETag version, then the courses alone: no phases, no class rooms.
+        with django_assert_num_queries(2):
+            response = view(request)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{'id': course.id, 'title': course.title}]
+
 class TestCourseDetail:
 
     @pytest.mark.django_db
@@ -45,6 +80,37 @@ class TestCourseDetail:
         assert response.data['phases'][1]['id'] == course.phases.last().id
         assert response.data['class_rooms'] == []
 
+    @pytest.mark.django_db
+    def test_course_detail_cached_until_revision_changes(self, request_factory, authorized_user, course):
+        view = CourseDetail.as_view()
+        first = view(request_factory.get(f'/courses/{course.id}/'), pk=course.id)
+        first.render()
+        cached = view(request_factory.get(f'/courses/{course.id}/'), pk=course.id)
+        assert cached.content == first.content
+
+        ClassRoom.kick_off(course, authorized_user)
+        response = view(request_factory.get(f'/courses/{course.id}/'), pk=course.id)
+        assert len(response.data['class_rooms']) == 1
+
+    @pytest.mark.django_db
+    def test_course_detail_not_modified(self, request_factory, course, phase):
+        view = CourseDetail.as_view()
+        etag = view(request_factory.get(f'/courses/{course.id}/'), pk=course.id)['ETag']
+        response = view(request_factory.get(f'/courses/{course.id}/', HTTP_IF_NONE_MATCH=etag), pk=course.id)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        course.phases.add(phase)
+        response = view(request_factory.get(f'/courses/{course.id}/', HTTP_IF_NONE_MATCH=etag), pk=course.id)
+        assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.django_db
+    def test_course_detail_collapsed_phases(self, request_factory, course):
+        request = request_factory.get(f'/courses/{course.id}/', {'expand': ''})
+        view = CourseDetail.as_view()
+        response = view(request, pk=course.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['phases'] == [phase.id for phase in course.phases.all()]
+
     @pytest.mark.django_db
     def test_course_detail_wrong_id(self, request_factory):
         request = request_factory.get(f'/courses/1000/')
@@ -71,6 +137,316 @@ class TestClassRoomDetail:
         response = view(request, pk=1000)
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
+    @pytest.mark.django_db
+    def test_class_room_detail_sparse_fields(self, request_factory, authorized_user, course,
+                                             django_assert_num_queries):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        request = request_factory.get(f'/classroom/{class_room.id}/', {'fields': 'id,attendance_count'})
+        view = ClassRoomDetail.as_view()
+        # Version for ETag and cache, then the room row alone.
+        with django_assert_num_queries(2):
+            response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'id': class_room.id, 'attendance_count': 1}
+
+    @pytest.mark.django_db
+    def test_class_room_detail_expand(self, request_factory, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        request = request_factory.get(f'/classroom/{class_room.id}/', {'expand': 'attending'})
+        view = ClassRoomDetail.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['course'] == course.id
+        assert response.data['current_phase'] == course.default_phase.id
+        assert response.data['events'] == list(class_room.events.values_list('id', flat=True))
+        assert response.data['attending'][0]['username'] == authorized_user.username
+
+    @pytest.mark.django_db
+    def test_class_room_detail_latest_events(self, request_factory, authorized_user, class_room):
+        for _ in range(3):
+            class_room.join(authorized_user)
+        events = list(class_room.events.order_by('id'))
+        request = request_factory.get(f'/classroom/{class_room.id}/', {'latest': 2})
+        view = ClassRoomDetail.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert [event['id'] for event in response.data['events']] == [events[1].id, events[2].id]
+        assert 'cursor=' in response.data['events_next']
+        assert f'/classrooms/{class_room.id}/events' in response.data['events_next']
+        assert len(response.data['attending']) == 1
+
+    @pytest.mark.django_db
+    def test_class_room_detail_latest_wrong_value(self, request_factory, class_room):
+        request = request_factory.get(f'/classroom/{class_room.id}/', {'latest': 'all'})
+        view = ClassRoomDetail.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.django_db
+    def test_class_room_detail_cached_until_next_event(self, request_factory, authorized_user, class_room):
+        stats = get_read_cache().stats.as_dict()
+        view = ClassRoomDetail.as_view()
+        first = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)
+        first.render()
+        cached = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)
+        assert cached.status_code == status.HTTP_200_OK
+        assert cached.content == first.content
+        assert get_read_cache().stats.hits == stats['hits'] + 1
+        assert get_read_cache().stats.misses == stats['misses'] + 1
+
+        class_room.join(authorized_user)
+        response = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)
+        assert len(response.data['events']) == 1
+
+    @pytest.mark.django_db
+    def test_class_room_detail_cache_follows_concurrent_writes(self, request_factory, authorized_user,
+                                                               class_room):
+        other = User.objects.create_user(username='other', password='12345')
+        first = ClassRoom.objects.get(pk=class_room.pk)
+        second = ClassRoom.objects.get(pk=class_room.pk)
+        view = ClassRoomDetail.as_view()
+
+        first.join(authorized_user)
+        view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id).render()
+        second.join(other)
+        response = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)
+        assert {user['id'] for user in response.data['attending']} == {authorized_user.id, other.id}
+        assert ClassRoom.objects.get(pk=class_room.pk).version == second.version == first.version + 1
+
+    @pytest.mark.django_db
+    def test_class_room_detail_html_not_cached(self, request_factory, authorized_user, class_room):
+        hits = get_read_cache().stats.hits
+        view = ClassRoomDetail.as_view()
+        for _ in range(2):
+            request = request_factory.get(f'/classroom/{class_room.id}/', HTTP_ACCEPT='text/html')
+            force_authenticate(request, user=authorized_user)
+            response = view(request, pk=class_room.id)
+            assert response.status_code == status.HTTP_200_OK
+            response.render()
+            assert response['Content-Type'].startswith('text/html')
+        assert get_read_cache().stats.hits == hits
+        assert len(get_read_cache()) == 0
+
+    @pytest.mark.django_db
+    def test_class_room_detail_not_modified(self, request_factory, authorized_user, class_room):
+        view = ClassRoomDetail.as_view()
+        etag = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)['ETag']
+        request = request_factory.get(f'/classroom/{class_room.id}/', HTTP_IF_NONE_MATCH=etag)
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+        class_room.join(authorized_user)
+        request = request_factory.get(f'/classroom/{class_room.id}/', HTTP_IF_NONE_MATCH=etag)
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    @pytest.mark.django_db
+    def test_class_room_detail_etag_follows_users_and_phases(self, request_factory, authorized_user,
+                                                             course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        view = ClassRoomDetail.as_view()
+
+        def etag():
+            return view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)['ETag']
+
+        first = etag()
+        authorized_user.username = 'renamed'
+        authorized_user.save()
+        second = etag()
+        assert second != first
+        cached = view(request_factory.get(f'/classroom/{class_room.id}/'), pk=class_room.id)
+        assert json.loads(cached.content)['attending'][0]['username'] == 'renamed'
+
+        lobby = course.default_phase
+        course.phases.remove(lobby)
+        third = etag()
+        lobby.title = 'Hall'
+        lobby.save()
+        assert etag() != third
+
+
+class TestClassRoomEvents:
+
+    @pytest.mark.django_db
+    def test_class_room_events_pages(self, request_factory, authorized_user, class_room):
+        for _ in range(5):
+            class_room.join(authorized_user)
+        expected = list(class_room.events.order_by('-id').values_list('id', flat=True))
+        view = ClassRoomEvents.as_view()
+
+        seen = []
+        request = request_factory.get(f'/classroom/{class_room.id}/events', {'page_size': 2})
+        while request is not None:
+            response = view(request, pk=class_room.id)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['results']) <= 2
+            seen += [event['id'] for event in response.data['results']]
+            next_link = response.data['next']
+            request = request_factory.get(next_link) if next_link else None
+        assert seen == expected
+
+    @pytest.mark.django_db
+    def test_class_room_events_pages_through_ties(self, request_factory, class_room,
+                                                  django_assert_max_num_queries):
+        # A bulk write gives every event the same created_at.
+        class_room.enroll([User.objects.create_user(username=f'student{i}') for i in range(9)])
+        expected = list(class_room.events.order_by('-id').values_list('id', flat=True))
+        view = ClassRoomEvents.as_view()
+
+        pages = []
+        request = request_factory.get(f'/classroom/{class_room.id}/events', {'page_size': 2})
+        while request is not None:
+            with django_assert_max_num_queries(2) as context:
+                response = view(request, pk=class_room.id)
+            assert not any('OFFSET' in query['sql'] for query in context.captured_queries)
+            pages.append([event['id'] for event in response.data['results']])
+            next_link = response.data['next']
+            request = request_factory.get(next_link) if next_link else None
+        assert [event_id for page in pages for event_id in page] == expected
+
+        previous_link = response.data['previous']
+        assert [event['id'] for event in view(request_factory.get(previous_link),
+                                              pk=class_room.id).data['results']] == pages[-2]
+
+    @pytest.mark.django_db
+    def test_class_room_events_wrong_id(self, request_factory):
+        request = request_factory.get(f'/classroom/{1000}/events')
+        view = ClassRoomEvents.as_view()
+        response = view(request, pk=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+class TestClassRoomSync:
+
+    @pytest.mark.django_db
+    def test_class_room_sync_changes(self, request_factory, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        cursor = class_room.events.order_by('id').first().id
+        request = request_factory.get(f'/classroom/{class_room.id}/sync', {'since': cursor})
+        view = ClassRoomSync.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['cursor'] == class_room.events.order_by('id').last().id
+        assert len(response.data['events']) == 1
+        assert response.data['events'][0]['action'] == EVENT_ACTION_JOIN
+        assert response.data['attending'][0]['id'] == authorized_user.id
+        assert response.data['current_phase']['id'] == course.default_phase.id
+
+    @pytest.mark.django_db
+    def test_class_room_sync_phase_only(self, request_factory, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        cursor = class_room.events.order_by('id').last().id
+        class_room.change_phase(authorized_user, course.phases.all()[1].id)
+        request = request_factory.get(f'/classroom/{class_room.id}/sync', {'since': cursor})
+        view = ClassRoomSync.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['events']) == 1
+        assert 'attending' not in response.data
+
+    @pytest.mark.django_db
+    def test_class_room_sync_not_modified(self, request_factory, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        cursor = class_room.events.order_by('id').last().id
+        request = request_factory.get(f'/classroom/{class_room.id}/sync', {'since': cursor})
+        view = ClassRoomSync.as_view()
+        response = view(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    @pytest.mark.django_db
+    def test_class_room_sync_batches(self, monkeypatch, request_factory, authorized_user, course):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        for _ in range(3):
+            class_room.leave(authorized_user)
+            class_room.join(authorized_user)
+        expected = list(class_room.events.order_by('id').values_list('id', flat=True))
+        view = ClassRoomSync.as_view()
+
+        seen, since, has_more = [], 0, True
+        while has_more:
+            request = request_factory.get(f'/classroom/{class_room.id}/sync', {'since': since, 'limit': 3})
+            response = view(request, pk=class_room.id)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['events']) <= 3
+            seen += [event['id'] for event in response.data['events']]
+            since, has_more = response.data['cursor'], response.data['has_more']
+        assert seen == expected
+
+        monkeypatch.setattr(ClassRoomSync, 'max_limit', 2)
+        request = request_factory.get(f'/classroom/{class_room.id}/sync', {'limit': 1000})
+        assert len(view(request, pk=class_room.id).data['events']) == 2
+        request = request_factory.get(f'/classroom/{class_room.id}/sync', {'limit': 0})
+        assert view(request, pk=class_room.id).status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.django_db
+    def test_class_room_sync_wrong_id(self, request_factory):
+        request = request_factory.get(f'/classroom/{1000}/sync', {'since': 0})
+        view = ClassRoomSync.as_view()
+        response = view(request, pk=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+def wait_for_event(request, **kwargs):
+    async def view():
+        return await WaitForEvent.as_view()(request, **kwargs)
+    return async_to_sync(view)()
+
+class TestWaitForEvent:
+
+    @pytest.mark.django_db
+    def test_wait_returns_existing_events(self, request_factory, authorized_user, class_room):
+        class_room.join(authorized_user)
+        request = request_factory.get(f'/classroom/{class_room.id}/wait', {'after': 0})
+        response = wait_for_event(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        data = json.loads(response.content)
+        assert data['cursor'] == class_room.events.get().id
+        assert data['events'][0]['action'] == EVENT_ACTION_JOIN
+
+    @pytest.mark.django_db
+    def test_wait_times_out(self, request_factory, class_room):
+        request = request_factory.get(f'/classroom/{class_room.id}/wait', {'after': 0, 'timeout': 0.1})
+        response = wait_for_event(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.content) == {'cursor': 0, 'events': []}
+
+    @pytest.mark.django_db
+    def test_wait_wakes_up_on_new_event(self, request_factory, authorized_user, class_room):
+        request = request_factory.get(f'/classroom/{class_room.id}/wait', {'after': 0, 'timeout': 5})
+
+        async def scenario():
+            waiting = asyncio.ensure_future(WaitForEvent.as_view()(request, pk=class_room.id))
+            while not get_broker().subscriber_count(class_room.id):
+                await asyncio.sleep(0.01)
+            await sync_to_async(class_room.join)(authorized_user)
+            # Tests never commit, so publish what on_commit would have published.
+            get_broker().publish(class_room.id, 'new event')
+            return await asyncio.wait_for(waiting, 1)
+
+        response = async_to_sync(scenario)()
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.content)['events'][0]['action'] == EVENT_ACTION_JOIN
+
+    @pytest.mark.django_db
+    def test_wait_wrong_params(self, request_factory, class_room):
+        request = request_factory.get(f'/classroom/{class_room.id}/wait', {'timeout': 'soon'})
+        response = wait_for_event(request, pk=class_room.id)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.django_db
+    def test_wait_wrong_id(self, request_factory):
+        request = request_factory.get(f'/classroom/{1000}/wait', {'after': 0})
+        response = wait_for_event(request, pk=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.django_db
+    def test_wait_through_the_request_handler(self, client, authorized_user, class_room):
+        event = class_room.join(authorized_user).events.last()
+        response = client.get('/api/classrooms/{}/wait'.format(class_room.pk),
+                              {'after': event.id - 1, 'timeout': 1})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['cursor'] == event.id
+
 class TestCreateClassRoom:
 
     @pytest.mark.django_db
@@ -98,6 +474,8 @@ class TestCreateClassRoom:
 
         assert len(response.data['attending']) == 1
         assert response.data['attending'][0]['id'] == authorized_user.id
+        assert response.data['current_phase']['id'] == course.default_phase.id
+        assert response.data['attendance_count'] == 1
 
     @pytest.mark.django_db
     def test_create_class_room_wrong_param_value(self, request_factory, authorized_user):
@@ -213,6 +591,50 @@ class TestChangePhase:
         response = view(request, class_room_id=class_room.id)
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    @pytest.mark.django_db
+    def test_change_phase_query_count(self, request_factory, authorized_user, course,
+                                      django_assert_max_num_queries):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        token = Token.objects.create(user=authorized_user)
+        phase_ids = list(course.phases.order_by('id').values_list('id', flat=True))
+        view = ChangePhase.as_view()
+
+        def change_phase(to_phase_id):
+            request = request_factory.post(f'/classroom/{class_room.id}/', {'to_phase_id': to_phase_id},
+              HTTP_AUTHORIZATION='Token {}'.format(token.key))
+            return view(request, class_room_id=class_room.id)
+
+        change_phase(phase_ids[0])  # warms the token and phase caches
+        for events in (10, 100):
+            class_room.enroll([User.objects.create_user(username=f'student{events}-{i}')
+                               for i in range(events)])
+            # Class room, savepoint and release, snapshot re-read, event, course activity,
+            # snapshot and its new version, then the payload: phases, class rooms,
+            # attending, events and the new phase.
+            with django_assert_max_num_queries(13):
+                response = change_phase(phase_ids[1])
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data['current_phase']['id'] == phase_ids[1]
+            phase_ids.reverse()
+
+    @pytest.mark.django_db
+    def test_change_phase_follows_course_phases(self, request_factory, authorized_user, course, phase):
+        class_room = ClassRoom.kick_off(course, authorized_user)
+        token = Token.objects.create(user=authorized_user)
+        view = ChangePhase.as_view()
+
+        def change_phase(to_phase_id):
+            request = request_factory.post(f'/classroom/{class_room.id}/', {'to_phase_id': to_phase_id},
+              HTTP_AUTHORIZATION='Token {}'.format(token.key))
+            return view(request, class_room_id=class_room.id)
+
+        assert change_phase(phase.id).status_code == status.HTTP_400_BAD_REQUEST
+        assert change_phase('lobby').status_code == status.HTTP_400_BAD_REQUEST
+        course.phases.add(phase)
+        assert change_phase(phase.id).status_code == status.HTTP_200_OK
+        course.phases.remove(phase)
+        assert change_phase(phase.id).status_code == status.HTTP_400_BAD_REQUEST
+
     def test_change_phase_success(self, request_factory, authorized_user, class_room):
         to_phase = class_room.course.phases.first()
         request = request_factory.post(f'/classroom/{class_room.id}/', {'to_phase_id': to_phase.id},
@@ -230,3 +652,118 @@ class TestChangePhase:
         view = ChangePhase.as_view()
         response = view(request, class_room_id=class_room.id)
         assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class TestClassRoomActions:
+
+    @pytest.mark.django_db
+    def test_actions_no_user(self, request_factory, class_room):
+        request = request_factory.post(f'/classroom/{class_room.id}/actions', {'actions': []}, format='json')
+        view = ClassRoomActions.as_view()
+        response = view(request, class_room_id=class_room.id)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.django_db
+    def test_actions_success(self, request_factory, authorized_user, class_room):
+        other = User.objects.create_user(username='other', password='12345')
+        to_phase = class_room.course.phases.last()
+        actions = [
+            {'action': 'join'},
+            {'action': 'join', 'user_id': other.id},
+            {'action': 'change_phase', 'to_phase_id': to_phase.id},
+        ]
+        request = request_factory.post(f'/classroom/{class_room.id}/actions', {'actions': actions},
+          format='json', HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = ClassRoomActions.as_view()
+        response = view(request, class_room_id=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert [event['action'] for event in response.data['events']] == [
+            EVENT_ACTION_JOIN, EVENT_ACTION_JOIN, EVENT_ACTION_CHANGE_PHASE]
+        assert response.data['events'][1]['user']['id'] == other.id
+        assert response.data['current_phase']['id'] == to_phase.id
+        assert response.data['attendance_count'] == 2
+
+    @pytest.mark.django_db
+    def test_actions_invalid(self, request_factory, authorized_user, class_room, phase):
+        token = Token.objects.create(user=authorized_user)
+        view = ClassRoomActions.as_view()
+        for actions in ([], [{'action': 'dance'}], [{'action': 'change_phase'}],
+                        [{'action': 'change_phase', 'to_phase_id': phase.id}],
+                        [{'action': 'join', 'user_id': 1000}]):
+            request = request_factory.post(f'/classroom/{class_room.id}/actions', {'actions': actions},
+              format='json', HTTP_AUTHORIZATION='Token {}'.format(token))
+            response = view(request, class_room_id=class_room.id)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert class_room.events.count() == 0
+
+    @pytest.mark.django_db
+    def test_actions_wrong_class_room_id(self, request_factory, authorized_user):
+        request = request_factory.post(f'/classroom/{1000}/actions', {'actions': [{'action': 'join'}]},
+          format='json', HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = ClassRoomActions.as_view()
+        response = view(request, class_room_id=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+class TestKickOffClassRooms:
+
+    @pytest.mark.django_db
+    def test_kick_off_no_user(self, request_factory, course):
+        request = request_factory.post(f'/courses/{course.id}/kick_off', {'rosters': [[]]}, format='json')
+        view = KickOffClassRooms.as_view()
+        response = view(request, course_id=course.id)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.django_db
+    def test_kick_off_success(self, request_factory, authorized_user, course):
+        other = User.objects.create_user(username='other', password='12345')
+        request = request_factory.post(f'/courses/{course.id}/kick_off',
+          {'rosters': [[authorized_user.id, other.id], [other.id]]}, format='json',
+          HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = KickOffClassRooms.as_view()
+        response = view(request, course_id=course.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert [room['attendance_count'] for room in response.data] == [2, 1]
+        assert response.data[0]['current_phase']['id'] == course.default_phase.id
+        assert ClassRoom.objects.get(pk=response.data[1]['id']).events.count() == 2
+
+    @pytest.mark.django_db
+    def test_kick_off_wrong_params(self, request_factory, authorized_user, course):
+        token = Token.objects.create(user=authorized_user)
+        view = KickOffClassRooms.as_view()
+        for data in ({}, {'rosters': []}, {'rosters': [[1000]]}):
+            request = request_factory.post(f'/courses/{course.id}/kick_off', data, format='json',
+              HTTP_AUTHORIZATION='Token {}'.format(token))
+            response = view(request, course_id=course.id)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not ClassRoom.objects.exists()
+
+    @pytest.mark.django_db
+    def test_kick_off_wrong_course_id(self, request_factory, authorized_user):
+        request = request_factory.post(f'/courses/{1000}/kick_off', {'rosters': [[]]}, format='json',
+          HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = KickOffClassRooms.as_view()
+        response = view(request, course_id=1000)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+class TestEnrollClassRoom:
+
+    @pytest.mark.django_db
+    def test_enroll_success(self, request_factory, authorized_user, class_room):
+        other = User.objects.create_user(username='other', password='12345')
+        request = request_factory.post(f'/classroom/{class_room.id}/enroll',
+          {'user_ids': [authorized_user.id, other.id]}, format='json',
+          HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = EnrollClassRoom.as_view()
+        response = view(request, class_room_id=class_room.id)
+        assert response.status_code == status.HTTP_200_OK
+        assert {user['id'] for user in response.data['attending']} == {authorized_user.id, other.id}
+        assert len(response.data['events']) == 2
+
+    @pytest.mark.django_db
+    def test_enroll_unknown_user(self, request_factory, authorized_user, class_room):
+        request = request_factory.post(f'/classroom/{class_room.id}/enroll',
+          {'user_ids': [authorized_user.id, 1000]}, format='json',
+          HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=authorized_user)))
+        view = EnrollClassRoom.as_view()
+        response = view(request, class_room_id=class_room.id)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert class_room.events.count() == 0
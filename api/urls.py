@@ -3,22 +3,44 @@ from rest_framework.authtoken.views import obtain_auth_token
 
 from .views import (
   ChangePhase,
+  ClassRoomActions,
   ClassRoomDetail,
+  ClassRoomEvents,
+  ClassRoomState,
+  ClassRoomSync,
+  CourseActivityReport,
+  CourseAnalytics,
   CourseDetail,
   CourseList,
   CreateClassRoom,
+  EnrollClassRoom,
+  ExportEvents,
   JoinClassRoom,
-  LeaveClassRoom
+  KickOffClassRooms,
+  LeaveClassRoom,
+  Metrics,
+  WaitForEvent
 )
 
 
 urlpatterns = [
     path("courses/", CourseList.as_view(), name="classes_list"),
     path("courses/<int:pk>", CourseDetail.as_view(), name="class_detail"),
+    path("courses/<int:pk>/activity", CourseActivityReport.as_view(), name="course_activity"),
+    path("courses/<int:pk>/analytics", CourseAnalytics.as_view(), name="course_analytics"),
+    path("courses/<int:course_id>/kick_off", KickOffClassRooms.as_view(), name="kick_off_class_rooms"),
     path("classrooms/<int:pk>", ClassRoomDetail.as_view(), name="class_room_detail"),
+    path("classrooms/<int:pk>/events", ClassRoomEvents.as_view(), name="class_room_events"),
+    path("classrooms/<int:pk>/state", ClassRoomState.as_view(), name="class_room_state"),
+    path("classrooms/<int:pk>/sync", ClassRoomSync.as_view(), name="class_room_sync"),
+    path("classrooms/<int:pk>/wait", WaitForEvent.as_view(), name="class_room_wait"),
     path("classrooms/", CreateClassRoom.as_view(), name="create_class_room"),
     path("classrooms/<int:class_room_id>/change_phase", ChangePhase.as_view(), name="change_phase"),
     path("classrooms/<int:class_room_id>/join", JoinClassRoom.as_view(), name="join_class_room"),
     path("classrooms/<int:class_room_id>/leave", LeaveClassRoom.as_view(), name="leave_class_room"),
+    path("classrooms/<int:class_room_id>/enroll", EnrollClassRoom.as_view(), name="enroll_class_room"),
+    path("classrooms/<int:class_room_id>/actions", ClassRoomActions.as_view(), name="class_room_actions"),
+    path("events/export", ExportEvents.as_view(), name="export_events"),
+    path("metrics", Metrics.as_view(), name="metrics"),
     path('auth/', obtain_auth_token, name='api_token_auth')
 ]
@@ -1,10 +1,9 @@
+from django.http import JsonResponse
 from rest_framework.response import Response
 
 
-def build_error_response(error_code, error_message):
-    response = Response()
-    response.status_code = error_code
-    response.data = {
+def build_error_data(error_code, error_message):
+    return {
         'errors': [
             {
                 'status': error_code,
@@ -12,4 +11,15 @@ def build_error_response(error_code, error_message):
             }
         ]
     }
+
+
+def build_error_response(error_code, error_message):
+    response = Response()
+    response.status_code = error_code
+    response.data = build_error_data(error_code, error_message)
     return response
+
+
+def build_error_json_response(error_code, error_message):
+    """Same payload as build_error_response, for plain Django views."""
+    return JsonResponse(build_error_data(error_code, error_message), status=error_code)
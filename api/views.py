@@ -1,32 +1,319 @@
-from django.db.models import Prefetch
-from django.http import Http404
+import asyncio
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Prefetch, Sum, prefetch_related_objects
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.timezone import now
+from django.views import View
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
-from .models import ClassRoom, Course, Event
-from .serializers import ClassRoomSerializer, CourseSerializer
-from .utils import build_error_response
+from . import compact
+from .aggregates import course_activity
+from .analytics import course_analytics
+from .archive import ArchivedEventList, archived_events, attach_archived_events
+from .buffer import get_event_buffer
+from .cache import get_read_cache, get_token_cache
+from .constants import (
+    EVENT_ACTION_CHANGE_PHASE,
+    EVENT_ACTION_JOIN,
+    EVENT_ACTION_LEAVE,
+    EVENT_ACTION_NAMES
+)
+from .export import CONTENT_TYPES, EXPORT_FORMATS, export_lines, export_rows
+from .metrics import get_metrics
+from .mixins import ConditionalGetMixin, SparseFieldsMixin, VersionedCacheMixin
+from .models import ClassRoom, Course, Event, Phase
+from .pagination import EventCursorPagination
+from .pubsub import get_broker
+from .replay import replay
+from .serializers import (
+    ActivitySerializer,
+    AnalyticsSerializer,
+    ClassRoomActionSerializer,
+    ClassRoomSerializer,
+    ClassRoomStateSerializer,
+    CourseActivitySerializer,
+    CourseSerializer,
+    CurrentUserSerializer,
+    EnrollSerializer,
+    EventExportSerializer,
+    EventSerializer,
+    KickOffSerializer,
+    ReplaySerializer
+)
+from .sqlite import get_write_lane
+from .utils import build_error_json_response, build_error_response
+
+
+def class_room_payload(class_room):
+    if compact.is_enabled():
+        return compact.serialize_class_room(class_room.pk)
+    # One query per relation, however many events the class room has.
+    prefetch_related_objects([class_room], 'course__phases', 'course__class_rooms', 'attending',
+                             Prefetch('events', queryset=Event.objects.select_related('to_phase', 'user')))
+    return ClassRoomSerializer(class_room).data
+
+
+def course_queryset(view):
+    courses = Course.objects.all()
+    if view.is_requested('phases'):
+        courses = courses.prefetch_related('phases')
+    if view.is_requested('class_rooms'):
+        courses = courses.prefetch_related(
+            Prefetch('class_rooms', queryset=ClassRoom.objects.only('id', 'course')))
+    return courses
 
 
-class CourseList(generics.ListAPIView):
-    queryset = Course.objects.prefetch_related('phases').order_by('title').all()
+class CourseList(ConditionalGetMixin, SparseFieldsMixin, generics.ListAPIView):
     serializer_class = CourseSerializer
 
+    def get_queryset(self):
+        return course_queryset(self).order_by('title')
 
-class CourseDetail(generics.RetrieveAPIView):
-    queryset = Course.objects.prefetch_related('phases').all()
+    def list(self, request, *args, **kwargs):
+        if compact.is_enabled() and not self.is_sparse():
+            return Response(compact.serialize_courses(Course.objects.order_by('title')))
+        return super().list(request, *args, **kwargs)
+
+    def get_version(self):
+        return tuple(Course.objects.aggregate(Count('id'), Max('id'), Sum('revision')).values())
+
+
+class CourseDetail(ConditionalGetMixin, VersionedCacheMixin, SparseFieldsMixin,
+                   generics.RetrieveAPIView):
     serializer_class = CourseSerializer
 
+    def get_queryset(self):
+        return course_queryset(self)
+
+    def get_version(self):
+        return Course.objects.filter(pk=self.kwargs['pk']).values_list('revision', flat=True).first()
+
+    def retrieve(self, request, *args, **kwargs):
+        if compact.is_enabled() and not self.is_sparse():
+            data = compact.serialize_course(self.kwargs['pk'])
+            if data is None:
+                raise Http404
+            return Response(data)
+        return super().retrieve(request, *args, **kwargs)
 
-class ClassRoomDetail(generics.RetrieveAPIView):
-    queryset = ClassRoom.objects.select_related('course').prefetch_related('attending',
-        Prefetch('events', queryset=Event.objects.select_related('to_phase', 'user'))).all()
+
+class ClassRoomDetail(ConditionalGetMixin, VersionedCacheMixin, SparseFieldsMixin,
+                      generics.RetrieveAPIView):
     serializer_class = ClassRoomSerializer
 
+    def get_version(self):
+        return ClassRoom.objects.filter(pk=self.kwargs['pk']).values_list(
+            'version', 'course__revision').first()
+
+    def get_queryset(self):
+        class_rooms = ClassRoom.objects.all()
+        if self.is_expanded('course'):
+            class_rooms = class_rooms.select_related('course').prefetch_related('course__phases')
+        if self.is_expanded('current_phase'):
+            class_rooms = class_rooms.select_related('current_phase')
+        if self.is_requested('attending'):
+            class_rooms = class_rooms.prefetch_related('attending')
+        if self.is_requested('events') and 'latest' not in self.request.query_params:
+            if self.is_expanded('events'):
+                events = Event.objects.select_related('to_phase', 'user')
+            else:
+                events = Event.objects.only('id', 'class_room')
+            class_rooms = class_rooms.prefetch_related(Prefetch('events', queryset=events))
+        return class_rooms
+
+    def get_object(self):
+        class_room = super().get_object()
+        if (class_room.archived and self.is_requested('events')
+                and 'latest' not in self.request.query_params):
+            attach_archived_events(class_room)
+        return class_room
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'latest' not in request.query_params:
+            if compact.is_enabled() and not self.is_sparse():
+                data = compact.serialize_class_room(self.kwargs['pk'])
+                if data is None:
+                    raise Http404
+                return Response(data)
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            latest = int(request.query_params['latest'])
+        except ValueError:
+            latest = 0
+        if latest <= 0:
+            return build_error_response(status.HTTP_400_BAD_REQUEST, 'latest must be a positive integer')
+
+        class_room = self.get_object()
+        fields = self.requested_fields() or set(ClassRoomSerializer.Meta.fields)
+        data = self.get_serializer(class_room, fields=fields - {'events'}).data
+        if 'events' not in fields:
+            return Response(data)
+
+        paginator = EventCursorPagination()
+        paginator.page_size = min(latest, paginator.max_page_size)
+        if class_room.archived:
+            events = ArchivedEventList(archived_events(class_room.pk))
+        else:
+            events = class_room.events.select_related('to_phase', 'user')
+        events = paginator.paginate_queryset(events, request, view=self)
+        # Older events are fetched from the paginated history endpoint.
+        paginator.base_url = request.build_absolute_uri(
+            reverse('class_room_events', kwargs={'pk': class_room.pk}))
+
+        if self.is_expanded('events'):
+            data['events'] = EventSerializer(reversed(events), many=True).data
+        else:
+            data['events'] = [event.pk for event in reversed(events)]
+        data['events_next'] = paginator.get_next_link()
+        return Response(data)
+
+
+class ClassRoomEvents(generics.ListAPIView):
+    serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+
+    def get_queryset(self):
+        class_room = get_object_or_404(ClassRoom.objects.only('id', 'archived'), pk=self.kwargs['pk'])
+        if class_room.archived:
+            return ArchivedEventList(archived_events(class_room.pk))
+        return class_room.events.select_related('to_phase', 'user')
+
+
+class ClassRoomSync(APIView):
+    """
+    The class room state with its events after `since`, at most `limit` of
+    them: `has_more` tells a client that is behind to ask again from
+    `cursor`.
+    """
+    default_limit = 100
+    max_limit = 500
+
+    def get(self, request, pk):
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return build_error_response(status.HTTP_400_BAD_REQUEST, 'since must be an event id')
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return build_error_response(status.HTTP_400_BAD_REQUEST, 'limit must be a positive number')
+
+        events = list(Event.objects.filter(class_room_id=pk, id__gt=since)
+                      .select_related('to_phase', 'user').order_by('id')[:limit + 1])
+        if not events:
+            archived = ClassRoom.objects.filter(pk=pk).values_list('archived', flat=True).first()
+            if archived is None:
+                raise Http404
+            if archived:
+                events = [event for event in archived_events(pk) if event.id > since][:limit + 1]
+            if not events:
+                return Response(status=status.HTTP_304_NOT_MODIFIED)
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        class_room = ClassRoom.objects.select_related('current_phase').get(pk=pk)
+        data = ClassRoomStateSerializer(class_room).data
+        data['cursor'] = events[-1].id
+        data['has_more'] = has_more
+        data['events'] = EventSerializer(events, many=True).data
+        if any(event.action in (EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE) for event in events):
+            data['attending'] = CurrentUserSerializer(class_room.attending.all(), many=True).data
+        return Response(data, status.HTTP_200_OK)
+
+
+class ClassRoomState(APIView):
+    """
+    The class room as its events left it at `at` (default: now), replayed
+    from the closest checkpoint: phase, timer, attendance and attendees.
+    """
+
+    def get(self, request, pk):
+        serializer = ReplaySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        at = serializer.validated_data.get('at') or now()
+        archived = get_object_or_404(ClassRoom.objects.only('id', 'archived'), pk=pk).archived
+
+        state = replay(pk, at, archived=archived)
+        class_room = ClassRoom(
+            id=pk, timer=state.timer, phase_started_at=state.phase_started_at,
+            current_phase=Phase.objects.filter(pk=state.current_phase_id).first()
+            if state.current_phase_id is not None else None,
+            attendance_count=len(state.attending))
+        data = ClassRoomStateSerializer(class_room).data
+        data['at'] = serializer.fields['at'].to_representation(at)
+        data['cursor'] = state.event_id
+        data['attending'] = list(state.attending)
+        return Response(data, status.HTTP_200_OK)
+
+
+@sync_to_async
+def serialized_events_after(class_room_id, after):
+    archived = ClassRoom.objects.filter(pk=class_room_id).values_list('archived', flat=True).first()
+    if archived is None:
+        return None
+    if archived:
+        events = [event for event in archived_events(class_room_id) if event.id > after]
+    else:
+        events = (Event.objects.filter(class_room_id=class_room_id, id__gt=after)
+                  .select_related('to_phase', 'user').order_by('id'))
+    return EventSerializer(events, many=True).data
+
+
+class WaitForEvent(View):
+    """
+    Long poll: answers as soon as the class room has an event newer than
+    `after`, or with an empty list once `timeout` seconds have passed.
+    Waiting happens on the event loop, woken up by the event broker.
+    """
+    default_timeout = 30
+    max_timeout = 60
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Django 3.1 only runs a view on the event loop when the view
+        # function itself is a coroutine function.
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    async def get(self, request, pk):
+        try:
+            after = int(request.GET['after'])
+            timeout = min(float(request.GET.get('timeout', self.default_timeout)), self.max_timeout)
+        except (KeyError, ValueError):
+            return build_error_json_response(status.HTTP_400_BAD_REQUEST,
+                                             'Need an event id in after and a number of seconds in timeout')
+
+        # Subscribe before looking at the database so no event can slip in between.
+        subscription = get_broker().subscribe(pk)
+        try:
+            events = await serialized_events_after(pk, after)
+            if events is None:
+                return build_error_json_response(status.HTTP_404_NOT_FOUND, 'Not found.')
+            if not events:
+                try:
+                    await asyncio.wait_for(subscription.get(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    return JsonResponse({'cursor': after, 'events': []})
+                events = await serialized_events_after(pk, after)
+        finally:
+            subscription.close()
+        return JsonResponse({'cursor': events[-1]['id'] if events else after, 'events': events})
+
 
 class CreateClassRoom(APIView):
     permission_classes = (IsAuthenticated,)
@@ -38,27 +325,63 @@ class CreateClassRoom(APIView):
         course = get_object_or_404(Course.objects.select_related('default_phase'), pk=course_id)
         class_room = ClassRoom.kick_off(course, request.user)
 
-        return Response(ClassRoomSerializer(class_room).data, status.HTTP_200_OK)
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
+
+class KickOffClassRooms(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, course_id):
+        serializer = KickOffSerializer(data=request.data)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        rosters = serializer.validated_data['rosters']
+
+        course = get_object_or_404(Course.objects.select_related('default_phase'), pk=course_id)
+        users = User.objects.in_bulk({user_id for roster in rosters for user_id in roster})
+        if any(user_id not in users for roster in rosters for user_id in roster):
+            return build_error_response(status.HTTP_400_BAD_REQUEST, 'Unknown user')
+
+        class_rooms = ClassRoom.kick_off_many(
+            course, request.user, [[users[user_id] for user_id in roster] for roster in rosters])
+        return Response(ClassRoomStateSerializer(class_rooms, many=True).data, status.HTTP_200_OK)
 
 class BaseClassRoomAction(APIView):
     permission_classes = (IsAuthenticated,)
 
     def retrieve_class_room(self, class_room_id):
-        return get_object_or_404(ClassRoom.objects.select_related('course'), pk=class_room_id)
+        return get_object_or_404(ClassRoom.objects.select_related('course', 'current_phase'),
+                                 pk=class_room_id)
 
 
 class JoinClassRoom(BaseClassRoomAction):
 
     def post(self, request, class_room_id):
         class_room = self.retrieve_class_room(class_room_id).join(request.user)
-        return Response(ClassRoomSerializer(class_room).data, status.HTTP_200_OK)
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
 
 
 class LeaveClassRoom(BaseClassRoomAction):
 
     def post(self, request, class_room_id):
         class_room = self.retrieve_class_room(class_room_id).leave(request.user)
-        return Response(ClassRoomSerializer(class_room).data, status.HTTP_200_OK)
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
+
+
+class EnrollClassRoom(BaseClassRoomAction):
+
+    def post(self, request, class_room_id):
+        serializer = EnrollSerializer(data=request.data)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        user_ids = serializer.validated_data['user_ids']
+
+        class_room = self.retrieve_class_room(class_room_id)
+        users = User.objects.in_bulk(user_ids)
+        if len(users) != len(set(user_ids)):
+            return build_error_response(status.HTTP_400_BAD_REQUEST, 'Unknown user')
+
+        class_room.enroll([users[user_id] for user_id in user_ids])
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
 
 
 class ChangePhase(BaseClassRoomAction):
@@ -70,8 +393,128 @@ class ChangePhase(BaseClassRoomAction):
 
         class_room = self.retrieve_class_room(class_room_id)
 
-        if int(to_phase_id) not in [phase.id for phase in class_room.course.phases.all()]:
+        try:
+            to_phase_id = int(to_phase_id)
+        except (TypeError, ValueError):
+            to_phase_id = None
+        if to_phase_id not in class_room.course.phase_ids():
             return build_error_response(status.HTTP_400_BAD_REQUEST, 'Can\'t go to this phase')
 
         class_room.change_phase(request.user, to_phase_id)
-        return Response(ClassRoomSerializer(class_room).data, status.HTTP_200_OK)
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
+
+
+class ClassRoomActions(BaseClassRoomAction):
+    max_actions = 500
+
+    def post(self, request, class_room_id):
+        actions = request.data.get('actions') if isinstance(request.data, dict) else None
+        serializer = ClassRoomActionSerializer(data=actions, many=True)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        if not 0 < len(serializer.validated_data) <= self.max_actions:
+            return build_error_response(status.HTTP_400_BAD_REQUEST,
+                                        'Need between 1 and {} actions'.format(self.max_actions))
+
+        class_room = self.retrieve_class_room(class_room_id)
+        users = User.objects.in_bulk({action.get('user_id', request.user.id)
+                                      for action in serializer.validated_data})
+        phases = {phase.id: phase for phase in class_room.course.phases.all()}
+
+        resolved = []
+        for action in serializer.validated_data:
+            user = users.get(action.get('user_id', request.user.id))
+            if user is None:
+                return build_error_response(status.HTTP_400_BAD_REQUEST, 'Unknown user')
+            to_phase = None
+            if action['action'] == 'change_phase':
+                to_phase = phases.get(action['to_phase_id'])
+                if to_phase is None:
+                    return build_error_response(status.HTTP_400_BAD_REQUEST, 'Can\'t go to this phase')
+            resolved.append((EVENT_ACTION_NAMES[action['action']], user, to_phase))
+
+        class_room.apply_actions(resolved)
+        return Response(class_room_payload(class_room), status.HTTP_200_OK)
+
+
+class CourseActivityReport(APIView):
+    """
+    Events, joins, leaves, phase changes and active class rooms of the
+    course per hour or per day (?period=day), read from CourseActivity.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, pk):
+        serializer = ActivitySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        course = get_object_or_404(Course.objects.only('id'), pk=pk)
+        rows = course_activity(course.pk, **serializer.validated_data)
+        return Response({
+            'course': course.pk,
+            'period': serializer.validated_data['period'],
+            'activity': CourseActivitySerializer(rows, many=True).data,
+        }, status.HTTP_200_OK)
+
+
+class CourseAnalytics(APIView):
+    """
+    Time spent per phase, attendance curve and timer totals over every class
+    room of the course, optionally within a [since, until) range.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, pk):
+        serializer = AnalyticsSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+        course = get_object_or_404(Course.objects.only('id'), pk=pk)
+        return Response(course_analytics(course, **serializer.validated_data), status.HTTP_200_OK)
+
+
+class Metrics(APIView):
+    """
+    Per URL name request histograms (when ACTIO_INSTRUMENTATION is on),
+    read and token cache hit rates, write-behind buffer and write lane state.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        read_cache = get_read_cache()
+        token_cache = get_token_cache()
+        event_buffer = get_event_buffer()
+        write_lane = get_write_lane()
+        return Response({
+            'views': get_metrics().as_dict(),
+            'read_cache': read_cache.stats.as_dict() if read_cache is not None else None,
+            'token_cache': token_cache.stats.as_dict() if token_cache is not None else None,
+            'event_buffer': event_buffer.stats() if event_buffer is not None else None,
+            'write_lane': write_lane.stats() if write_lane is not None else None,
+        }, status.HTTP_200_OK)
+
+
+class ExportEvents(APIView):
+    """
+    Streams events as NDJSON, or CSV with ?as=csv, optionally filtered by
+    class_room, course and a [since, until) range of creation times.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is not rendered by DRF, so accept whatever the client accepts.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        export_format = request.query_params.get('as', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return build_error_response(status.HTTP_400_BAD_REQUEST,
+                                        'as must be one of {}'.format(', '.join(EXPORT_FORMATS)))
+        serializer = EventExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return build_error_response(status.HTTP_400_BAD_REQUEST, serializer.errors)
+
+        response = StreamingHttpResponse(
+            export_lines(export_rows(**serializer.validated_data), export_format),
+            content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="events.{}"'.format(export_format)
+        return response
@@ -0,0 +1,61 @@
+"""
+Phase analytics over many class rooms, NumPy against the pure Python walk.
+
+The database is filled by the generate_data command until it holds about
+`--events` events, then reading the columns and each engine are timed.
+
+    python -m benchmarks.bench_analytics --events 10000000
+"""
+import argparse
+import io
+
+from benchmarks.common import measure, median, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=10000000)
+    parser.add_argument('--events-per-room', type=int, default=200)
+    parser.add_argument('--rooms-per-course', type=int, default=10)
+    parser.add_argument('--bucket', type=int, default=60)
+    parser.add_argument('--points', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+
+    from api.analytics import event_columns, numpy, summarize, summarize_vectorized
+
+    with test_database():
+        courses = max(1, args.events // (args.events_per_room * args.rooms_per_course))
+        call_command('generate_data', users=10000, courses=courses, events_per_room=args.events_per_room,
+                     rooms_per_course=args.rooms_per_course, stdout=io.StringIO())
+
+        columns = None
+
+        def read():
+            nonlocal columns
+            columns = event_columns()
+
+        read_time = median(measure(read, args.repeat))
+        events = len(columns)
+        print('{:>10} events  read columns {:9.1f}ms ({:6.3f}us/event)'.format(
+            events, read_time * 1000, read_time / events * 1e6))
+
+        engines = [('python', summarize)]
+        if numpy is not None:
+            engines.append(('numpy', summarize_vectorized))
+        else:
+            print('numpy is not installed, only the Python engine is measured')
+        timings = {}
+        for name, engine in engines:
+            timings[name] = median(measure(lambda: engine(columns, args.bucket, args.points), args.repeat))
+            print('{:>10} events  {:<12} {:9.1f}ms ({:6.3f}us/event)'.format(
+                events, name, timings[name] * 1000, timings[name] / events * 1e6))
+        if len(timings) == 2:
+            print('numpy is x{:.1f} faster'.format(timings['python'] / timings['numpy']))
+
+
+if __name__ == '__main__':
+    main()
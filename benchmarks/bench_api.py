@@ -0,0 +1,217 @@
+"""
+Throughput, latency and query count of every endpoint in api/urls.py.
+
+Requests go through the whole middleware stack with Django's test client,
+against a class room of `--events` events (several sizes can be given).
+Results are written as JSON; pass an earlier file to `--compare` to see
+how each endpoint moved.
+
+    python -m benchmarks.bench_api --events 10000 100000 --output before.json
+    python -m benchmarks.bench_api --events 10000 100000 --compare before.json
+"""
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import subprocess
+import time
+
+from benchmarks.common import median, percentile, seed_class_room, setup_django, test_database
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_courses(count, phases_per_course, rooms_per_course):
+    from api.models import ClassRoom, Course, Phase
+
+    Phase.objects.bulk_create(Phase(title='Phase {}'.format(i), timer=i % 2 == 1)
+                              for i in range(phases_per_course))
+    phases = list(Phase.objects.order_by('-id')[:phases_per_course])
+    first_id = Course.objects.count()
+    Course.objects.bulk_create(Course(title='Course {}'.format(first_id + i), default_phase=phases[0])
+                               for i in range(count))
+    courses = list(Course.objects.order_by('-id')[:count])
+    Course.phases.through.objects.bulk_create(
+        Course.phases.through(course=course, phase=phase) for course in courses for phase in phases)
+    ClassRoom.objects.bulk_create(ClassRoom(course=course, current_phase=phases[0])
+                                  for course in courses for _ in range(rooms_per_course))
+
+
+def scenarios(class_room, users):
+    """
+    (name, url name, method, path, body factory) of every benchmarked request.
+    Body factories get the iteration number, so writes can vary their input.
+    """
+    room = '/api/classrooms/{}'.format(class_room.pk)
+    course = class_room.course
+    last_event_id = class_room.events.order_by('-id').values_list('id', flat=True)[0]
+    phase_ids = itertools.cycle(course.phases.values_list('id', flat=True))
+    user_ids = [user.id for user in users]
+    return [
+        ('course list', 'classes_list', 'get', '/api/courses/', None),
+        ('course list, sparse', 'classes_list', 'get', '/api/courses/?fields=id,title', None),
+        ('course detail', 'class_detail', 'get', '/api/courses/{}'.format(course.pk), None),
+        ('class room detail', 'class_room_detail', 'get', room, None),
+        ('class room detail, latest 50', 'class_room_detail', 'get', room + '?latest=50', None),
+        ('class room detail, sparse', 'class_room_detail', 'get',
+         room + '?fields=id,current_phase,timer,attendance_count', None),
+        ('class room events', 'class_room_events', 'get', room + '/events?page_size=50', None),
+        ('class room sync', 'class_room_sync', 'get', room + '/sync?since={}'.format(last_event_id - 10), None),
+        ('class room state, now', 'class_room_state', 'get', room + '/state', None),
+        ('class room wait', 'class_room_wait', 'get',
+         room + '/wait?after={}&timeout=1'.format(last_event_id - 1), None),
+        ('course activity, hourly', 'course_activity', 'get',
+         '/api/courses/{}/activity'.format(course.pk), None),
+        ('course activity, daily', 'course_activity', 'get',
+         '/api/courses/{}/activity?period=day'.format(course.pk), None),
+        ('course analytics', 'course_analytics', 'get', '/api/courses/{}/analytics'.format(course.pk), None),
+        ('metrics', 'metrics', 'get', '/api/metrics', None),
+        ('export class room, ndjson', 'export_events', 'get',
+         '/api/events/export?class_room={}'.format(class_room.pk), None),
+        ('export class room, csv', 'export_events', 'get',
+         '/api/events/export?as=csv&class_room={}'.format(class_room.pk), None),
+        ('join', 'join_class_room', 'post', room + '/join', None),
+        ('leave', 'leave_class_room', 'post', room + '/leave', None),
+        ('change phase', 'change_phase', 'post', room + '/change_phase',
+         lambda i: {'to_phase_id': next(phase_ids)}),
+        ('actions, 100', 'class_room_actions', 'post', room + '/actions',
+         lambda i: {'actions': [{'action': ('join', 'leave')[j % 2], 'user_id': user_ids[j % len(user_ids)]}
+                                for j in range(100)]}),
+        ('enroll, 100', 'enroll_class_room', 'post', room + '/enroll',
+         lambda i: {'user_ids': user_ids[:100]}),
+        ('create class room', 'create_class_room', 'post', '/api/classrooms/',
+         lambda i: {'course_id': course.pk}),
+        ('kick off, 5 rooms of 20', 'kick_off_class_rooms', 'post',
+         '/api/courses/{}/kick_off'.format(course.pk),
+         lambda i: {'rosters': [user_ids[j * 20:(j + 1) * 20] for j in range(5)]}),
+        ('obtain token', 'api_token_auth', 'post', '/api/auth/',
+         lambda i: {'username': 'bench-admin', 'password': 'bench'}),
+    ]
+
+
+def run(client, method, path, body, requests):
+    from django.db import connection
+
+    query_count = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal query_count
+        query_count += 1
+        return execute(sql, params, many, context)
+
+    def call(i):
+        if body is None:
+            response = getattr(client, method)(path)
+        else:
+            response = getattr(client, method)(path, json.dumps(body(i)), content_type='application/json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    response = call(0)  # warm up
+    assert response.status_code < 400, '{} {}: {}'.format(method.upper(), path, response.status_code)
+    timings, queries = [], []
+    with connection.execute_wrapper(count_query):
+        for i in range(requests):
+            query_count = 0
+            started_at = time.perf_counter()
+            call(i + 1)
+            timings.append(time.perf_counter() - started_at)
+            queries.append(query_count)
+    return {
+        'requests': requests,
+        'requests_per_second': round(requests / sum(timings), 1),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': median(queries),
+    }
+
+
+def compare(results, previous):
+    before = {(result['events'], result['name']): result for result in previous['results']}
+    print('\ncompared with {} ({}):'.format(previous.get('revision'), previous.get('created_at')))
+    for result in results:
+        old = before.get((result['events'], result['name']))
+        if old is None:
+            continue
+        print('{:>8} events  {:<32} p50 x{:5.2f}  p99 x{:5.2f}  queries {:+}'.format(
+            result['events'], result['name'], result['p50_ms'] / old['p50_ms'],
+            result['p99_ms'] / old['p99_ms'], result['queries'] - old['queries']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, nargs='+', default=[10000])
+    parser.add_argument('--attendees', type=int, default=200)
+    parser.add_argument('--phases', type=int, default=20)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--rooms-per-course', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--only', nargs='+', metavar='URL_NAME',
+                        help='only benchmark these url names')
+    parser.add_argument('--read-cache', action='store_true',
+                        help='keep the read cache on (repeated reads are then all hits)')
+    parser.add_argument('--output', default='bench_api.json')
+    parser.add_argument('--compare', metavar='FILE', help='earlier --output to compare with')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from rest_framework.authtoken.models import Token
+
+    from api.urls import urlpatterns
+
+    setup_test_environment(debug=False)
+    if not args.read_cache:
+        settings.ACTIO_READ_CACHE = None
+
+    results = []
+    with test_database():
+        seed_courses(args.courses, args.phases, args.rooms_per_course)
+        admin = User.objects.create_superuser('bench-admin', password='bench')
+        client = Client(HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=admin).key))
+        for events in args.events:
+            class_room = seed_class_room(events=events, attendees=args.attendees, phases=args.phases)
+            users = list(class_room.attending.all())
+            for name, url_name, method, path, body in scenarios(class_room, users):
+                if args.only and url_name not in args.only:
+                    continue
+                result = run(client, method, path, body, args.requests)
+                results.append(dict(name=name, url_name=url_name, method=method.upper(),
+                                    events=events, **result))
+                print('{:>8} events  {:<32} {:8.1f} req/s  p50 {:8.2f}ms  p99 {:8.2f}ms  {:>4} queries'
+                      .format(events, name, result['requests_per_second'], result['p50_ms'],
+                              result['p99_ms'], result['queries']))
+
+    covered = {result['url_name'] for result in results}
+    missing = {pattern.name for pattern in urlpatterns} - covered
+    if missing and not args.only:
+        print('not benchmarked: {}'.format(', '.join(sorted(missing))))
+
+    with open(args.output, 'w') as output:
+        json.dump({
+            'revision': git_revision(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'parameters': vars(args),
+            'results': results,
+        }, output, indent=2)
+    print('results written to {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+
+
+if __name__ == '__main__':
+    main()
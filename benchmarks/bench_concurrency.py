@@ -0,0 +1,119 @@
+"""
+Join and leave throughput of many writer threads on one SQLite file.
+
+Each mode gets a fresh database file: SQLite's default rollback journal,
+the ACTIO_SQLITE_PRAGMAS profile (WAL) alone, then WAL with the write lane.
+Writers load a class room and join or leave it, like the API views do,
+while readers load rooms and their latest events. "locked" counts the
+writes and reads that failed with "database is locked".
+
+    python -m benchmarks.bench_concurrency --writers 32 --readers 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.common import percentile, seed_class_room, setup_django, test_database
+
+MODES = ('rollback journal', 'wal', 'wal + write lane')
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, operation, deadline):
+        super().__init__()
+        self.operation = operation
+        self.deadline = deadline
+        self.latencies = []
+        self.locked = 0
+
+    def run(self):
+        from django.db import OperationalError, connection
+
+        try:
+            while time.perf_counter() < self.deadline:
+                started_at = time.perf_counter()
+                try:
+                    self.operation()
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    self.locked += 1
+                else:
+                    self.latencies.append(time.perf_counter() - started_at)
+        finally:
+            connection.close()
+
+
+def run(mode, rooms, writers, readers, seconds):
+    from django.conf import settings
+    from django.contrib.auth.models import User
+
+    from api.models import ClassRoom
+
+    class_room_ids = [seed_class_room(events=100, attendees=10).pk for _ in range(rooms)]
+    users = list(User.objects.filter(username__startswith='bench-'))
+
+    def write():
+        class_room = ClassRoom.objects.get(pk=random.choice(class_room_ids))
+        user = random.choice(users)
+        if class_room.attending.filter(pk=user.pk).exists():
+            class_room.leave(user)
+        else:
+            class_room.join(user)
+
+    def read():
+        class_room = ClassRoom.objects.select_related('current_phase').get(pk=random.choice(class_room_ids))
+        list(class_room.events.order_by('-created_at')[:50])
+
+    settings.ACTIO_WRITE_LANE = mode == 'wal + write lane'
+    deadline = time.perf_counter() + seconds
+    workers = ([Worker(write, deadline) for _ in range(writers)]
+               + [Worker(read, deadline) for _ in range(readers)])
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    for label, group in (('writes', workers[:writers]), ('reads', workers[writers:])):
+        latencies = [latency for worker in group for latency in worker.latencies]
+        locked = sum(worker.locked for worker in group)
+        if not latencies:
+            print('{:<17} {:<6}  none completed, {} locked'.format(mode, label, locked))
+            continue
+        print('{:<17} {:<6} {:>8.0f}/s  p50 {:>7.2f}ms  p99 {:>8.2f}ms  mean {:>7.2f}ms  locked {}'.format(
+            mode, label, len(latencies) / seconds, percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000, statistics.mean(latencies) * 1000, locked))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=32, help='writer threads')
+    parser.add_argument('--readers', type=int, default=8, help='reader threads')
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=5, help='duration of each mode')
+    parser.add_argument('--timeout', type=float, default=5, help='SQLite busy timeout, in seconds')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    pragmas = settings.ACTIO_SQLITE_PRAGMAS
+    connection.settings_dict['OPTIONS']['timeout'] = args.timeout
+    with tempfile.TemporaryDirectory() as directory:
+        for number, mode in enumerate(args.modes):
+            # In-memory test databases are private to each connection: use a file.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, '{}.sqlite3'.format(number))
+            settings.ACTIO_SQLITE_PRAGMAS = {} if mode == 'rollback journal' else pragmas
+            with test_database():
+                run(mode, args.rooms, args.writers, args.readers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Fan-out latency of the in-process event broker.
+
+Every subscriber of a room sits on one event loop, like connections served
+by one ASGI worker, while a publisher thread plays the role of the request
+threads writing events. Latency is measured from publish to receipt.
+
+    python -m benchmarks.bench_pubsub --subscribers 500 --messages 200
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from api.pubsub import InProcessBroker
+from benchmarks.common import percentile
+
+
+async def run(subscribers, messages, rooms, interval):
+    broker = InProcessBroker(max_queue_size=messages)
+    subscriptions = [broker.subscribe(room) for room in range(rooms) for _ in range(subscribers)]
+    latencies = []
+
+    async def consume(subscription):
+        for _ in range(messages):
+            sent_at = await subscription.get()
+            latencies.append(time.perf_counter() - sent_at)
+
+    def publish():
+        for _ in range(messages):
+            for room in range(rooms):
+                broker.publish(room, time.perf_counter())
+            time.sleep(interval)
+
+    consumers = asyncio.gather(*(consume(subscription) for subscription in subscriptions))
+    started_at = time.perf_counter()
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    await consumers
+    elapsed = time.perf_counter() - started_at
+    publisher.join()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=500, help='subscribers per room')
+    parser.add_argument('--rooms', type=int, default=1)
+    parser.add_argument('--messages', type=int, default=200, help='events published per room')
+    parser.add_argument('--interval', type=float, default=0.005,
+                        help='seconds between two publications')
+    args = parser.parse_args()
+
+    latencies, elapsed = asyncio.run(run(args.subscribers, args.messages, args.rooms, args.interval))
+    print('{} rooms x {} subscribers, {} events each: {} deliveries in {:.2f}s'.format(
+        args.rooms, args.subscribers, args.messages, len(latencies), elapsed))
+    print('fan-out latency  p50 {:.2f}ms  p99 {:.2f}ms  max {:.2f}ms  mean {:.2f}ms'.format(
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+        max(latencies) * 1000, statistics.mean(latencies) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Render time and bytes on the wire of the class room and course list payloads.
+
+    python -m benchmarks.bench_render --events 10000
+"""
+import argparse
+
+from benchmarks.common import measure, median, seed_class_room, setup_django, test_database
+
+
+def report(name, data, repeat):
+    from django.utils.text import compress_string
+    from rest_framework.renderers import JSONRenderer
+
+    from api import middleware
+    from api.renderers import FastJSONRenderer
+
+    standard = median(measure(lambda: JSONRenderer().render(data), repeat))
+    fast = median(measure(lambda: FastJSONRenderer().render(data), repeat))
+    content = FastJSONRenderer().render(data)
+    sizes = ['raw {:,}B'.format(len(content)), 'gzip {:,}B'.format(len(compress_string(content)))]
+    if middleware.brotli is not None:
+        sizes.append('br {:,}B'.format(len(middleware.brotli.compress(content))))
+    print('{:<28} json {:7.1f}ms  fast json {:7.1f}ms  x{:.1f}  | {}'.format(
+        name, standard * 1000, fast * 1000, standard / fast, '  '.join(sizes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, nargs='+', default=[10000])
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--rooms-per-course', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from api import compact
+    from api.models import ClassRoom, Course
+
+    with test_database():
+        for events in args.events:
+            class_room = seed_class_room(events=events)
+            report('class room, {} events'.format(events),
+                   compact.serialize_class_room(class_room.pk), args.repeat)
+        Course.objects.bulk_create(Course(title='Course {}'.format(i)) for i in range(args.courses))
+        ClassRoom.objects.bulk_create(ClassRoom(course=course) for course in Course.objects.all()
+                                      for _ in range(args.rooms_per_course))
+        report('course list, {} courses'.format(Course.objects.count()),
+               compact.serialize_courses(Course.objects.order_by('title')), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
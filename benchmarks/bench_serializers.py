@@ -0,0 +1,49 @@
+"""
+Per-event cost of the class room payload, DRF serializers vs the compact engine.
+
+    python -m benchmarks.bench_serializers --events 100 1000 10000
+"""
+import argparse
+
+from benchmarks.common import measure, median, seed_class_room, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import Prefetch
+    from rest_framework.renderers import JSONRenderer
+
+    from api import compact
+    from api.models import ClassRoom, Event
+    from api.serializers import ClassRoomSerializer
+
+    with test_database():
+        for events in args.events:
+            class_room = seed_class_room(events=events)
+
+            def drf():
+                instance = ClassRoom.objects.select_related('course', 'current_phase').prefetch_related(
+                    'course__phases', 'attending',
+                    Prefetch('events', queryset=Event.objects.select_related('to_phase', 'user')),
+                ).get(pk=class_room.pk)
+                return ClassRoomSerializer(instance).data
+
+            def compact_engine():
+                return compact.serialize_class_room(class_room.pk)
+
+            assert JSONRenderer().render(drf()) == JSONRenderer().render(compact_engine())
+            drf_time = median(measure(drf, args.repeat))
+            compact_time = median(measure(compact_engine, args.repeat))
+            print('{:>8} events  drf {:8.1f}ms ({:6.2f}us/event)  compact {:8.1f}ms ({:6.2f}us/event)'
+                  '  x{:.1f}'.format(
+                      events, drf_time * 1000, drf_time / events * 1e6,
+                      compact_time * 1000, compact_time / events * 1e6, drf_time / compact_time))
+
+
+if __name__ == '__main__':
+    main()
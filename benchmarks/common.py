@@ -0,0 +1,87 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'actio.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Runs the benchmark against a throwaway database, never the real one.
+    """
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_class_room(events=1000, attendees=50, phases=5):
+    """
+    Creates one course and one class room with the requested number of
+    phases, attending users and events, writing in bulk.
+    """
+    from django.contrib.auth.models import User
+    from django.utils.timezone import now
+
+    from api.constants import EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE
+    from api.models import ClassRoom, Course, Event, Phase
+
+    phase_list = [Phase.objects.create(title='Phase {}'.format(i), timer=i % 2 == 1)
+                  for i in range(phases)]
+    course = Course.objects.create(title='Benchmark', default_phase=phase_list[0])
+    course.phases.add(*phase_list)
+    class_room = ClassRoom.objects.create(course=course)
+
+    first_user_id = User.objects.count()
+    User.objects.bulk_create([
+        User(username='bench-{}-{}'.format(first_user_id, i), email='bench{}@example.com'.format(i))
+        for i in range(attendees)])
+    users = list(User.objects.filter(username__startswith='bench-{}-'.format(first_user_id)))
+    class_room.attending.add(*users)
+
+    actions = (EVENT_ACTION_CHANGE_PHASE, EVENT_ACTION_JOIN, EVENT_ACTION_LEAVE)
+    # One event a second, all of it history by the time the benchmark runs.
+    started_at = now() - timedelta(seconds=events, hours=1)
+    batch = []
+    for i in range(events):
+        action = actions[i % 3]
+        batch.append(Event(
+            action=action, class_room=class_room, user=users[i % len(users)],
+            to_phase=phase_list[i % len(phase_list)] if action == EVENT_ACTION_CHANGE_PHASE else None,
+            created_at=started_at + timedelta(seconds=i), timer=i))
+        if len(batch) == 5000:
+            Event.objects.bulk_create(batch)
+            batch = []
+    Event.objects.bulk_create(batch)
+    return class_room.rebuild_snapshot()
+
+
+def measure(function, repeat=5):
+    """
+    Returns the timings of `repeat` calls to function, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started_at)
+    return timings
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def median(values):
+    return statistics.median(values)